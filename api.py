@@ -1,25 +1,50 @@
 import asyncio
+import json
+from typing import List, Literal, Optional, Union
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+from typing_extensions import Annotated
+
+from fastapi import FastAPI, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 import asyncpg
 
-from fruit_contracts.ContractsLite import ContractsLite
+from fruit_contracts.ContractsLite import AsyncContractsLite, make_rpc_session
+from fruit_contracts.registry import deployment
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import HTTPException
 from datetime import datetime
 from contextlib import asynccontextmanager
-from offchain import sync_loop_async
+from offchain import (
+    CURSOR_NAME, REORG_MAX_DEPTH, WRITE_BACK_LOCK_ID, add_change_listener, listen_for_changes, refresh_documents,
+    sync_loop_async, write_back_bucket,
+)
+from cache import ReadCache
+from stream import EventBroker, event_topics, format_reorg, format_sse, parse_event_id
+from schema import migrate
+import metrics
 from web3 import Web3
+from web3.exceptions import ContractLogicError
 import os
 
 api_pool = None
 DB_DSN = f"postgresql://{os.getenv('DB_USER', 'fruit_user')}:{os.getenv('DB_PASSWORD', 'fruit_pass')}@" \
          f"{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'fruit_chain')}"
+# Each API replica opens at most DB_POOL_MAX_SIZE connections (plus two for the indexer's lock and
+# change listener), so replicas × that must stay under Postgres' max_connections
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# "embedded": every replica runs the indexer and one is elected leader; "off": a separate
+# `python -m offchain run` worker indexes and replicas only follow its change announcements
+INDEXER_MODE = os.getenv("INDEXER_MODE", "embedded")
 
 async def init_api_pool():
     global api_pool
-    api_pool = await asyncpg.create_pool(dsn=DB_DSN)
+    api_pool = await asyncpg.create_pool(
+        dsn=DB_DSN, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE, init=metrics.sql_timer("api")
+    )
+    metrics.track_pool("api", api_pool)
     print("✅ Main thread DB connection pool initialized")
 
 @asynccontextmanager
@@ -32,8 +57,21 @@ async def api_conn():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_api_pool()                  # ✅ DB pool for main thread
-    asyncio.create_task(sync_loop_async())  # ✅ Background task (separately creates pool inside offchain module)
+    async with api_conn() as conn:
+        await migrate(conn)                # ✅ Upgrade existing databases in place before serving
+    rpc_session = make_rpc_session(RPC_POOL_SIZE, RPC_TIMEOUT)
+    init_contracts()                       # ✅ ABIs and addresses load here, not at import
+    await contracts.connect(rpc_session)   # ✅ One pooled keep-alive HTTP session for all RPC traffic
+    tasks = [asyncio.create_task(listen_for_changes(api_pool))]  # ✅ Follow changes indexed by other processes
+    if INDEXER_MODE == "embedded":
+        # ✅ Leader-elected indexer sharing this replica's pool and RPC session
+        tasks.append(asyncio.create_task(sync_loop_async(rpc_session, pool=api_pool)))
     yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await rpc_session.close()
+    await api_pool.close()
 
 app = FastAPI(
     title="Fruit Supply Chain API",
@@ -42,6 +80,7 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(metrics.RouteMetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # or restrict to ["http://localhost:5173"]
@@ -54,12 +93,25 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # ===== Initialize smart contract instance =====
-contracts = ContractsLite(
-    rpc_url=os.getenv("RPC_URL"),
-    permission_addr=os.getenv("PERMISSION_ADDR"),
-    trace_addr=os.getenv("TRACE_ADDR"),
-    chain_id=int(os.getenv("CHAIN_ID"))
-)
+RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "20"))
+RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "10"))
+RPC_HEDGE_AFTER = float(os.getenv("RPC_HEDGE_AFTER", "0"))  # 0: never race a second endpoint
+
+contracts: Optional[AsyncContractsLite] = None  # Built in lifespan, not at import
+
+
+def init_contracts():
+    global contracts
+    d = deployment()
+    contracts = AsyncContractsLite(
+        rpc_url=os.getenv("RPC_URL"),
+        permission_addr=d.permission_addr,
+        trace_addr=d.trace_addr,
+        chain_id=d.chain_id,
+        on_coalesced=metrics.record_coalesced,
+        hedge_after=RPC_HEDGE_AFTER
+    )
+    metrics.instrument_provider(contracts.web3.provider, "api")
 
 # ===================== Transaction Construction =====================
 class RegisterBatchRequest(BaseModel):
@@ -90,61 +142,385 @@ class RevokeRoleRequest(BaseModel):
     target_address: str
 
 @app.post("/tx/register_batch", summary="Build transaction to register batch", tags=["Transactions"])
-def register_batch_tx(req: RegisterBatchRequest):
-    return contracts.build_register_batch_tx(req.from_address, req.batch_id, req.metadata)
+async def register_batch_tx(req: RegisterBatchRequest):
+    return await contracts.build_register_batch_tx(req.from_address, req.batch_id, req.metadata)
 
 @app.post("/tx/record_stage", summary="Build transaction to record stage", tags=["Transactions"])
-def record_stage_tx(req: RecordStageRequest):
-    return contracts.build_record_stage_tx(req.from_address, req.batch_id, req.stage, req.location, req.timestamp)
+async def record_stage_tx(req: RecordStageRequest):
+    return await contracts.build_record_stage_tx(req.from_address, req.batch_id, req.stage, req.location, req.timestamp)
 
 @app.post("/tx/transfer_ownership", summary="Build transaction to transfer ownership", tags=["Transactions"])
-def transfer_ownership_tx(req: TransferOwnershipRequest):
-    return contracts.build_transfer_ownership_tx(req.from_address, req.batch_id, req.new_owner)
+async def transfer_ownership_tx(req: TransferOwnershipRequest):
+    return await contracts.build_transfer_ownership_tx(req.from_address, req.batch_id, req.new_owner)
 
 @app.post("/tx/grant_role", summary="Build transaction to grant role", tags=["Transactions"])
-def grant_role_tx(req: GrantRoleRequest):
-    return contracts.build_grant_role_tx(req.from_address, req.role, req.target_address)
+async def grant_role_tx(req: GrantRoleRequest):
+    return await contracts.build_grant_role_tx(req.from_address, req.role, req.target_address)
 
 @app.post("/tx/revoke_role", summary="Build transaction to revoke role", tags=["Transactions"])
-def revoke_role_tx(req: RevokeRoleRequest):
-    return contracts.build_revoke_role_tx(req.from_address, req.role, req.target_address)
+async def revoke_role_tx(req: RevokeRoleRequest):
+    return await contracts.build_revoke_role_tx(req.from_address, req.role, req.target_address)
+
+class BulkRegisterBatch(RegisterBatchRequest):
+    op: Literal["register_batch"]
+
+class BulkRecordStage(RecordStageRequest):
+    op: Literal["record_stage"]
+
+class BulkTransferOwnership(TransferOwnershipRequest):
+    op: Literal["transfer_ownership"]
+
+class BulkTxRequest(BaseModel):
+    operations: List[Annotated[
+        Union[BulkRegisterBatch, BulkRecordStage, BulkTransferOwnership],
+        Field(discriminator="op")
+    ]]
+
+MAX_BULK_TX_OPERATIONS = 5000
+BULK_TX_CONCURRENCY = int(os.getenv("BULK_TX_CONCURRENCY", "16"))
+
+
+@app.post("/tx/bulk", summary="Build many register/stage/transfer transactions at once", tags=["Transactions"])
+async def bulk_tx(req: BulkTxRequest):
+    if len(req.operations) > MAX_BULK_TX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_TX_OPERATIONS} operations per request")
+    ops = [dict(op) for op in req.operations]
+    return {"results": await contracts.build_bulk_txs(ops, concurrency=BULK_TX_CONCURRENCY)}
+
+# ===================== Read Cache =====================
+# Overview/owner/trace entries expire after READ_CACHE_TTL seconds and are dropped as soon as the
+# indexer applies an event for their batch; stages are append-only and cached until evicted
+read_cache = ReadCache(
+    maxsize=int(os.getenv("READ_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("READ_CACHE_TTL", "30")),
+)
+
+
+def invalidate_cached_batches(changes):
+    # A rollback can remove stages, which are otherwise cached without expiry
+    if changes.reorg:
+        read_cache.clear()
+        not_found.clear()
+        return
+    for batch_id in changes.touched_batches():
+        read_cache.invalidate_batch(batch_id)
+        not_found.invalidate_batch(batch_id)
+
+
+add_change_listener(invalidate_cached_batches)
+
+
+async def read_through(key, loader, ttl=-1, version=None):
+    """Cached result of loader(); `version` (the ETag source) must match the one it was cached under"""
+    found, value = read_cache.lookup(key, version)
+    if found:
+        return value
+    value = await loader()
+    read_cache.store(key, value, ttl, version)
+    return value
+
+# ===================== Chain Fallback Write-Back =====================
+# Batches and stages answered from the chain are written to Postgres by a background task, flagged
+# provisional until the indexer replaces them, so a good ID reaches RPC once. Reverted lookups (unknown
+# batch, stage out of range) are remembered for NEGATIVE_CACHE_TTL seconds, so a bad ID stops there.
+CHAIN_WRITE_BACK = os.getenv("CHAIN_WRITE_BACK", "true").lower() == "true"
+not_found = ReadCache(
+    maxsize=int(os.getenv("NEGATIVE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("NEGATIVE_CACHE_TTL", "10")),
+)
+write_backs = {}  # key → running task, so concurrent misses of one batch schedule a single write
+
+NOT_FOUND_DETAIL = "Batch not found on-chain or off-chain"
+
+
+async def chain_read(key, call, detail=NOT_FOUND_DETAIL):
+    """call() against the chain unless key (or its whole batch) is known missing; a revert records key"""
+    batch_key = ("missing", key[1])
+    if not_found.lookup(key)[0] or (key != batch_key and not_found.lookup(batch_key)[0]):
+        raise HTTPException(status_code=404, detail=detail)
+    try:
+        return await call()
+    except ContractLogicError:
+        not_found.store(key, True)
+        raise HTTPException(status_code=404, detail=detail)
+
+
+def write_back(key, store):
+    """Run store() off the request path, once per key at a time"""
+    if not CHAIN_WRITE_BACK or key in write_backs:
+        return
+    write_backs[key] = asyncio.create_task(run_write_back(key, store))
+
+
+async def run_write_back(key, store):
+    try:
+        await store()
+    except Exception as e:
+        print(f"[warn] Failed to write back {key[0]} {key[1:]}: {e}")
+    finally:
+        write_backs.pop(key, None)
+
+
+async def store_batch(batch_id, overview=None, stages=None):
+    """Insert a chain-read batch with all its stages (fetched here if not given) unless Postgres has it"""
+    if overview is None:
+        overview = await contracts.get_batch_overview(batch_id)
+    if stages is None:
+        stages = await contracts.get_stages(batch_id, overview["stageCount"])
+    async with api_conn() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "SELECT pg_advisory_xact_lock_shared($1, $2)", WRITE_BACK_LOCK_ID, write_back_bucket(batch_id)
+            )
+            created = await conn.fetchval("""
+                INSERT INTO batches (batch_id, metadata, current_owner, latest_stage, provisional)
+                VALUES ($1, $2, $3, $4, TRUE)
+                ON CONFLICT (batch_id) DO NOTHING
+                RETURNING TRUE
+            """, batch_id, overview["metadata"], overview["currentOwner"], stages[-1]["stage"] if stages else None)
+            if not created:
+                return  # indexed meanwhile, or written back by another process
+            await conn.executemany("""
+                INSERT INTO stages (batch_id, stage_index, stage, location, ts_block, actor, provisional)
+                VALUES ($1, $2, $3, $4, $5, $6, TRUE)
+            """, [
+                (batch_id, i, s["stage"], s["location"], datetime.utcfromtimestamp(s["timestamp"]), s["actor"])
+                for i, s in enumerate(stages)
+            ])
+            await refresh_documents(conn, [batch_id])
+
+
+async def store_stage(batch_id, index, stage):
+    """Append a chain-read stage when it is the next one of a stored batch; an unknown batch is stored whole"""
+    async with api_conn() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "SELECT pg_advisory_xact_lock_shared($1, $2)", WRITE_BACK_LOCK_ID, write_back_bucket(batch_id)
+            )
+            known = await conn.fetchval("SELECT TRUE FROM batches WHERE batch_id = $1", batch_id)
+            if known:
+                # A gap would misplace the indexer's stages; those are left for the indexer to fill
+                status = await conn.execute("""
+                    INSERT INTO stages (batch_id, stage_index, stage, location, ts_block, actor, provisional)
+                    SELECT $1, $2, $3, $4, $5, $6, TRUE
+                    WHERE $2 = (SELECT COALESCE(MAX(stage_index), -1) + 1 FROM stages WHERE batch_id = $1)
+                    ON CONFLICT (batch_id, stage_index) DO NOTHING
+                """, batch_id, index, stage["stage"], stage["location"],
+                    datetime.utcfromtimestamp(stage["timestamp"]), stage["actor"])
+                if status.endswith(" 1"):
+                    await conn.execute(
+                        "UPDATE batches SET latest_stage = $2 WHERE batch_id = $1", batch_id, stage["stage"]
+                    )
+                    await refresh_documents(conn, [batch_id])
+    if not known:
+        await store_batch(batch_id)
+
+
+# ===================== Conditional GET =====================
+# A read's version is the (block number, block hash) of the last indexed event behind it, checked with
+# one index lookup: a matching If-None-Match gets a 304 before the response is built
+READ_MAX_AGE = int(os.getenv("READ_MAX_AGE", "5"))
+MUTABLE_CACHE_CONTROL = f"public, max-age={READ_MAX_AGE}, must-revalidate"
+# Stages buried deeper than REORG_MAX_DEPTH can no longer be rolled back by the indexer
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def make_etag(block_number, block_hash):
+    # The hash keeps versions distinct when a reorg replaces a block at the same height
+    return f'"{block_number}-{block_hash[2:18]}"' if block_hash else f'"{block_number}"'
+
+
+def etag_matches(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {t.strip() for t in header.split(",")}
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+async def conditional_get(request: Request, version, build, cache_control=MUTABLE_CACHE_CONTROL):
+    """Answer 304 if `version` matches the client's ETag, otherwise the JSON body from `build()`.
+
+    The version is read before the body, and `build` only reuses a cached body stored under the same
+    version, so a concurrent index can only make the body newer than its ETag, which costs the client
+    one extra full response and never serves stale data."""
+    if version is None:
+        # Not indexed yet (answered from the chain): nothing to validate against
+        return JSONResponse(jsonable_encoder(await build()), headers={"Cache-Control": "no-cache"})
+    headers = {"ETag": make_etag(*version), "Cache-Control": cache_control}
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(jsonable_encoder(await build()), headers=headers)
+
+
+async def fetch_version(query, *args):
+    """(block_number, block_hash) row of a version query; None if missing or the DB is unavailable"""
+    try:
+        async with api_conn() as conn:
+            row = await conn.fetchrow(query, *args)
+    except Exception as e:
+        print(f"[warn] version lookup failed: {e}")
+        return None
+    if row is None or row["block_number"] is None:
+        return None
+    return row["block_number"], row["block_hash"]
+
+
+def batch_version(batch_id):
+    return fetch_version(
+        "SELECT block_number, block_hash FROM batch_documents WHERE batch_id = $1", batch_id
+    )
+
+
+async def account_version(account):
+    """Last indexed role event of `account`: the version of its role reads; (0, None) before any"""
+    try:
+        account = Web3.to_checksum_address(account)
+    except ValueError:
+        return None
+    return await fetch_version("""
+        SELECT COALESCE(l.block_number, 0) AS block_number, l.block_hash
+        FROM (SELECT 1) one
+        LEFT JOIN LATERAL (
+            SELECT block_number, block_hash
+            FROM logs
+            WHERE event_name IN ('RoleGranted', 'RoleRevoked') AND args->>'account' = $1
+            ORDER BY block_number DESC, log_index DESC
+            LIMIT 1
+        ) l ON TRUE
+    """, account)
+
+
+def listing_version(owner, farmer, stage, after):
+    """Last indexed event of a batch that is, or was, in a listing's filter past `after`; (0, None) before any.
+
+    Batches leave an owner listing by a transfer and a stage listing by their next stage, so those
+    count too; a rollback lowers the maximum, since it removes every event above the ancestor."""
+    conditions, params = ["d.block_number IS NOT NULL"], []
+    for clause, value in (
+        ("LOWER(b.current_owner) = LOWER(${})", owner),
+        ("LOWER(b.farmer) = LOWER(${})", farmer),
+        ("b.batch_id IN (SELECT batch_id FROM stages WHERE stage = ${})", stage),
+        ("b.batch_id > ${}", after),
+    ):
+        if value is not None:
+            params.append(value)
+            conditions.append(clause.format(len(params)))
+    transfers = ""
+    if owner is not None:
+        params.append(-1 if after is None else after)
+        transfers = f"""
+            UNION ALL
+            (SELECT block_number, block_hash
+             FROM logs
+             WHERE event_name = 'OwnershipTransferred' AND LOWER(args->>'from') = LOWER($1)
+               AND (args->>'batchId')::BIGINT > ${len(params)}
+             ORDER BY block_number DESC
+             LIMIT 1)
+        """
+    return fetch_version(f"""
+        SELECT block_number, block_hash
+        FROM (
+            (SELECT d.block_number, d.block_hash
+             FROM batches b
+             JOIN batch_documents d ON d.batch_id = b.batch_id
+             WHERE {' AND '.join(conditions)}
+             ORDER BY d.block_number DESC
+             LIMIT 1)
+            {transfers}
+            UNION ALL
+            SELECT 0, NULL
+        ) v
+        ORDER BY block_number DESC
+        LIMIT 1
+    """, *params)
+
+
+@app.get("/metrics", summary="Prometheus metrics", tags=["Stats"], include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/stats/rpc", summary="Per-endpoint RPC latency, error rate and load", tags=["Stats"])
+async def rpc_stats():
+    return {"endpoints": contracts.web3.provider.stats() if contracts else []}
+
+
+@app.get("/stats/cache", summary="Read cache hit/miss counters", tags=["Stats"])
+async def cache_stats():
+    return {**read_cache.stats(), "not_found": not_found.stats(), "pending_write_backs": len(write_backs)}
 
 # ===================== Query APIs =====================
 @app.get("/read/batch_overview/{batch_id}", summary="Get batch overview", tags=["Read"])
-async def get_batch_overview(batch_id: int):
+async def get_batch_overview(batch_id: int, request: Request):
+    version = await batch_version(batch_id)
+    return await conditional_get(
+        request, version,
+        lambda: read_through(("overview", batch_id), lambda: load_batch_overview(batch_id), version=version),
+    )
+
+
+async def load_batch_overview(batch_id: int):
     try:
         async with api_conn() as conn:
-            row = await conn.fetchrow(
-                """
-                SELECT batch_id, metadata, current_owner, created_at
-                FROM batches WHERE batch_id = $1
-                """,
+            overview = await conn.fetchval(
+                "SELECT document->'overview' FROM batch_documents WHERE batch_id = $1",
                 batch_id
             )
-        if row:
-            return {
-                "batch_id": row["batch_id"],
-                "metadata": row["metadata"],
-                "current_owner": row["current_owner"],
-                "created_at": row["created_at"].isoformat(),
-            }
+        if overview:
+            return json.loads(overview)
     except Exception as e:
         print(f"[warn] DB fallback for batch_overview: {e}")
+        metrics.READ_FALLBACKS.labels("batch_overview", "db_error").inc()
+    else:
+        metrics.READ_FALLBACKS.labels("batch_overview", "db_miss").inc()
 
-    return contracts.get_batch_overview(batch_id)
+    overview = await chain_read(("missing", batch_id), lambda: contracts.get_batch_overview(batch_id))
+    write_back(("batch", batch_id), lambda: store_batch(batch_id, overview))
+    return overview
 
 
 @app.get("/read/stage/{batch_id}/{index}", summary="Get batch stage detail", tags=["Read"])
-async def get_stage(batch_id: int, index: int):
+async def get_stage(batch_id: int, index: int, request: Request):
+    version, cache_control = None, MUTABLE_CACHE_CONTROL
+    try:
+        async with api_conn() as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT s.block_number, l.block_hash,
+                       (SELECT last_block FROM sync_state WHERE name = $3) AS cursor
+                FROM stages s
+                LEFT JOIN logs l ON l.block_number = s.block_number AND l.log_index = s.log_index
+                WHERE s.batch_id = $1 AND s.stage_index = $2
+                """,
+                batch_id, index, CURSOR_NAME,
+            )
+    except Exception as e:
+        print(f"[warn] version lookup failed: {e}")
+        row = None
+    if row is not None and row["block_number"] is not None:
+        version = row["block_number"], row["block_hash"]
+        if row["cursor"] is not None and row["cursor"] - row["block_number"] >= REORG_MAX_DEPTH:
+            cache_control = IMMUTABLE_CACHE_CONTROL
+
+    return await conditional_get(
+        request, version,
+        lambda: read_through(
+            ("stage", batch_id, index), lambda: load_stage(batch_id, index), ttl=None, version=version
+        ),
+        cache_control,
+    )
+
+
+async def load_stage(batch_id: int, index: int):
     try:
         async with api_conn() as conn:
             row = await conn.fetchrow(
                 """
                 SELECT stage, location, ts_block, actor
                 FROM stages
-                WHERE batch_id = $1
-                ORDER BY id
-                LIMIT 1 OFFSET $2
+                WHERE batch_id = $1 AND stage_index = $2
                 """,
                 batch_id,
                 index,
@@ -158,12 +534,80 @@ async def get_stage(batch_id: int, index: int):
             }
     except Exception as e:
         print(f"[warn] DB fallback for stage: {e}")
+        metrics.READ_FALLBACKS.labels("stage", "db_error").inc()
+    else:
+        metrics.READ_FALLBACKS.labels("stage", "db_miss").inc()
+
+    stage = await chain_read(
+        ("missing_stage", batch_id, index), lambda: contracts.get_stage(batch_id, index),
+        detail="Stage not found on-chain or off-chain",
+    )
+    write_back(("stage", batch_id, index), lambda: store_stage(batch_id, index, stage))
+    return stage
+
+
+@app.get("/read/batch/{batch_id}/trace", summary="Get batch overview with every stage", tags=["Read"])
+async def get_batch_trace(batch_id: int, request: Request):
+    version = await batch_version(batch_id)
+    return await conditional_get(
+        request, version,
+        lambda: read_through(("trace", batch_id), lambda: load_batch_trace(batch_id), version=version),
+    )
+
+
+async def load_batch_trace(batch_id: int):
+    try:
+        async with api_conn() as conn:
+            # Overview and stages pre-rendered by the indexer: one primary-key fetch, no joins
+            document = await conn.fetchval(
+                "SELECT document FROM batch_documents WHERE batch_id = $1",
+                batch_id
+            )
+        if document:
+            return json.loads(document)
+    except Exception as e:
+        print(f"[warn] DB fallback for batch trace: {e}")
+        metrics.READ_FALLBACKS.labels("batch_trace", "db_error").inc()
+    else:
+        metrics.READ_FALLBACKS.labels("batch_trace", "db_miss").inc()
 
-    return contracts.get_stage(batch_id, index)
+    try:
+        trace = await chain_read(("missing", batch_id), lambda: contracts.get_batch_trace(batch_id))
+    except Exception:
+        raise HTTPException(status_code=404, detail=NOT_FOUND_DETAIL)
+    write_back(("batch", batch_id), lambda: store_batch(batch_id, trace["overview"], trace["stages"]))
+    return trace_document(batch_id, trace)
+
+
+def trace_document(batch_id, trace):
+    """A chain trace in the shape of the indexer's batch document, so clients see one format"""
+    stages = [
+        {**stage, "timestamp": datetime.utcfromtimestamp(stage["timestamp"]).isoformat()}
+        for stage in trace["stages"]
+    ]
+    return {
+        "overview": {
+            "batch_id": batch_id,
+            "metadata": trace["overview"]["metadata"],
+            "current_owner": trace["overview"]["currentOwner"],
+            "created_at": None,  # not indexed yet
+        },
+        "farmer": None,  # only known from the BatchRegistered event
+        "latest_stage": stages[-1]["stage"] if stages else None,
+        "stages": stages,
+    }
 
 
 @app.get("/read/current_owner/{batch_id}", summary="Get current owner of batch", tags=["Read"])
-async def get_current_owner(batch_id: int):
+async def get_current_owner(batch_id: int, request: Request):
+    version = await batch_version(batch_id)
+    return await conditional_get(
+        request, version,
+        lambda: read_through(("owner", batch_id), lambda: load_current_owner(batch_id), version=version),
+    )
+
+
+async def load_current_owner(batch_id: int):
     try:
         async with api_conn() as conn:
             row = await conn.fetchrow(
@@ -174,69 +618,314 @@ async def get_current_owner(batch_id: int):
             return {"owner": row["current_owner"]}
     except Exception as e:
         print(f"[warn] DB fallback triggered: {e}")
+        metrics.READ_FALLBACKS.labels("current_owner", "db_error").inc()
+    else:
+        metrics.READ_FALLBACKS.labels("current_owner", "db_miss").inc()
 
+    # The overview costs the same eth_call as getCurrentOwner and carries what the write-back needs
     try:
-        return {"owner": contracts.get_current_owner(batch_id)}
+        overview = await chain_read(("missing", batch_id), lambda: contracts.get_batch_overview(batch_id))
     except Exception:
-        raise HTTPException(status_code=404, detail="Batch not found on-chain or off-chain")
+        raise HTTPException(status_code=404, detail=NOT_FOUND_DETAIL)
+    write_back(("batch", batch_id), lambda: store_batch(batch_id, overview))
+    return {"owner": overview["currentOwner"]}
 
 
 @app.get("/read/has_role/{role}/{account}", summary="Check if account has specific role", tags=["Read"])
-def has_role(role: str, account: str):
-    return {"has_role": contracts.has_role(role, account)}
+async def has_role(role: str, account: str, request: Request):
+    async def build():
+        return {"has_role": await contracts.has_role(role, account)}
 
+    # Answered by the chain; the account's version moves with every role change the indexer applies
+    return await conditional_get(request, await account_version(account), build)
 
-@app.get("/read/roles/{address}", summary="Get all roles for address", tags=["Read"])
-async def get_roles(address: str):
-    try:
-        address = Web3.to_checksum_address(address)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid address format")
 
-    known_roles = {
-        "FARMER": "FARMER_ROLE",
-        "INSPECTOR": "INSPECTOR_ROLE",
-        "RETAILER": "RETAILER_ROLE",
-        "CONSUMER": "CONSUMER_ROLE",
-        "DEFAULT_ADMIN": "DEFAULT_ADMIN",
-    }
+KNOWN_ROLES = {
+    "FARMER": "FARMER_ROLE",
+    "INSPECTOR": "INSPECTOR_ROLE",
+    "RETAILER": "RETAILER_ROLE",
+    "CONSUMER": "CONSUMER_ROLE",
+    "DEFAULT_ADMIN": "DEFAULT_ADMIN",
+}
+MAX_BULK_ROLE_ADDRESSES = 1000
+
+
+class RolesRequest(BaseModel):
+    addresses: List[str]
+
+
+async def resolve_roles(addresses):
+    """Roles per checksum address: one DB query, one batched chain lookup for the misses, one write-back"""
+    resolved = {}
 
     # Try fetching from DB first
     try:
         async with api_conn() as conn:
             rows = await conn.fetch(
-                "SELECT role_name FROM user_roles WHERE address = $1",
-                address,
+                "SELECT address, role_name FROM user_roles WHERE address = ANY($1::text[])",
+                addresses,
             )
-        if rows:
-            roles = {k: False for k in known_roles}
-            for r in rows:
-                for k, v in known_roles.items():
-                    if r["role_name"] == v:
-                        roles[k] = True
-            return roles
+        for r in rows:
+            roles = resolved.setdefault(r["address"], {k: False for k in KNOWN_ROLES})
+            for k, v in KNOWN_ROLES.items():
+                if r["role_name"] == v:
+                    roles[k] = True
     except Exception as e:
         print(f"[warn] database read failed: {e}")
+        db_failed = True
+    else:
+        db_failed = False
 
     # Otherwise, fallback to chain + write back to DB
-    roles = {}
-    for k, role_str in known_roles.items():
-        has = contracts.has_role(role_str, address)
-        roles[k] = has
-        if has:
-            try:
+    misses = [a for a in dict.fromkeys(addresses) if a not in resolved]
+    if not misses:
+        return resolved
+    metrics.READ_FALLBACKS.labels("roles", "db_error" if db_failed else "db_miss").inc(len(misses))
+
+    on_chain = await contracts.get_roles(misses, list(KNOWN_ROLES.values()))
+    granted = []
+    for address in misses:
+        resolved[address] = {k: on_chain[address][v] for k, v in KNOWN_ROLES.items()}
+        granted.extend((address, v) for v in KNOWN_ROLES.values() if on_chain[address][v])
+
+    if granted:
+        try:
+            async with api_conn() as conn:
+                await conn.execute(
+                    """
+                    INSERT INTO user_roles(address, role_name, granted_at)
+                    SELECT address, role_name, $3
+                    FROM unnest($1::text[], $2::text[]) AS r(address, role_name)
+                    ON CONFLICT (address, role_name) DO NOTHING
+                    """,
+                    [address for address, _ in granted],
+                    [role for _, role in granted],
+                    datetime.utcnow(),
+                )
+        except Exception as e:
+            print(f"[warn] Failed to write back {len(granted)} role(s): {e}")
+
+    return resolved
+
+
+@app.get("/read/roles/{address}", summary="Get all roles for address", tags=["Read"])
+async def get_roles(address: str, request: Request):
+    try:
+        address = Web3.to_checksum_address(address)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid address format")
+
+    async def build():
+        return (await resolve_roles([address]))[address]
+
+    return await conditional_get(request, await account_version(address), build)
+
+
+@app.post("/read/roles", summary="Get all roles for many addresses", tags=["Read"])
+async def get_roles_bulk(req: RolesRequest):
+    if len(req.addresses) > MAX_BULK_ROLE_ADDRESSES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ROLE_ADDRESSES} addresses per request")
+    try:
+        addresses = [Web3.to_checksum_address(a) for a in req.addresses]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid address format")
+
+    return await resolve_roles(addresses)
+
+
+# ===================== Listings =====================
+# Keyset pagination: a page starts after the last key of the previous one, so every page is an
+# index range scan of `limit` rows no matter how deep the client has paged (no OFFSET)
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 500
+
+
+@app.get("/read/batches", summary="List batches by owner, farmer or latest stage", tags=["Read"])
+async def list_batches(
+    request: Request,
+    owner: Optional[str] = None,
+    farmer: Optional[str] = None,
+    stage: Optional[int] = None,
+    after: Optional[int] = Query(None, description="Last batch_id of the previous page"),
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+):
+    return await conditional_get(
+        request, await listing_version(owner, farmer, stage, after),
+        lambda: load_batch_page(owner, farmer, stage, after, limit),
+    )
+
+
+async def load_batch_page(owner, farmer, stage, after, limit):
+    conditions, params = [], []
+    for clause, value in (
+        ("LOWER(current_owner) = LOWER(${})", owner),
+        ("LOWER(farmer) = LOWER(${})", farmer),
+        ("latest_stage = ${}", stage),
+        ("batch_id > ${}", after),
+    ):
+        if value is not None:
+            params.append(value)
+            conditions.append(clause.format(len(params)))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(limit)
+
+    async with api_conn() as conn:
+        rows = await conn.fetch(f"""
+            SELECT batch_id, metadata, current_owner, farmer, latest_stage, created_at
+            FROM batches
+            {where}
+            ORDER BY batch_id
+            LIMIT ${len(params)}
+        """, *params)
+
+    items = [
+        {
+            "batch_id": r["batch_id"],
+            "metadata": r["metadata"],
+            "current_owner": r["current_owner"],
+            "farmer": r["farmer"],
+            "latest_stage": r["latest_stage"],
+            "created_at": r["created_at"].isoformat(),
+        }
+        for r in rows
+    ]
+    return {"items": items, "next": items[-1]["batch_id"] if len(items) == limit else None}
+
+
+@app.get("/read/batches/{batch_id}/stages", summary="List a batch's stages", tags=["Read"])
+async def list_batch_stages(
+    batch_id: int,
+    request: Request,
+    after: Optional[int] = Query(None, description="Last index of the previous page"),
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+):
+    return await conditional_get(
+        request, await batch_version(batch_id), lambda: load_stage_page(batch_id, after, limit)
+    )
+
+
+async def load_stage_page(batch_id, after, limit):
+    async with api_conn() as conn:
+        rows = await conn.fetch("""
+            SELECT stage_index, stage, location, ts_block, actor
+            FROM stages
+            WHERE batch_id = $1 AND stage_index > $2
+            ORDER BY stage_index
+            LIMIT $3
+        """, batch_id, -1 if after is None else after, limit)
+
+    items = [
+        {
+            "index": r["stage_index"],
+            "stage": r["stage"],
+            "location": r["location"],
+            "timestamp": r["ts_block"].isoformat(),
+            "actor": r["actor"],
+        }
+        for r in rows
+    ]
+    return {"items": items, "next": items[-1]["index"] if len(items) == limit else None}
+
+
+# ===================== Event Streams =====================
+# Server-sent events pushed as the indexer applies them; clients resume from their last event id
+# (the Last-Event-ID header EventSource sends on reconnect, or ?since=block[:logIndex])
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "1000"))
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+STREAM_REPLAY_PAGE = 500
+
+event_broker = EventBroker(STREAM_QUEUE_SIZE)
+
+
+def publish_stream_events(changes):
+    if changes.reorg:
+        event_broker.broadcast(("reorg", (changes.ancestor + 1, -1), format_reorg(changes.ancestor)))
+        return
+    if not event_broker.stats()["subscribers"]:
+        return
+    for tx_hash, event_name, block_number, _, log_index, args_json in changes.logs:
+        topics = event_topics(event_name, json.loads(args_json))
+        if topics:
+            frame = format_sse(event_name, block_number, log_index, tx_hash, args_json)
+            event_broker.publish(topics, ("event", (block_number, log_index), frame))
+
+
+add_change_listener(publish_stream_events)
+
+BATCH_REPLAY_SQL = """
+    SELECT tx_hash, event_name, block_number, log_index, args::TEXT AS args
+    FROM logs
+    WHERE (args->>'batchId')::BIGINT = $1 AND (block_number, log_index) > ($2, $3)
+    ORDER BY block_number, log_index
+    LIMIT $4
+"""
+
+OWNER_REPLAY_SQL = """
+    SELECT tx_hash, event_name, block_number, log_index, args::TEXT AS args
+    FROM logs
+    WHERE ((event_name = 'BatchRegistered' AND LOWER(args->>'farmer') = $1)
+        OR (event_name = 'OwnershipTransferred' AND (LOWER(args->>'from') = $1 OR LOWER(args->>'to') = $1)))
+      AND (block_number, log_index) > ($2, $3)
+    ORDER BY block_number, log_index
+    LIMIT $4
+"""
+
+
+def event_stream(request: Request, topic, since: Optional[str], replay_sql):
+    resume_from = request.headers.get("last-event-id") or since
+    try:
+        last = parse_event_id(resume_from) if resume_from else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid event id, expected block[:logIndex]")
+
+    async def frames():
+        nonlocal last
+        # Subscribe before replaying so events applied meanwhile are queued, then skipped if already replayed.
+        # Only once the response starts: a stream that is never iterated never reaches the finally below
+        queue = event_broker.subscribe(topic)
+        try:
+            while last is not None:
                 async with api_conn() as conn:
-                    await conn.execute(
-                        """
-                        INSERT INTO user_roles(address, role_name, granted_at)
-                        VALUES ($1, $2, $3)
-                        ON CONFLICT (address, role_name) DO NOTHING
-                        """,
-                        address,
-                        role_str,
-                        datetime.utcnow(),
-                    )
-            except Exception as e:
-                print(f"[warn] Failed to insert role {role_str} for {address}: {e}")
+                    rows = await conn.fetch(replay_sql, topic[1], last[0], last[1], STREAM_REPLAY_PAGE)
+                for r in rows:
+                    yield format_sse(r["event_name"], r["block_number"], r["log_index"], r["tx_hash"], r["args"])
+                    last = (r["block_number"], r["log_index"])
+                if len(rows) < STREAM_REPLAY_PAGE:
+                    break
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break  # fell too far behind; the client reconnects and replays from its last id
+                kind, position, frame = item
+                if kind == "reorg":
+                    last = position  # the new branch is re-sent from the block after the ancestor
+                elif last is not None and position <= last:
+                    continue
+                yield frame
+        finally:
+            event_broker.unsubscribe(topic, queue)
+
+    return StreamingResponse(frames(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/stream/batch/{batch_id}", summary="Stream events of a batch (SSE)", tags=["Stream"])
+async def stream_batch(batch_id: int, request: Request, since: Optional[str] = None):
+    return event_stream(request, ("batch", batch_id), since, BATCH_REPLAY_SQL)
+
+
+@app.get("/stream/owner/{address}", summary="Stream registrations and transfers involving an owner (SSE)", tags=["Stream"])
+async def stream_owner(address: str, request: Request, since: Optional[str] = None):
+    if not Web3.is_address(address):
+        raise HTTPException(status_code=400, detail="Invalid address format")
+    return event_stream(request, ("owner", address.lower()), since, OWNER_REPLAY_SQL)
+
 
-    return roles
+@app.get("/stats/stream", summary="Event stream subscriber counters", tags=["Stats"])
+async def stream_stats():
+    return event_broker.stats()
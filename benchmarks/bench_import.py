@@ -0,0 +1,76 @@
+"""
+Cold-start benchmark: seconds to import api / offchain in a fresh interpreter, and to first use.
+
+    python benchmarks/bench_import.py --runs 7
+
+Each sample is a new Python process. It first imports the third-party libraries (web3, fastapi,
+asyncpg, ...) and then times the statement on its own, so "own" is the cost of our modules and
+"total" the cold start including the libraries. No RPC or database access: the environment points
+at placeholder endpoints.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+ENV = {
+    "RPC_URL": "http://127.0.0.1:1",
+    "PERMISSION_ADDR": "0x" + "11" * 20,
+    "TRACE_ADDR": "0x" + "22" * 20,
+    "CHAIN_ID": "31337",
+}
+
+DEPS = "import web3, fastapi, asyncpg, aiohttp, pydantic, dotenv, prometheus_client"
+
+# Statements timed in the child after DEPS
+TARGETS = {
+    "offchain": "import offchain",
+    "api": "import api",
+    "offchain+first_use": "import offchain; offchain.collect_changes([])",
+}
+
+
+def sample(statement):
+    """(seconds importing DEPS, seconds running statement) in a fresh interpreter"""
+    code = (f"import time; t0 = time.perf_counter(); {DEPS}; t1 = time.perf_counter(); {statement}; "
+            f"print(t1 - t0, time.perf_counter() - t1)")
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env={**os.environ, **ENV},
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, universal_newlines=True,
+    ).stdout
+    deps, own = out.strip().splitlines()[-1].split()
+    return float(deps), float(own)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    sample("pass")  # Warm the OS file cache so the first target is not penalised
+    results = {}
+    for name, statement in TARGETS.items():
+        samples = [sample(statement) for _ in range(args.runs)]
+        own = [o for _, o in samples]
+        total = [d + o for d, o in samples]
+        results[name] = {
+            "own_median_ms": round(statistics.median(own) * 1000, 1),
+            "own_min_ms": round(min(own) * 1000, 1),
+            "total_median_ms": round(statistics.median(total) * 1000, 1),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, r in results.items():
+        print(f"{name:20} own median {r['own_median_ms']:>7.1f} ms  min {r['own_min_ms']:>7.1f} ms"
+              f"  | total median {r['total_median_ms']:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Load test: latency of DB-served read endpoints while the RPC node is artificially slow.
+
+    python benchmarks/load_slow_rpc.py --rpc-delay 2 --concurrency 50 --duration 20
+
+Starts a stand-in JSON-RPC server that answers every eth_call after --rpc-delay seconds,
+runs api.app under uvicorn against it, seeds --batches batches and their documents into a
+scratch --db-name database on the Postgres server configured through DB_* (created from
+init.sql + migrations and dropped afterwards, like benchmarks/suite.py), then mixes DB hits
+with DB misses that fall back to the slow chain. With chain I/O awaited on the event loop, the p99 of the
+DB-served requests stays in the milliseconds regardless of --rpc-delay.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aiohttp import ClientSession, web
+from eth_abi import encode
+
+from benchmarks import suite
+
+RPC_PORT = 8547
+API_PORT = 8001
+OWNER = "0x" + "11" * 20
+
+
+# ---------- Stand-in RPC ----------
+def make_rpc_app(delay):
+    overview = "0x" + encode(["string", "address", "uint256"], ["slow-chain", OWNER, 0]).hex()
+
+    async def answer(req):
+        method = req["method"]
+        if method == "eth_call":
+            await asyncio.sleep(delay)
+            result = overview
+        elif method == "eth_chainId":
+            result = hex(int(os.environ.get("CHAIN_ID", "11155111")))
+        elif method == "eth_blockNumber":
+            result = "0x0"
+        elif method == "eth_getBlockByNumber":  # the embedded indexer's head, always genesis
+            result = {"number": "0x0", "hash": "0x" + "00" * 32, "parentHash": "0x" + "00" * 32,
+                      "timestamp": "0x0", "transactions": []}
+        elif method == "eth_getLogs":
+            result = []
+        else:
+            return {"jsonrpc": "2.0", "id": req["id"], "error": {"code": -32601, "message": method}}
+        return {"jsonrpc": "2.0", "id": req["id"], "result": result}
+
+    async def handle(request):
+        body = await request.json()
+        if isinstance(body, list):
+            return web.json_response(list(await asyncio.gather(*(answer(r) for r in body))))
+        return web.json_response(await answer(body))
+
+    app = web.Application()
+    app.router.add_post("/", handle)
+    return app
+
+
+# ---------- Load ----------
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 0.50),
+        "p95_ms": percentile(samples, 0.95),
+        "p99_ms": percentile(samples, 0.99),
+    }
+
+
+async def worker(session, opts, deadline, hits, misses):
+    base = f"http://127.0.0.1:{API_PORT}/read/batch_overview/"
+    while time.perf_counter() < deadline:
+        miss = random.random() < opts.miss_ratio
+        batch_id = opts.batches + 1 + random.randrange(1000000) if miss else random.randint(1, opts.batches)
+        start = time.perf_counter()
+        async with session.get(base + str(batch_id)) as resp:
+            await resp.read()
+        (misses if miss else hits).append(time.perf_counter() - start)
+
+
+async def seed(name, n):
+    """Batches 1..n and their documents (the rows /read/batch_overview serves) in the scratch database"""
+    import asyncpg
+    from offchain import refresh_documents
+    from schema import migrate
+
+    conn = await asyncpg.connect(suite.db_dsn(name))
+    try:
+        await migrate(conn)
+        async with conn.transaction():
+            await conn.executemany("""
+                INSERT INTO batches (batch_id, metadata, current_owner, farmer)
+                VALUES ($1, $2, $3, $3)
+            """, [(i, "load-test", OWNER) for i in range(1, n + 1)])
+            await refresh_documents(conn, range(1, n + 1))
+    finally:
+        await conn.close()
+
+
+async def main(opts):
+    rpc_runner = web.AppRunner(make_rpc_app(opts.rpc_delay))
+    await rpc_runner.setup()
+    await web.TCPSite(rpc_runner, "127.0.0.1", RPC_PORT).start()
+    await suite.create_scratch_db(opts.db_name)
+    os.environ["DB_NAME"] = opts.db_name  # api reads its DSN at import time
+
+    try:
+        import uvicorn
+        import api
+
+        await seed(opts.db_name, opts.batches)
+        server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=API_PORT, log_level="warning"))
+        serve_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        hits, misses = [], []
+        deadline = time.perf_counter() + opts.duration
+        async with ClientSession() as session:
+            await asyncio.gather(*(worker(session, opts, deadline, hits, misses) for _ in range(opts.concurrency)))
+
+        server.should_exit = True
+        await serve_task
+    finally:
+        await rpc_runner.cleanup()
+        if not opts.keep_db:
+            try:
+                await suite.drop_scratch_db(opts.db_name)
+            except Exception as e:
+                print(f"⚠️ Could not drop {opts.db_name}: {e}")
+
+    print(json.dumps({
+        "rpc_delay_s": opts.rpc_delay,
+        "concurrency": opts.concurrency,
+        "db_served": summarize(hits),
+        "chain_fallback": summarize(misses),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rpc-delay", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--batches", type=int, default=1000)
+    parser.add_argument("--miss-ratio", type=float, default=0.2)
+    parser.add_argument("--db-name", default="fruit_load_slow_rpc", help="scratch database, dropped afterwards")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the scratch database")
+    opts = parser.parse_args()
+
+    os.environ["RPC_URL"] = f"http://127.0.0.1:{RPC_PORT}/"
+    asyncio.run(main(opts))
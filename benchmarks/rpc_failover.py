@@ -0,0 +1,146 @@
+"""
+Failover and hedging check: PooledHTTPProvider against stand-in JSON-RPC nodes that inject delays and failures.
+
+    python benchmarks/rpc_failover.py --requests 2000 --concurrency 20 --hedge-after 0.05
+
+Each scenario starts two or three local nodes answering eth_blockNumber with a configurable base delay,
+a slow tail (probability and delay) and an HTTP 503 rate, or a port nobody listens on. It sends
+--requests reads through a single-URL provider on the first node and through the pooled provider
+over all of them (with and without hedging), then reports caller-visible errors, latency
+percentiles and where the pool sent its traffic.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fruit_contracts.rpcpool import PooledHTTPProvider  # noqa: E402
+
+BASE_PORT = 8590
+
+# name → node settings; delay/tail_delay in seconds, port=None for a node that refuses connections
+SCENARIOS = {
+    "slow_node": [dict(delay=0.2), dict(delay=0.005)],
+    "flaky_node": [dict(delay=0.005, fail=0.3), dict(delay=0.005)],
+    "dead_node": [dict(port=None), dict(delay=0.005)],
+    "tail_latency": [dict(delay=0.005, tail=0.05, tail_delay=0.3), dict(delay=0.005, tail=0.05, tail_delay=0.3)],
+}
+
+
+# ---------- Stand-in RPC ----------
+def make_node_app(delay=0.0, tail=0.0, tail_delay=0.0, fail=0.0):
+    counts = {"requests": 0, "failed": 0}
+
+    async def handle(request):
+        body = await request.json()
+        counts["requests"] += 1
+        if random.random() < fail:
+            counts["failed"] += 1
+            return web.Response(status=503, text="unavailable")
+        await asyncio.sleep(tail_delay if random.random() < tail else delay)
+        return web.json_response({"jsonrpc": "2.0", "id": body["id"], "result": "0x10"})
+
+    app = web.Application()
+    app.router.add_post("/", handle)
+    return app, counts
+
+
+async def start_nodes(settings):
+    """(runners, urls, per-node counters) for one scenario"""
+    runners, urls, counts = [], [], []
+    for i, node in enumerate(settings):
+        node = dict(node)
+        port = BASE_PORT + i
+        if node.pop("port", port) is None:
+            urls.append(f"http://127.0.0.1:{BASE_PORT + 9}/")  # nothing listens there
+            counts.append(None)
+            continue
+        app, node_counts = make_node_app(**node)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        runners.append(runner)
+        urls.append(f"http://127.0.0.1:{port}/")
+        counts.append(node_counts)
+    return runners, urls, counts
+
+
+# ---------- Load ----------
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+
+async def drive(provider, requests, concurrency):
+    samples, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await provider.make_request("eth_blockNumber", [])
+                if "error" in response:
+                    errors += 1
+            except Exception:
+                errors += 1
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await provider.disconnect()
+    return {
+        "errors": errors,
+        "p50_ms": percentile(samples, 0.50),
+        "p99_ms": percentile(samples, 0.99),
+        "max_ms": percentile(samples, 1.0),
+    }
+
+
+async def run_scenario(settings, opts):
+    runners, urls, _ = await start_nodes(settings)
+    try:
+        results = {"single": await drive(PooledHTTPProvider(urls[0]), opts.requests, opts.concurrency)}
+        pooled = PooledHTTPProvider(urls)
+        results["pooled"] = await drive(pooled, opts.requests, opts.concurrency)
+        results["pooled"]["share"] = [e.requests for e in pooled.endpoints]
+        hedged = PooledHTTPProvider(urls, hedge_after=opts.hedge_after)
+        results["hedged"] = await drive(hedged, opts.requests, opts.concurrency)
+        results["hedged"]["hedges"] = sum(e.hedges for e in hedged.endpoints)
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+    return results
+
+
+async def main(opts):
+    report = {}
+    for name in opts.scenarios or SCENARIOS:
+        report[name] = await run_scenario(SCENARIOS[name], opts)
+        if not opts.json:
+            print(name)
+            for mode, r in report[name].items():
+                extra = {k: v for k, v in r.items() if k not in ("errors", "p50_ms", "p99_ms", "max_ms")}
+                print(f"  {mode:7} errors {r['errors']:>5}  p50 {r['p50_ms']:>8} ms  p99 {r['p99_ms']:>8} ms"
+                      f"  max {r['max_ms']:>8} ms  {extra or ''}")
+    if opts.json:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--hedge-after", type=float, default=0.05)
+    parser.add_argument("--scenarios", nargs="*", choices=sorted(SCENARIOS))
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    asyncio.run(main(parser.parse_args()))
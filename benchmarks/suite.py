@@ -0,0 +1,483 @@
+"""
+Reproducible end-to-end benchmark: local chain + scratch Postgres + the real API and indexer.
+
+    python benchmarks/suite.py run --batches 100 --stages 3 --requests 300 --output results.json
+    python benchmarks/suite.py compare baseline.json results.json --threshold 0.15
+
+`run` deploys the contracts from fruit_contracts/abis to a local EVM, seeds --batches batches with
+--stages stages each (every other batch is transferred to a second account), creates a scratch
+database from init.sql + migrations, and measures:
+
+  * indexer: events/second of the live sync loop catching up from the deployment block
+  * every /read/* and /tx/* route: throughput and latency percentiles at --concurrency
+
+The chain is an in-process eth-tester EVM served over JSON-RPC by a child process (needs
+`pip install "eth-tester[py-evm]"`), or any node given with --rpc-url, e.g. a Hardhat node:
+
+    cd fruit-hardhat && npx hardhat node        # then: --rpc-url http://127.0.0.1:8545
+
+Postgres is the server configured through DB_* (e.g. `docker run -p 5432:5432 -e POSTGRES_USER=fruit_user
+-e POSTGRES_PASSWORD=fruit_pass -e POSTGRES_DB=fruit_chain postgres:16`); the suite creates and drops its
+own --db-name database there, so existing data is never touched.
+
+Results are JSON tagged with the git commit; `compare` prints per-metric changes between two runs
+and exits non-zero when throughput drops or p95 latency grows by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections.abc import Mapping
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import asyncpg
+from aiohttp import ClientSession, web
+from dotenv import load_dotenv
+from web3 import Web3
+
+load_dotenv(os.path.join(ROOT, ".env"))  # same DB_* resolution as api.py/offchain.py
+
+CHAIN_PORT = 8555
+API_PORT = 8002
+ABI_DIR = os.path.join(ROOT, "fruit_contracts", "abis")
+SEED = 6452
+
+
+# ---------- Local Chain (eth-tester over JSON-RPC) ----------
+def _to_rpc(value):
+    """Web3-formatted result → JSON-RPC wire format (quantities as hex, bytes as 0x-hex)"""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray)):
+        return Web3.to_hex(value)
+    if isinstance(value, Mapping):
+        return {k: _to_rpc(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_rpc(v) for v in value]
+    return value
+
+
+def serve_chain(port):
+    from web3 import EthereumTesterProvider
+
+    tester = Web3(EthereumTesterProvider())
+
+    def answer(req):
+        try:
+            result = tester.manager.request_blocking(req["method"], req.get("params", []))
+            return {"jsonrpc": "2.0", "id": req["id"], "result": _to_rpc(result)}
+        except Exception as e:
+            data = getattr(e, "data", None)
+            error = {"code": 3 if data else -32000, "message": f"execution reverted: {e}"}
+            if isinstance(data, str):
+                error["data"] = data
+            return {"jsonrpc": "2.0", "id": req["id"], "error": error}
+
+    async def rpc(request):
+        body = await request.json()
+        if isinstance(body, list):
+            return web.json_response([answer(r) for r in body])
+        return web.json_response(answer(body))
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/", rpc)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
+
+
+def start_chain(port):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve-chain", "--port", str(port)])
+    rpc_url = f"http://127.0.0.1:{port}"
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    for _ in range(100):
+        try:
+            w3.eth.chain_id
+            return proc, rpc_url
+        except Exception:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("eth-tester chain did not start")
+
+
+# ---------- Contracts & Seed Data ----------
+def load_artifact(name):
+    with open(os.path.join(ABI_DIR, f"{name}.json")) as f:
+        return json.load(f)
+
+
+def send_all(w3, txs):
+    """Send transactions back to back and wait for the last receipt"""
+    tx_hash = None
+    for tx in txs:
+        tx_hash = w3.eth.send_transaction(tx)
+    if tx_hash is not None:
+        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+        if receipt["status"] != 1:
+            raise RuntimeError("seed transaction reverted")
+
+
+def deploy_and_seed(rpc_url, batches, stages):
+    w3 = Web3(Web3.HTTPProvider(rpc_url, request_kwargs={"timeout": 120}))
+    admin, other = w3.eth.accounts[0], w3.eth.accounts[1]
+    perm_art, trace_art = load_artifact("PermissionControl"), load_artifact("FruitTraceability")
+
+    def deploy(artifact, *args):
+        factory = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+        receipt = w3.eth.wait_for_transaction_receipt(factory.constructor(*args).transact({"from": admin}))
+        return w3.eth.contract(address=receipt["contractAddress"], abi=artifact["abi"]), receipt["blockNumber"]
+
+    # PermissionControl needs a non-zero traceability address up front; it is repointed once deployed
+    perm, deploy_block = deploy(perm_art, other)
+    trace, _ = deploy(trace_art, perm.address)
+
+    nonce = w3.eth.get_transaction_count(admin)
+    txs = []
+
+    def tx(fn):
+        nonlocal nonce
+        txs.append(fn.build_transaction({"from": admin, "nonce": nonce, "gas": 500000}))
+        nonce += 1
+
+    tx(perm.functions.setTraceabilityContract(trace.address))
+    for role in ("FARMER_ROLE", "INSPECTOR_ROLE"):
+        tx(perm.functions.grantRole(Web3.keccak(text=role), admin))
+    for batch_id in range(1, batches + 1):
+        tx(perm.functions.registerBatch(batch_id, json.dumps({"fruit": "apple", "lot": batch_id})))
+        for stage in range(stages):
+            tx(perm.functions.recordStage(batch_id, stage % 4, f"Warehouse {stage}", 1700000000 + stage))
+        if batch_id % 2 == 0:
+            tx(perm.functions.requestOwnershipTransfer(batch_id, other))
+
+    started = time.perf_counter()
+    send_all(w3, txs)
+    return {
+        "perm": perm.address,
+        "trace": trace.address,
+        "chain_id": w3.eth.chain_id,
+        "deploy_block": deploy_block,
+        "admin": admin,
+        "other": other,
+        "seed_txs": len(txs),
+        "seed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# ---------- Scratch Database ----------
+ADMIN_DB = os.getenv("DB_NAME", "fruit_chain")  # captured before the suite points DB_NAME at its scratch db
+
+
+def db_dsn(name):
+    return (f"postgresql://{os.getenv('DB_USER', 'fruit_user')}:{os.getenv('DB_PASSWORD', 'fruit_pass')}@"
+            f"{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{name}")
+
+
+async def create_scratch_db(name):
+    admin = await asyncpg.connect(db_dsn(ADMIN_DB))
+    try:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        await admin.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await admin.close()
+
+    conn = await asyncpg.connect(db_dsn(name))
+    try:
+        with open(os.path.join(ROOT, "init.sql")) as f:
+            await conn.execute(f.read())
+    finally:
+        await conn.close()
+
+
+async def drop_scratch_db(name):
+    admin = await asyncpg.connect(db_dsn(ADMIN_DB))
+    try:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+    finally:
+        await admin.close()
+
+
+# ---------- Measurements ----------
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 3) if latencies else None
+
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round((len(latencies) + errors) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+    }
+
+
+async def measure_indexer(offchain):
+    await offchain.init_offchain_pool()
+    async with offchain.offchain_conn() as conn:
+        await offchain.migrate(conn)
+
+    events = rounds = 0
+    started = time.perf_counter()
+    caught_up = False
+    while not caught_up:
+        caught_up, ingested = await offchain.sync_range_once()
+        events += ingested
+        rounds += 1
+    elapsed = time.perf_counter() - started
+    await offchain.offchain_pool.close()
+    return {"events": events, "rounds": rounds, "seconds": round(elapsed, 3),
+            "events_per_sec": round(events / elapsed, 1)}
+
+
+def route_workloads(chain, batches, stages, rng):
+    admin, other = chain["admin"], chain["other"]
+    fresh_ids = iter(range(batches + 1000, 10 ** 9))
+
+    def batch():
+        return rng.randint(1, batches)
+
+    def owned_batch():
+        return rng.randrange(1, batches + 1, 2)  # odd batches stay with the admin/farmer
+
+    def address():
+        return Web3.to_checksum_address("0x" + rng.getrandbits(160).to_bytes(20, "big").hex())
+
+    return {
+        "read_batch_overview": lambda: ("GET", f"/read/batch_overview/{batch()}", None),
+        "read_stage": lambda: ("GET", f"/read/stage/{batch()}/{rng.randrange(stages)}", None),
+        "read_batch_trace": lambda: ("GET", f"/read/batch/{batch()}/trace", None),
+        "read_current_owner": lambda: ("GET", f"/read/current_owner/{batch()}", None),
+        "read_has_role": lambda: ("GET", f"/read/has_role/FARMER_ROLE/{admin}", None),
+        "read_roles": lambda: ("GET", f"/read/roles/{rng.choice([admin, other])}", None),
+        "read_roles_bulk": lambda: ("POST", "/read/roles", {"addresses": [admin, other] + [address() for _ in range(8)]}),
+        "tx_register_batch": lambda: ("POST", "/tx/register_batch",
+                                      {"from_address": admin, "batch_id": next(fresh_ids), "metadata": "bench"}),
+        "tx_record_stage": lambda: ("POST", "/tx/record_stage",
+                                    {"from_address": admin, "batch_id": batch(), "stage": 1,
+                                     "location": "Bench", "timestamp": 1700000000}),
+        "tx_transfer_ownership": lambda: ("POST", "/tx/transfer_ownership",
+                                          {"from_address": admin, "batch_id": owned_batch(), "new_owner": other}),
+        "tx_grant_role": lambda: ("POST", "/tx/grant_role",
+                                  {"from_address": admin, "role": "RETAILER_ROLE", "target_address": address()}),
+        "tx_revoke_role": lambda: ("POST", "/tx/revoke_role",
+                                   {"from_address": admin, "role": "INSPECTOR_ROLE", "target_address": admin}),
+        "tx_bulk_20": lambda: ("POST", "/tx/bulk", {"operations": [
+            {"op": "register_batch", "from_address": admin, "batch_id": next(fresh_ids), "metadata": "bench"}
+            for _ in range(20)
+        ]}),
+    }
+
+
+async def measure_route(session, base, make_request, requests, concurrency, warmup=5):
+    async def one():
+        method, path, body = make_request()
+        started = time.perf_counter()
+        async with session.request(method, base + path, json=body) as resp:
+            await resp.read()
+            return resp.status, time.perf_counter() - started
+
+    for _ in range(warmup):
+        await one()
+
+    latencies, errors = [], 0
+    queue = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in queue:
+            try:
+                status, latency = await one()
+            except Exception:
+                errors += 1
+                continue
+            if status >= 400:
+                errors += 1
+            else:
+                latencies.append(latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             cwd=ROOT, text=True).strip())
+        return {"commit": commit, "dirty": dirty}
+    except Exception:
+        return {"commit": None, "dirty": None}
+
+
+async def run(args):
+    chain_proc = None
+    if args.rpc_url:
+        rpc_url = args.rpc_url
+    else:
+        chain_proc, rpc_url = start_chain(args.chain_port)
+
+    try:
+        print(f"⛓️  Deploying and seeding {args.batches} batches × {args.stages} stages on {rpc_url}")
+        chain = deploy_and_seed(rpc_url, args.batches, args.stages)
+        await create_scratch_db(args.db_name)
+
+        # api/offchain read their configuration at import time
+        os.environ.update({
+            "RPC_URL": rpc_url,
+            "PERMISSION_ADDR": chain["perm"],
+            "TRACE_ADDR": chain["trace"],
+            "CHAIN_ID": str(chain["chain_id"]),
+            "DB_NAME": args.db_name,
+            "START_BLOCK": str(chain["deploy_block"]),
+            "READ_CACHE_SIZE": os.getenv("READ_CACHE_SIZE", "10000" if args.read_cache else "0"),
+        })
+        import offchain
+        import uvicorn
+
+        print("🧭 Measuring indexer catch-up")
+        indexer = await measure_indexer(offchain)
+        offchain.offchain_pool = None
+
+        import api
+        server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=args.api_port, log_level="warning"))
+        serving = asyncio.ensure_future(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        rng = random.Random(SEED)
+        routes = {}
+        base = f"http://127.0.0.1:{args.api_port}"
+        async with ClientSession() as session:
+            for name, make_request in route_workloads(chain, args.batches, args.stages, rng).items():
+                if args.routes and name not in args.routes:
+                    continue
+                # Bulk workloads do tens of chain calls per request; a tenth of the requests keeps runs short
+                requests = max(args.requests // 10, 10) if "bulk" in name else args.requests
+                routes[name] = await measure_route(session, base, make_request, requests, args.concurrency)
+                print(f"📈 {name:24} {routes[name]['rps']:>8} req/s  p95 {routes[name]['p95_ms']} ms"
+                      f"  errors {routes[name]['errors']}")
+
+        server.should_exit = True
+        await serving
+        # Stop the background sync loop and both pools before the scratch database is dropped
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()
+        await asyncio.sleep(0)
+        for pool in (api.api_pool, offchain.offchain_pool):
+            if pool is not None:
+                pool.terminate()
+    finally:
+        if chain_proc is not None:
+            chain_proc.terminate()
+            chain_proc.wait()
+        if not args.keep_db:
+            try:
+                await drop_scratch_db(args.db_name)
+            except Exception as e:
+                print(f"⚠️ Could not drop {args.db_name}: {e}")
+
+    return {
+        "meta": {
+            **git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "chain": args.rpc_url or "eth-tester",
+            "params": {"batches": args.batches, "stages": args.stages, "requests": args.requests,
+                       "concurrency": args.concurrency, "read_cache": args.read_cache},
+        },
+        "seed": {"transactions": chain["seed_txs"], "seconds": chain["seed_seconds"]},
+        "indexer": indexer,
+        "routes": routes,
+    }
+
+
+# ---------- Comparison ----------
+def compare(baseline, current, threshold):
+    """Print per-metric changes; returns the regressions beyond threshold"""
+    rows = [("indexer.events_per_sec", baseline["indexer"]["events_per_sec"],
+             current["indexer"]["events_per_sec"], True)]
+    for name, now in current["routes"].items():
+        before = baseline["routes"].get(name)
+        if before is None:
+            continue
+        rows.append((f"{name}.rps", before["rps"], now["rps"], True))
+        rows.append((f"{name}.p95_ms", before["p95_ms"], now["p95_ms"], False))
+
+    regressions = []
+    for metric, before, now, higher_is_better in rows:
+        if not before or now is None:
+            continue
+        change = (now - before) / before
+        worse = -change if higher_is_better else change
+        flag = "❌" if worse > threshold else "  "
+        if worse > threshold:
+            regressions.append(metric)
+        print(f"{flag} {metric:32} {before:>10} → {now:>10}  ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench = commands.add_parser("run", help="Run the benchmark and write JSON results")
+    bench.add_argument("--batches", type=int, default=100)
+    bench.add_argument("--stages", type=int, default=3, help="Stages per batch")
+    bench.add_argument("--requests", type=int, default=300, help="Requests per route")
+    bench.add_argument("--concurrency", type=int, default=20)
+    bench.add_argument("--routes", nargs="*", help="Only measure these workloads")
+    bench.add_argument("--read-cache", action="store_true", help="Keep the API read cache enabled")
+    bench.add_argument("--rpc-url", help="Use a running node (e.g. Hardhat) instead of eth-tester")
+    bench.add_argument("--chain-port", type=int, default=CHAIN_PORT)
+    bench.add_argument("--api-port", type=int, default=API_PORT)
+    bench.add_argument("--db-name", default="fruit_bench", help="Scratch database, dropped afterwards")
+    bench.add_argument("--keep-db", action="store_true")
+    bench.add_argument("--output", help="Write results here instead of stdout")
+
+    cmp = commands.add_parser("compare", help="Compare two result files")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.15, help="Allowed relative slowdown")
+
+    serve = commands.add_parser("serve-chain", help=argparse.SUPPRESS)
+    serve.add_argument("--port", type=int, default=CHAIN_PORT)
+
+    args = parser.parse_args()
+    if args.command == "serve-chain":
+        serve_chain(args.port)
+    elif args.command == "run":
+        results = asyncio.run(run(args))
+        text = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+            print(f"💾 Results written to {args.output}")
+        else:
+            print(text)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+        print("✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
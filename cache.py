@@ -0,0 +1,79 @@
+import time
+from collections import Counter, OrderedDict
+
+# ---------- Read Cache ----------
+class ReadCache:
+    """Bounded LRU of read-endpoint results; entries expire after ttl seconds unless stored with ttl=None.
+
+    An entry stored with a version is only returned to lookups of that same version."""
+
+    # Entry kinds derived from batch state ("missing", "missing_stage": negative lookups), keyed
+    # (kind, batch_id, ...); stages are append-only and never invalidated
+    BATCH_KINDS = ("overview", "owner", "trace", "missing", "missing_stage")
+
+    def __init__(self, maxsize=10000, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key → (expires_at or None, version, value)
+        self._batch_keys = {}          # batch_id → keys of its BATCH_KINDS entries
+        self.hits = Counter()          # per kind (key[0])
+        self.misses = Counter()
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, key, version=None):
+        """Return (found, value) and refresh the entry's LRU position on a hit"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, stored_version, value = entry
+            if stored_version == version and (expires_at is None or expires_at > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits[key[0]] += 1
+                return True, value
+            del self._entries[key]
+            self._forget(key)
+        self.misses[key[0]] += 1
+        return False, None
+
+    def store(self, key, value, ttl=-1, version=None):
+        """Cache value under key; ttl=-1 uses the default TTL, ttl=None never expires"""
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl == -1 else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        self._entries[key] = (expires_at, version, value)
+        self._entries.move_to_end(key)
+        if key[0] in self.BATCH_KINDS:
+            self._batch_keys.setdefault(key[1], set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._forget(self._entries.popitem(last=False)[0])
+            self.evictions += 1
+
+    def _forget(self, key):
+        keys = self._batch_keys.get(key[1]) if key[0] in self.BATCH_KINDS else None
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._batch_keys[key[1]]
+
+    def invalidate_batch(self, batch_id):
+        """Drop every entry derived from the batch's state, including its missing-stage lookups"""
+        for key in self._batch_keys.pop(batch_id, ()):
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._batch_keys.clear()
+
+    def stats(self):
+        kinds = sorted(set(self.hits) | set(self.misses))
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": {k: self.hits[k] for k in kinds},
+            "misses": {k: self.misses[k] for k in kinds},
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -122,6 +122,18 @@ function App () {
     }catch(e){setStatus('❌ '+(e.message||e));}
   };
 
+  /* ---- Live updates: refresh the queried batch when the indexer pushes one of its events ---- */
+  const liveBid = qRes?.batch_id;
+  useEffect(() => {
+    if (liveBid === undefined) return;
+    const es = new EventSource(`http://localhost:8000/stream/batch/${liveBid}`);
+    const refresh = () => fetch(`http://localhost:8000/read/batch_overview/${liveBid}`)
+      .then(r => r.json()).then(setQRes).catch(() => {});
+    ['BatchRegistered', 'StageRecorded', 'OwnershipTransferred', 'reorg']
+      .forEach(e => es.addEventListener(e, refresh));
+    return () => es.close();
+  }, [liveBid]);
+
   /* ---- UI ---- */
   return (
     <div style={{padding:20}}>
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
 import json
-from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from web3 import Web3
+import asyncio
+
+import aiohttp
+from web3 import AsyncWeb3, Web3
+
+from .registry import PERMISSION, TRACE, load_abi
+from .rpcpool import PooledHTTPProvider, make_rpc_session
+from .txutils import GasEstimateCache, NonceManager, SingleFlight
 
 import importlib.resources as pkg
 
@@ -14,11 +20,19 @@ def _load_json(package: str, name: str) -> Any:
         return json.load(f)
 
 
-def _load_abi(name: str) -> Dict[str, Any]:
-    abi_path = Path("fruit_contracts/abis") / f"{name}.json"  # Customizable path
-    with open(abi_path, "r", encoding="utf-8") as f:
-        raw = json.load(f)
-    return raw["abi"] if isinstance(raw, dict) and "abi" in raw else raw
+def _stage_dict(result) -> dict:
+    return {
+        "stage": int(result[0]),
+        "location": result[1],
+        "timestamp": int(result[2]),
+        "actor": result[3],
+    }
+
+
+def _role_hash(role: str) -> bytes:
+    if role == "DEFAULT_ADMIN":
+        return bytes(32)  # Equivalent to 0x000...000
+    return Web3.keccak(text=role)
 
 
 class ContractsLite:
@@ -35,11 +49,11 @@ class ContractsLite:
 
         self.permission = self.web3.eth.contract(
             address=self._addr(permission_addr),
-            abi=_load_abi("PermissionControl")
+            abi=load_abi(PERMISSION)
         )
         self.trace = self.web3.eth.contract(
             address=self._addr(trace_addr),
-            abi=_load_abi("FruitTraceability")
+            abi=load_abi(TRACE)
         )
 
     # ─────────── Utility Functions ───────────
@@ -119,12 +133,7 @@ class ContractsLite:
 
     def get_stage(self, batch_id: int, index: int):
         result = self.trace.functions.getStage(batch_id, index).call()
-        return {
-            "stage": int(result[0]),
-            "location": result[1],
-            "timestamp": int(result[2]),
-            "actor": result[3],
-        }
+        return _stage_dict(result)
 
     def get_current_owner(self, batch_id: int) -> str:
         return self.trace.functions.getCurrentOwner(batch_id).call()
@@ -137,3 +146,276 @@ class ContractsLite:
 
         print(f"[HAS_ROLE] Role: '{role}' → {role_hash.hex()} | Account: {account}")
         return self.permission.functions.hasRole(role_hash, account).call()
+
+
+class AsyncContractsLite:
+    """Awaitable counterpart of ContractsLite for use on the FastAPI event loop"""
+
+    def __init__(
+        self,
+        *,
+        rpc_url: str,
+        permission_addr: str,
+        trace_addr: str,
+        chain_id: int,
+        gas_cache_ttl: float = 30.0,
+        on_coalesced: Optional[Callable[[str], None]] = None,
+        hedge_after: Optional[float] = None
+    ):
+        # rpc_url may list several endpoints (comma-separated); see rpcpool.PooledHTTPProvider.
+        # eth_chainId never changes; let web3 cache it instead of re-asking before every estimate/build.
+        # No validation threshold: web3 would otherwise re-query eth_chainId to pick one on every store
+        self.web3 = AsyncWeb3(PooledHTTPProvider(
+            rpc_url,
+            hedge_after=hedge_after,
+            cache_allowed_requests=True,
+            cacheable_requests={"eth_chainId"},
+            request_cache_validation_threshold=None,
+        ))
+        self.chain_id = chain_id
+        self.nonces = NonceManager(self.web3)
+        self.gas_cache = GasEstimateCache(ttl=gas_cache_ttl)
+        # Concurrent identical reads (e.g. a popular batch missing from the DB) share one eth_call
+        self.flights = SingleFlight(on_coalesced)
+
+        self.permission = self.web3.eth.contract(
+            address=self._addr(permission_addr),
+            abi=load_abi(PERMISSION)
+        )
+        self.trace = self.web3.eth.contract(
+            address=self._addr(trace_addr),
+            abi=load_abi(TRACE)
+        )
+
+    async def connect(self, session: Optional[aiohttp.ClientSession] = None) -> aiohttp.ClientSession:
+        """Route all RPC traffic through a pooled session; pass one in to share it with other providers"""
+        session = session or make_rpc_session()
+        await self.web3.provider.cache_async_session(session)
+        return session
+
+    # ─────────── Utility Functions ───────────
+    def _addr(self, addr: str) -> str:
+        """Convert external address to checksum format"""
+        return Web3.to_checksum_address(addr)
+
+    def _build_common(self, from_addr: str, gas_estimate: int, nonce: int) -> dict:
+        """Build common transaction fields: provide only gas limit; let MetaMask/wallet decide gas price"""
+        gas_limit = int(gas_estimate * 1.2)  # 20% buffer
+        return {
+            "from": from_addr,
+            "nonce": nonce,
+            "chainId": self.chain_id,
+            "gas": gas_limit
+        }
+
+    async def _estimate_gas(self, fn, from_addr: str) -> int:
+        key = self.gas_cache.key(fn.fn_name, from_addr, fn.args)
+        gas = self.gas_cache.get(key)
+        if gas is None:
+            gas = await fn.estimate_gas({"from": from_addr})
+            self.gas_cache.put(key, gas)
+        return gas
+
+    async def _build(self, fn, from_addr: str) -> dict:
+        gas = await self._estimate_gas(fn, from_addr)
+        nonce = await self.nonces.reserve(from_addr)
+        try:
+            return await fn.build_transaction(self._build_common(from_addr, gas, nonce))
+        except Exception:
+            self.nonces.release(from_addr, nonce)
+            raise
+
+    # ─────────── Write Operations: Build Transactions ───────────
+    async def build_register_batch_tx(self, from_addr: str, batch_id: int, metadata: str):
+        from_addr = self._addr(from_addr)
+        return await self._build(self.permission.functions.registerBatch(batch_id, metadata), from_addr)
+
+    async def build_record_stage_tx(self, from_addr: str, batch_id: int, stage: int, location: str, timestamp: int):
+        from_addr = self._addr(from_addr)
+        return await self._build(
+            self.permission.functions.recordStage(batch_id, stage, location, timestamp), from_addr
+        )
+
+    async def build_transfer_ownership_tx(self, from_addr: str, batch_id: int, new_owner: str):
+        from_addr = self._addr(from_addr)
+        new_owner = self._addr(new_owner)
+        return await self._build(self.permission.functions.requestOwnershipTransfer(batch_id, new_owner), from_addr)
+
+    async def build_grant_role_tx(self, from_addr: str, role: str, account: str):
+        from_addr = self._addr(from_addr)
+        account = self._addr(account)
+        if role == "DEFAULT_ADMIN_ROLE":
+            role_hash = bytes(32)
+        else:
+            role_hash = Web3.keccak(text=role)
+        return await self._build(self.permission.functions.grantRole(role_hash, account), from_addr)
+
+    async def build_revoke_role_tx(self, from_addr: str, role: str, account: str):
+        from_addr = self._addr(from_addr)
+        account = self._addr(account)
+        role_hash = Web3.keccak(text=role)
+        return await self._build(self.permission.functions.revokeRole(role_hash, account), from_addr)
+
+    # ─────────── Bulk Transaction Building ───────────
+    # Gas limits (before the 20% buffer) for operations on a batch registered earlier in the same bulk
+    # request: the node cannot estimate them until that registration is mined. The base covers string
+    # arguments of one 32-byte word; every further word is stored in a new slot, so it adds
+    # DEPENDENT_GAS_PER_WORD. Anything above DEPENDENT_GAS_CEILING (a recordStage location over 992 bytes) is
+    # refused: build it after the registration is mined, when the node can estimate it
+    DEPENDENT_GAS = {"recordStage": 250_000, "requestOwnershipTransfer": 120_000}
+    DEPENDENT_GAS_PER_WORD = 25_000  # SSTORE of a new slot plus calldata and memory copy
+    DEPENDENT_GAS_CEILING = 1_000_000
+
+    def _dependent_gas(self, fn) -> int:
+        extra_words = sum(
+            max((len(arg.encode()) + 31) // 32 - 1, 0) for arg in fn.args if isinstance(arg, str)
+        )
+        gas = self.DEPENDENT_GAS[fn.fn_name] + extra_words * self.DEPENDENT_GAS_PER_WORD
+        if gas > self.DEPENDENT_GAS_CEILING:
+            raise ValueError(
+                f"{fn.fn_name} arguments are too long to build before batch {fn.args[0]} is registered on chain; "
+                f"build it once the registration is mined"
+            )
+        return gas
+
+    def _bulk_fn(self, op: dict):
+        kind = op["op"]
+        if kind == "register_batch":
+            return self.permission.functions.registerBatch(op["batch_id"], op["metadata"])
+        if kind == "record_stage":
+            return self.permission.functions.recordStage(op["batch_id"], op["stage"], op["location"], op["timestamp"])
+        if kind == "transfer_ownership":
+            return self.permission.functions.requestOwnershipTransfer(op["batch_id"], self._addr(op["new_owner"]))
+        raise ValueError(f"Unsupported operation: {kind}")
+
+    async def _current_fees(self) -> dict:
+        """EIP-1559 fee fields as build_transaction would fill them, fetched once per bulk request"""
+        block = await self.web3.eth.get_block("latest")
+        if block.get("baseFeePerGas") is None:
+            return {}  # Legacy chain: let build_transaction fill gasPrice
+        priority = await self.web3.eth.max_priority_fee
+        return {"maxPriorityFeePerGas": priority, "maxFeePerGas": priority + 2 * block["baseFeePerGas"]}
+
+    async def build_bulk_txs(self, ops: List[dict], concurrency: int = 16) -> List[dict]:
+        """
+        Build unsigned transactions for register_batch / record_stage / transfer_ownership
+        operations. Gas is estimated concurrently, nonces are consecutive per sender in
+        request order, and each result is {"index", "tx"} or {"index", "error"}.
+        """
+        results: List[Optional[dict]] = [None] * len(ops)
+        prepared = []  # (index, batch_id, fn, from_addr, depends_on_bulk)
+        registered = set()
+        for i, op in enumerate(ops):
+            try:
+                fn = self._bulk_fn(op)
+                from_addr = self._addr(op["from_address"])
+            except Exception as e:
+                results[i] = {"index": i, "error": str(e)}
+                continue
+            depends = op["op"] != "register_batch" and op["batch_id"] in registered
+            if op["op"] == "register_batch":
+                registered.add(op["batch_id"])
+            prepared.append((i, op["batch_id"], fn, from_addr, depends))
+
+        fees = await self._current_fees() if prepared else {}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def build_one(fn, from_addr, depends):
+            async with semaphore:
+                if depends:
+                    # An estimate of the same shape for an already registered batch beats the static limit
+                    gas = self.gas_cache.get(self.gas_cache.key(fn.fn_name, from_addr, fn.args))
+                    gas = gas or self._dependent_gas(fn)
+                else:
+                    gas = await self._estimate_gas(fn, from_addr)
+                tx = self._build_common(from_addr, gas, 0)  # Nonce is assigned once every item is built
+                tx.update(fees)
+                return await fn.build_transaction(tx)
+
+        built = await asyncio.gather(
+            *(build_one(fn, from_addr, depends) for _, _, fn, from_addr, depends in prepared),
+            return_exceptions=True
+        )
+
+        failed_batches = {
+            batch_id for (_, batch_id, fn, _, _), tx in zip(prepared, built)
+            if isinstance(tx, Exception) and fn.fn_name == "registerBatch"
+        }
+        by_sender: Dict[str, list] = {}
+        for (i, batch_id, fn, from_addr, depends), tx in zip(prepared, built):
+            if isinstance(tx, Exception):
+                results[i] = {"index": i, "error": str(tx)}
+            elif depends and batch_id in failed_batches:
+                results[i] = {"index": i, "error": f"register_batch for batch {batch_id} failed in this request"}
+            else:
+                by_sender.setdefault(from_addr, []).append((i, tx))
+
+        for sender, items in by_sender.items():
+            first = await self.nonces.reserve(sender, len(items))
+            for offset, (i, tx) in enumerate(items):
+                tx["nonce"] = first + offset
+                results[i] = {"index": i, "tx": tx}
+        return results
+
+    # ─────────────── Read Operations: Call Methods ───────────────
+    async def get_batch_overview(self, batch_id: int):
+        return await self.flights.do(("get_batch_overview", batch_id), lambda: self._get_batch_overview(batch_id))
+
+    async def _get_batch_overview(self, batch_id: int):
+        try:
+            result = await self.trace.functions.getBatchOverview(batch_id).call()
+            return {
+                "metadata": result[0],
+                "currentOwner": result[1],
+                "stageCount": int(result[2]),
+            }
+        except Exception as e:
+            print(f"❌ [ERROR] Failed to fetch batch overview: {e}")
+            raise
+
+    async def get_stage(self, batch_id: int, index: int):
+        return await self.flights.do(("get_stage", batch_id, index), lambda: self._get_stage(batch_id, index))
+
+    async def _get_stage(self, batch_id: int, index: int):
+        result = await self.trace.functions.getStage(batch_id, index).call()
+        return _stage_dict(result)
+
+    async def get_batch_trace(self, batch_id: int, batch_size: int = 100):
+        """Overview plus all stages: one eth_call for the stage count, then getStage(i) in JSON-RPC batches"""
+        overview = await self.get_batch_overview(batch_id)
+        return {"overview": overview, "stages": await self.get_stages(batch_id, overview["stageCount"], batch_size)}
+
+    async def get_stages(self, batch_id: int, count: int, batch_size: int = 100):
+        """getStage(0..count-1) in JSON-RPC batches"""
+        stages = []
+        for start in range(0, count, batch_size):
+            async with self.web3.batch_requests() as batch:
+                for i in range(start, min(start + batch_size, count)):
+                    batch.add(self.trace.functions.getStage(batch_id, i))
+                stages.extend(_stage_dict(result) for result in await batch.async_execute())
+        return stages
+
+    async def get_current_owner(self, batch_id: int) -> str:
+        return await self.flights.do(
+            ("get_current_owner", batch_id), lambda: self.trace.functions.getCurrentOwner(batch_id).call()
+        )
+
+    async def has_role(self, role: str, account: str) -> bool:
+        return await self.flights.do(
+            ("has_role", role, account), lambda: self.permission.functions.hasRole(_role_hash(role), account).call()
+        )
+
+    async def get_roles(self, accounts: List[str], roles: List[str], batch_size: int = 100) -> Dict[str, Dict[str, bool]]:
+        """hasRole for every (account, role) pair via JSON-RPC batches → {account: {role: bool}}"""
+        pairs = [(account, role) for account in accounts for role in roles]
+        results = []
+        for start in range(0, len(pairs), batch_size):
+            async with self.web3.batch_requests() as batch:
+                for account, role in pairs[start:start + batch_size]:
+                    batch.add(self.permission.functions.hasRole(_role_hash(role), account))
+                results.extend(await batch.async_execute())
+
+        resolved = {account: {} for account in accounts}
+        for (account, role), has in zip(pairs, results):
+            resolved[account][role] = bool(has)
+        return resolved
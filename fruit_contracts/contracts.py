@@ -2,10 +2,12 @@ from __future__ import annotations
 
 import json
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Optional
 
 from web3 import Web3
 
+from .registry import PERMISSION, TRACE, load_abi
+
 
 
 import importlib.resources as pkg
@@ -17,13 +19,6 @@ def _load_json(package: str, name: str) -> Any:
         return json.load(f)
 
 
-def _load_abi(name: str) -> Dict[str, Any]:
-    abi_path = Path("fruit_contracts/abis") / f"{name}.json"  # 可自定义路径
-    with open(abi_path, "r", encoding="utf-8") as f:
-        raw = json.load(f)
-    return raw["abi"] if isinstance(raw, dict) and "abi" in raw else raw
-
-
 
 # ──────────── 核心封装类 ────────────
 class Contracts:
@@ -60,11 +55,11 @@ class Contracts:
         # 加载合约实例
         self.permission = self.web3.eth.contract(
             address=Web3.to_checksum_address(permission_addr),
-            abi=_load_abi("PermissionControl"),
+            abi=load_abi(PERMISSION),
         )
         self.trace = self.web3.eth.contract(
             address=Web3.to_checksum_address(trace_addr),
-            abi=_load_abi("FruitTraceability"),
+            abi=load_abi(TRACE),
         )
 
     # ──────────────────── 工厂函数（推荐） ────────────────────
@@ -1,6 +1,6 @@
-import json, os
+# 运行方式（仓库根目录）：python -m fruit_contracts.read_demo
 from web3 import Web3
-from pathlib import Path
+from fruit_contracts.registry import TRACE, load_abi
 
 # ---------- 手动配置 ----------
 RPC_URL = "https://sepolia.infura.io/v3/beff8273b87e4f0e946bb817db57f1af"
@@ -8,10 +8,7 @@ RPC_URL = "https://sepolia.infura.io/v3/beff8273b87e4f0e946bb817db57f1af"
 TRACE_ADDR = "0x5a1a63167a33dCa9eF157a939934Ac36703Bd682"
 
 # ---------- 读取 ABI ----------
-abi_path = Path("abis/FruitTraceability.json")
-with abi_path.open() as f:
-    abi_json = json.load(f)          # ← 只读一次
-TRACE_ABI = abi_json["abi"] if isinstance(abi_json, dict) and "abi" in abi_json else abi_json
+TRACE_ABI = load_abi(TRACE)          # ← 从包内读取，与当前目录无关
 
 # ---------- 链下调用 ----------
 w3 = Web3(Web3.HTTPProvider(RPC_URL))
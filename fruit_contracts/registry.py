@@ -0,0 +1,71 @@
+"""
+Process-wide registry of the deployed contracts: ABIs, addresses, event topics and function selectors.
+
+Nothing is read or computed at import. Each item is loaded on first use, once per process, and
+shared by the API, the indexer and the scripts. ABIs are read from the package, so the result does
+not depend on the current directory.
+"""
+import json
+import os
+from functools import lru_cache
+from importlib.resources import files
+
+from eth_utils import event_abi_to_log_topic, function_abi_to_4byte_selector, to_checksum_address
+
+PERMISSION = "PermissionControl"
+TRACE = "FruitTraceability"
+
+
+# ──────────── ABIs ────────────
+@lru_cache(maxsize=None)
+def load_abi(name: str) -> list:
+    """ABI of fruit_contracts/abis/<name>.json (a bare list or a build artifact with an "abi" key)"""
+    raw = json.loads(files("fruit_contracts.abis").joinpath(f"{name}.json").read_text(encoding="utf-8"))
+    return raw["abi"] if isinstance(raw, dict) and "abi" in raw else raw
+
+
+@lru_cache(maxsize=None)
+def event_topics(name: str) -> dict:
+    """Event name → topic0 of every event in the contract's ABI"""
+    return {item["name"]: event_abi_to_log_topic(item) for item in load_abi(name) if item.get("type") == "event"}
+
+
+@lru_cache(maxsize=None)
+def function_selectors(name: str) -> dict:
+    """Function name → 4-byte selector of every function in the contract's ABI"""
+    return {
+        item["name"]: function_abi_to_4byte_selector(item)
+        for item in load_abi(name) if item.get("type") == "function"
+    }
+
+
+# ──────────── Deployment ────────────
+class Deployment:
+    """Addresses (checksummed once) and chain of one deployment of the two contracts"""
+
+    def __init__(self, permission_addr: str, trace_addr: str, chain_id: int):
+        self.permission_addr = to_checksum_address(permission_addr)
+        self.trace_addr = to_checksum_address(trace_addr)
+        self.chain_id = chain_id
+
+    @property
+    def addresses(self) -> list:
+        return [self.permission_addr, self.trace_addr]
+
+    def named_contracts(self) -> list:
+        """(address, contract name) of each contract"""
+        return [(self.permission_addr, PERMISSION), (self.trace_addr, TRACE)]
+
+    def contracts(self) -> list:
+        """(address, ABI) of each contract"""
+        return [(address, load_abi(name)) for address, name in self.named_contracts()]
+
+
+@lru_cache(maxsize=None)
+def deployment() -> Deployment:
+    """The deployment configured by PERMISSION_ADDR / TRACE_ADDR / CHAIN_ID, resolved on first use"""
+    return Deployment(
+        os.environ["PERMISSION_ADDR"],
+        os.environ["TRACE_ADDR"],
+        int(os.getenv("CHAIN_ID", "11155111")),
+    )
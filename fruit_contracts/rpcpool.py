@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import aiohttp
+from web3 import AsyncHTTPProvider
+from web3._utils.batching import sort_batch_response_by_response_ids
+
+# Transport failures worth another endpoint; JSON-RPC errors (reverts, bad params) are answers, not failures
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+UNSAMPLED_LATENCY = 0.001  # seconds assumed for an endpoint until its first answer
+
+# (provider, endpoint) the current task's requests are pinned to; see PooledHTTPProvider.pinned
+_pinned: contextvars.ContextVar = contextvars.ContextVar("rpc_pinned", default=None)
+
+# Methods without side effects: safe to resend to another endpoint after any failure, and to hedge.
+# Anything else (eth_sendRawTransaction) only fails over when the connection could not be opened.
+READ_METHODS = frozenset({
+    "eth_blockNumber", "eth_call", "eth_chainId", "eth_estimateGas", "eth_feeHistory", "eth_gasPrice",
+    "eth_getBalance", "eth_getBlockByHash", "eth_getBlockByNumber", "eth_getCode", "eth_getLogs",
+    "eth_getTransactionByHash", "eth_getTransactionCount", "eth_getTransactionReceipt",
+    "eth_maxPriorityFeePerGas", "net_version",
+})
+
+
+def make_rpc_session(pool_size: int = 20, timeout: float = 10.0) -> aiohttp.ClientSession:
+    """Pooled keep-alive HTTP session shared by every async provider of the process (create inside the event loop).
+
+    pool_size caps connections per endpoint, so a slow node holding its connections cannot starve the others."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=0, limit_per_host=pool_size, keepalive_timeout=30),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    )
+
+
+def split_rpc_urls(urls: Union[str, Iterable[str], None]) -> List[str]:
+    """RPC_URL may list several endpoints separated by commas"""
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    return [u.strip() for u in urls or () if u and u.strip()]
+
+
+# ──────────── Endpoint Health ────────────
+class Endpoint:
+    """
+    Running health of one RPC URL: exponentially weighted latency and error rate, requests
+    in flight, and a cooldown after consecutive transport failures (doubling up to max_cooldown).
+    """
+
+    def __init__(self, url: str, alpha: float = 0.2, base_cooldown: float = 1.0, max_cooldown: float = 30.0) -> None:
+        self.url = url
+        self.alpha = alpha
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.latency: Optional[float] = None  # seconds, EWMA; None until the first answer
+        self.error_rate = 0.0                 # EWMA of failures per attempt
+        self.inflight = 0
+        self.failures = 0                     # consecutive
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0                       # attempts started because another endpoint was slow
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def score(self, error_penalty: float) -> float:
+        """Expected cost of the next request, lower is better: latency weighted by load plus an error penalty.
+        An endpoint not sampled yet counts as fast, so it gets probed, but load still spreads the first requests"""
+        latency = UNSAMPLED_LATENCY if self.latency is None else self.latency
+        return latency * (1 + self.inflight) + self.error_rate * error_penalty
+
+    def observe(self, elapsed: float) -> None:
+        self.latency = elapsed if self.latency is None else self.latency + self.alpha * (elapsed - self.latency)
+
+    def observe_at_least(self, elapsed: float) -> None:
+        """An attempt abandoned after `elapsed` seconds: only ever raises the estimate"""
+        if self.latency is None or elapsed > self.latency:
+            self.observe(elapsed)
+
+    def succeeded(self, elapsed: float) -> None:
+        self.observe(elapsed)
+        self.error_rate -= self.alpha * self.error_rate
+        self.failures = 0
+        self.down_until = 0.0
+
+    def failed(self) -> None:
+        self.errors += 1
+        self.error_rate += self.alpha * (1 - self.error_rate)
+        self.failures += 1
+        cooldown = min(self.base_cooldown * 2 ** (self.failures - 1), self.max_cooldown)
+        self.down_until = time.monotonic() + cooldown
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy(time.monotonic()),
+            "latency_ms": None if self.latency is None else round(self.latency * 1000, 2),
+            "error_rate": round(self.error_rate, 4),
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedges": self.hedges,
+        }
+
+
+# ──────────── Pooled Provider ────────────
+class PooledHTTPProvider(AsyncHTTPProvider):
+    """
+    AsyncHTTPProvider over several RPC URLs sharing one pooled session.
+
+    Each request goes to the healthiest endpoint (lowest latency × load plus an error penalty;
+    endpoints cooling down after failures go last) and fails over to the next on a transport
+    error. With `hedge_after` set, a read still unanswered after that many seconds is also sent
+    to the next endpoint and the first answer wins. With a single URL this behaves like
+    AsyncHTTPProvider plus up to `max_attempts` tries with backoff.
+    """
+
+    def __init__(
+        self,
+        endpoint_uris: Union[str, Iterable[str]],
+        *,
+        hedge_after: Optional[float] = None,
+        max_attempts: int = 3,
+        retry_backoff: float = 0.1,
+        error_penalty: float = 1.0,
+        **kwargs: Any
+    ) -> None:
+        urls = split_rpc_urls(endpoint_uris)
+        if not urls:
+            raise ValueError("At least one RPC URL is required")
+        super().__init__(urls[0], **kwargs)
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.hedge_after = hedge_after or None
+        self.max_attempts = max(max_attempts, len(urls))
+        self.retry_backoff = retry_backoff
+        self.error_penalty = error_penalty
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def __str__(self) -> str:
+        return f"RPC connection pool {', '.join(e.url for e in self.endpoints)}"
+
+    async def cache_async_session(self, session: aiohttp.ClientSession) -> aiohttp.ClientSession:
+        """Serve every endpoint through `session` (web3 would otherwise open one per URL)"""
+        self._session = session
+        for endpoint in self.endpoints:
+            await self._request_session_manager.async_cache_and_return_session(endpoint.url, session)
+        return session
+
+    def ranked(self) -> List[Endpoint]:
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.healthy(now)]
+        cooling = [e for e in self.endpoints if not e.healthy(now)]
+        return (sorted(healthy, key=lambda e: e.score(self.error_penalty))
+                + sorted(cooling, key=lambda e: e.down_until))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [e.stats() for e in self.endpoints]
+
+    @contextmanager
+    def pinned(self):
+        """Send every request the current task makes inside the block to one endpoint, the healthiest now.
+
+        For reads that must agree with each other (a head, the logs up to it and their block hashes):
+        no hedging or failover to another endpoint; a transport failure is retried on the same one."""
+        endpoint = self.ranked()[0]
+        token = _pinned.set((self, endpoint))
+        try:
+            yield endpoint
+        finally:
+            _pinned.reset(token)
+
+    # Both entry points of AsyncHTTPProvider end in one routed POST
+    async def _make_request(self, method, request_data: bytes) -> bytes:
+        return await self._route(request_data, method in READ_METHODS)
+
+    async def make_batch_request(self, batch_requests):
+        request_data = self.encode_batch_rpc_request(batch_requests)
+        reads_only = all(method in READ_METHODS for method, _ in batch_requests)
+        response = self.decode_rpc_response(await self._route(request_data, reads_only))
+        if not isinstance(response, list):
+            return response  # RPC errors return only one response with the error object
+        return sort_batch_response_by_response_ids(response)
+
+    async def _route(self, request_data: bytes, read_only: bool) -> bytes:
+        if self._session is None:
+            await self.cache_async_session(make_rpc_session())
+        kwargs = self.get_request_kwargs()
+        pin = _pinned.get()
+        ranked = [pin[1]] if pin is not None and pin[0] is self else self.ranked()
+        queue = [ranked[i % len(ranked)] for i in range(self.max_attempts)]
+        hedge_after = self.hedge_after if read_only and len(ranked) > 1 else None
+
+        attempts: Dict[asyncio.Future, Endpoint] = {}
+        failed: List[Endpoint] = []
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                if not attempts:
+                    if not queue:
+                        raise error
+                    if queue[0] in failed:
+                        # Back to an endpoint that already failed this request: give it a moment
+                        await asyncio.sleep(self.retry_backoff * 2 ** (len(failed) - 1))
+                    self._start(queue.pop(0), request_data, kwargs, attempts)
+
+                # Hedge at most once per request: one extra attempt on the next endpoint
+                timeout = hedge_after if len(attempts) == 1 and queue else None
+                done, _ = await asyncio.wait(list(attempts), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_after = None
+                    endpoint = queue.pop(0)
+                    endpoint.hedges += 1
+                    self._start(endpoint, request_data, kwargs, attempts)
+                    continue
+
+                for task in done:
+                    endpoint = attempts.pop(task)
+                    try:
+                        return task.result()
+                    except TRANSPORT_ERRORS as e:
+                        # A write may have reached the node unless the connection was never opened
+                        if not read_only and not isinstance(e, aiohttp.ClientConnectorError):
+                            raise
+                        error = e
+                        failed.append(endpoint)
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    def _start(self, endpoint: Endpoint, request_data: bytes, kwargs: Dict[str, Any],
+               attempts: Dict[asyncio.Future, Endpoint]) -> None:
+        attempts[asyncio.ensure_future(self._attempt(endpoint, request_data, kwargs))] = endpoint
+
+    async def _attempt(self, endpoint: Endpoint, request_data: bytes, kwargs: Dict[str, Any]) -> bytes:
+        endpoint.requests += 1
+        endpoint.inflight += 1
+        start = time.monotonic()
+        try:
+            response = await self._request_session_manager.async_make_post_request(
+                endpoint.url, request_data, **kwargs
+            )
+        except asyncio.CancelledError:
+            endpoint.observe_at_least(time.monotonic() - start)  # Lost a hedge: it took at least this long
+            raise
+        except TRANSPORT_ERRORS:
+            endpoint.failed()
+            raise
+        finally:
+            endpoint.inflight -= 1
+        endpoint.succeeded(time.monotonic() - start)
+        return response
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+# ──────────── Nonce Manager ────────────
+class NonceManager:
+    """
+    Hands out consecutive nonces per sender for unsigned transactions.
+
+    The next nonce is the larger of the node's `pending` transaction count and the
+    next locally handed-out nonce, so back-to-back builds never collide. Builds are
+    only signed later (if at all) by the user's wallet, so handed-out nonces that
+    never reach the mempool are reclaimed once the sender has been idle for
+    `drop_after` seconds and the node still reports a lower pending count.
+    """
+
+    def __init__(self, web3, resync_after: float = 5.0, drop_after: float = 120.0) -> None:
+        self.web3 = web3
+        self.resync_after = resync_after
+        self.drop_after = drop_after
+        self._next: Dict[str, int] = {}           # sender → next nonce to hand out
+        self._pending: Dict[str, int] = {}        # sender → last pending count seen on chain
+        self._synced_at: Dict[str, float] = {}    # sender → time of that reading
+        self._issued_at: Dict[str, float] = {}    # sender → time of the last hand-out
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def reserve(self, sender: str, count: int = 1) -> int:
+        """Reserve `count` consecutive nonces for sender and return the first one"""
+        async with self._locks[sender]:
+            now = time.monotonic()
+            if now - self._synced_at.get(sender, float("-inf")) >= self.resync_after:
+                self._pending[sender] = await self.web3.eth.get_transaction_count(sender, "pending")
+                self._synced_at[sender] = now
+
+            pending = self._pending[sender]
+            local = self._next.get(sender, pending)
+            if local < pending:
+                local = pending  # Transactions sent from elsewhere moved the account ahead
+            elif local > pending and now - self._issued_at.get(sender, now) >= self.drop_after:
+                print(f"♻️ Reclaiming nonces {pending}..{local - 1} of {sender}: never reached the mempool")
+                local = pending
+
+            self._next[sender] = local + count
+            self._issued_at[sender] = now
+            return local
+
+    def release(self, sender: str, nonce: int, count: int = 1) -> None:
+        """Give back the most recent reservation when its transaction could not be built"""
+        if self._next.get(sender) == nonce + count:
+            self._next[sender] = nonce
+
+    def reset(self, sender: Optional[str] = None) -> None:
+        """Forget local state (e.g. after a known dropped transaction) and resync on next use"""
+        for state in (self._next, self._pending, self._synced_at, self._issued_at):
+            if sender is None:
+                state.clear()
+            else:
+                state.pop(sender, None)
+
+
+# ──────────── Gas Estimate Cache ────────────
+def _arg_shape(value: Any) -> Hashable:
+    """Gas-relevant shape of an argument: its type, plus the 32-byte word count for strings/bytes"""
+    if isinstance(value, (str, bytes)):
+        return type(value).__name__, (len(value) + 31) // 32
+    if isinstance(value, (list, tuple)):
+        return "seq", tuple(_arg_shape(v) for v in value)
+    return type(value).__name__
+
+
+class GasEstimateCache:
+    """
+    Short-lived cache of estimate_gas results keyed by (function, sender, argument shape).
+
+    A cached estimate skips the node's dry run, so a call that would revert is only
+    caught when the wallet submits it; keep the TTL short.
+    """
+
+    def __init__(self, ttl: float = 30.0, maxsize: int = 1024) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple, Tuple[float, int]]" = OrderedDict()
+
+    @staticmethod
+    def key(fn_name: str, sender: str, args: tuple) -> Tuple:
+        return fn_name, sender, tuple(_arg_shape(a) for a in args)
+
+    def get(self, key: Tuple) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, gas = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        return gas
+
+    def put(self, key: Tuple, gas: int) -> None:
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, gas)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# ──────────── Single-Flight ────────────
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: callers with the same key while a call is in
+    flight await that call and share its result or exception instead of issuing their own.
+
+    Keys are (method, *args). Nothing is cached once the call completes; the call runs as
+    its own task so a caller that goes away does not cancel it for the others.
+    """
+
+    def __init__(self, on_coalesced: Optional[Callable[[str], None]] = None) -> None:
+        self.on_coalesced = on_coalesced      # called with the method name for every joined call
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.calls: "Counter[str]" = Counter()      # per method: calls actually issued
+        self.coalesced: "Counter[str]" = Counter()  # per method: calls that joined one in flight
+
+    async def do(self, key: Tuple, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.calls[key[0]] += 1
+        else:
+            self.coalesced[key[0]] += 1
+            if self.on_coalesced is not None:
+                self.on_coalesced(key[0])
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Tuple, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here in case every caller was cancelled meanwhile
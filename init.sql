@@ -31,3 +31,5 @@ CREATE TABLE IF NOT EXISTS logs (
     tx_hash TEXT PRIMARY KEY,
     event_name TEXT
 );
+
+-- Later schema changes live in migrations/ and are applied at startup by schema.py
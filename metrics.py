@@ -0,0 +1,137 @@
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# ---------- Metric Definitions ----------
+# Label values are bounded by the code (route templates, RPC method names, SQL statement texts),
+# so every series is created once and later observations are a dict lookup plus a bucket increment
+ROUTE_LATENCY = Histogram(
+    "fruit_http_request_duration_seconds", "API request latency by route template",
+    ["method", "route", "status"],
+)
+RPC_LATENCY = Histogram(
+    "fruit_rpc_request_duration_seconds", "JSON-RPC request latency by method",
+    ["client", "method"],
+)
+RPC_ERRORS = Counter(
+    "fruit_rpc_errors_total", "JSON-RPC requests that raised", ["client", "method"],
+)
+SQL_LATENCY = Histogram(
+    "fruit_sql_query_duration_seconds", "Postgres statement latency",
+    ["pool", "statement"],
+)
+RPC_COALESCED = Counter(
+    "fruit_rpc_coalesced_total", "Chain reads that joined an identical call already in flight", ["method"],
+)
+READ_FALLBACKS = Counter(
+    "fruit_read_fallbacks_total", "Reads answered from the chain instead of Postgres",
+    ["endpoint", "reason"],  # reason: db_miss (no row yet) or db_error
+)
+INDEXER_HEAD = Gauge("fruit_indexer_head_block", "Latest chain head seen by the indexer")
+INDEXER_CURSOR = Gauge("fruit_indexer_cursor_block", "Last block fully applied by the indexer")
+INDEXER_LAG = Gauge("fruit_indexer_lag_blocks", "Chain head minus indexer cursor")
+INDEXER_PARKED = Gauge("fruit_indexer_parked_events", "Events waiting in event_failures for a replay")
+POOL_CONNECTIONS = Gauge(
+    "fruit_db_pool_connections", "asyncpg pool connections by state",
+    ["pool", "state"],  # state: max, open, in_use
+)
+
+# ---------- RPC ----------
+_rpc_method = ContextVar("rpc_method", default="unknown")
+
+
+def instrument_provider(provider, client):
+    """Time every HTTP round trip a web3 async provider makes, labelled with the JSON-RPC method.
+
+    Timing wraps the HTTP post rather than make_request so answers served from web3's request
+    cache (eth_chainId) are not counted as RPC calls."""
+    make_request = provider.make_request
+    make_batch_request = provider.make_batch_request
+    session_manager = provider._request_session_manager
+    post = session_manager.async_make_post_request
+
+    async def labelled_request(method, params):
+        _rpc_method.set(method)
+        return await make_request(method, params)
+
+    async def labelled_batch(requests):
+        _rpc_method.set("batch")
+        return await make_batch_request(requests)
+
+    async def timed_post(*args, **kwargs):
+        method = _rpc_method.get()
+        start = time.perf_counter()
+        try:
+            return await post(*args, **kwargs)
+        except Exception:
+            RPC_ERRORS.labels(client, method).inc()
+            raise
+        finally:
+            RPC_LATENCY.labels(client, method).observe(time.perf_counter() - start)
+
+    provider.make_request = labelled_request
+    provider.make_batch_request = labelled_batch
+    session_manager.async_make_post_request = timed_post
+    return provider
+
+def record_coalesced(method):
+    RPC_COALESCED.labels(method).inc()
+
+# ---------- SQL ----------
+@lru_cache(maxsize=512)
+def statement_label(query):
+    """Whitespace-normalised statement text, truncated to keep label values readable"""
+    return " ".join(query.split())[:120]
+
+
+def sql_timer(pool_name):
+    """asyncpg pool `init` hook that records every statement's elapsed time on new connections"""
+    def record(logged):
+        SQL_LATENCY.labels(pool_name, statement_label(logged.query)).observe(logged.elapsed)
+
+    async def init(conn):
+        conn.add_query_logger(record)
+
+    return init
+
+
+def track_pool(pool_name, pool):
+    """Pool saturation gauges, read from the pool only when scraped"""
+    POOL_CONNECTIONS.labels(pool_name, "max").set_function(pool.get_max_size)
+    POOL_CONNECTIONS.labels(pool_name, "open").set_function(pool.get_size)
+    POOL_CONNECTIONS.labels(pool_name, "in_use").set_function(lambda: pool.get_size() - pool.get_idle_size())
+
+# ---------- HTTP ----------
+class RouteMetricsMiddleware:
+    """ASGI middleware timing each request under its route template (not the raw path)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            # Event streams stay open for minutes and would only skew the latency buckets
+            if not path.startswith("/stream/"):
+                ROUTE_LATENCY.labels(scope["method"], path, str(status)).observe(time.perf_counter() - start)
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,6 @@
+-- Block cursor of the event indexer (offchain.py)
+CREATE TABLE IF NOT EXISTS sync_state (
+    name        TEXT PRIMARY KEY,
+    last_block  BIGINT NOT NULL,
+    updated_at  TIMESTAMP DEFAULT NOW()
+);
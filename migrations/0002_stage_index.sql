@@ -0,0 +1,14 @@
+-- Explicit per-batch stage ordinal matching the on-chain stages[] position
+ALTER TABLE stages ADD COLUMN IF NOT EXISTS stage_index INT;
+
+UPDATE stages s
+SET stage_index = numbered.idx
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY batch_id ORDER BY id) - 1 AS idx
+    FROM stages
+) numbered
+WHERE s.id = numbered.id AND s.stage_index IS NULL;
+
+ALTER TABLE stages ALTER COLUMN stage_index SET NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS stages_batch_stage_idx ON stages (batch_id, stage_index);
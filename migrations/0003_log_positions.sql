@@ -0,0 +1,24 @@
+-- Record where each event came from so a chain reorganisation can be detected and rolled back.
+-- logs keeps one row per event (a transaction can emit several) with its decoded args as a journal.
+ALTER TABLE logs DROP CONSTRAINT IF EXISTS logs_pkey;
+ALTER TABLE logs ADD COLUMN IF NOT EXISTS id BIGSERIAL PRIMARY KEY;
+ALTER TABLE logs ADD COLUMN IF NOT EXISTS block_number BIGINT;
+ALTER TABLE logs ADD COLUMN IF NOT EXISTS block_hash TEXT;
+ALTER TABLE logs ADD COLUMN IF NOT EXISTS log_index INT;
+ALTER TABLE logs ADD COLUMN IF NOT EXISTS args JSONB;
+
+CREATE UNIQUE INDEX IF NOT EXISTS logs_position_idx ON logs (block_number, log_index);
+CREATE INDEX IF NOT EXISTS logs_tx_hash_idx ON logs (tx_hash);
+
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS block_number BIGINT;
+ALTER TABLE stages ADD COLUMN IF NOT EXISTS block_number BIGINT;
+ALTER TABLE stages ADD COLUMN IF NOT EXISTS log_index INT;
+
+CREATE INDEX IF NOT EXISTS batches_block_number_idx ON batches (block_number);
+CREATE INDEX IF NOT EXISTS stages_block_number_idx ON stages (block_number);
+
+-- Hashes of recently indexed blocks, compared against the chain to find a common ancestor
+CREATE TABLE IF NOT EXISTS indexed_blocks (
+    block_number  BIGINT  PRIMARY KEY,
+    block_hash    TEXT    NOT NULL
+);
@@ -0,0 +1,9 @@
+-- Lookups used to replay the event journal to resuming /stream clients
+CREATE INDEX IF NOT EXISTS logs_batch_position_idx
+    ON logs (((args->>'batchId')::BIGINT), block_number, log_index);
+CREATE INDEX IF NOT EXISTS logs_farmer_idx
+    ON logs (LOWER(args->>'farmer')) WHERE event_name = 'BatchRegistered';
+CREATE INDEX IF NOT EXISTS logs_transfer_from_idx
+    ON logs (LOWER(args->>'from')) WHERE event_name = 'OwnershipTransferred';
+CREATE INDEX IF NOT EXISTS logs_transfer_to_idx
+    ON logs (LOWER(args->>'to')) WHERE event_name = 'OwnershipTransferred';
@@ -0,0 +1,24 @@
+-- Denormalised filter columns for keyset-paginated batch listings (/read/batches)
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS farmer TEXT;
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS latest_stage INT;
+
+UPDATE batches b
+SET farmer = l.args->>'farmer'
+FROM logs l
+WHERE l.event_name = 'BatchRegistered'
+  AND (l.args->>'batchId')::BIGINT = b.batch_id
+  AND b.farmer IS NULL;
+
+UPDATE batches b
+SET latest_stage = last.stage
+FROM (
+    SELECT DISTINCT ON (batch_id) batch_id, stage
+    FROM stages
+    ORDER BY batch_id, stage_index DESC
+) last
+WHERE b.batch_id = last.batch_id AND b.latest_stage IS NULL;
+
+-- Each filter is an equality prefix followed by the batch_id keyset, so a page is one index range scan
+CREATE INDEX IF NOT EXISTS batches_owner_keyset_idx ON batches (LOWER(current_owner), batch_id);
+CREATE INDEX IF NOT EXISTS batches_farmer_keyset_idx ON batches (LOWER(farmer), batch_id);
+CREATE INDEX IF NOT EXISTS batches_stage_keyset_idx ON batches (latest_stage, batch_id);
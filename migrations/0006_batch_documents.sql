@@ -0,0 +1,34 @@
+-- One pre-rendered JSON document per batch (overview, farmer, latest stage, every stage), kept current by
+-- the indexer in the same transaction as the events it applies so reads are a single primary-key fetch.
+-- block_number is the last block with an event of the batch.
+CREATE TABLE IF NOT EXISTS batch_documents (
+    batch_id      BIGINT     PRIMARY KEY,
+    document      JSONB      NOT NULL,
+    block_number  BIGINT,
+    updated_at    TIMESTAMP  DEFAULT NOW()
+);
+
+INSERT INTO batch_documents (batch_id, document, block_number)
+SELECT b.batch_id,
+       jsonb_build_object(
+           'overview', jsonb_build_object(
+               'batch_id', b.batch_id,
+               'metadata', b.metadata,
+               'current_owner', b.current_owner,
+               'created_at', b.created_at
+           ),
+           'farmer', b.farmer,
+           'latest_stage', b.latest_stage,
+           'stages', COALESCE((
+               SELECT jsonb_agg(jsonb_build_object(
+                   'stage', s.stage,
+                   'location', s.location,
+                   'timestamp', s.ts_block,
+                   'actor', s.actor
+               ) ORDER BY s.stage_index)
+               FROM stages s WHERE s.batch_id = b.batch_id
+           ), '[]'::jsonb)
+       ),
+       (SELECT MAX(l.block_number) FROM logs l WHERE (l.args->>'batchId')::BIGINT = b.batch_id)
+FROM batches b
+ON CONFLICT (batch_id) DO NOTHING;
@@ -0,0 +1,6 @@
+-- Hash of the block in batch_documents.block_number, so a version (block, hash) stays unique across reorgs
+ALTER TABLE batch_documents ADD COLUMN IF NOT EXISTS block_hash TEXT;
+
+UPDATE batch_documents d
+SET block_hash = (SELECT l.block_hash FROM logs l WHERE l.block_number = d.block_number LIMIT 1)
+WHERE d.block_hash IS NULL AND d.block_number IS NOT NULL;
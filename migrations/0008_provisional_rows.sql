@@ -0,0 +1,8 @@
+-- Rows written back by the API from chain reads before the indexer reached them. The indexer replaces
+-- them: registration clears the flag, and provisional stages of a batch are dropped before it applies
+-- that batch's stages (a provisional batch is dropped with them) so stage_index stays the chain's.
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS provisional BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE stages ADD COLUMN IF NOT EXISTS provisional BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS batches_provisional_idx ON batches (batch_id) WHERE provisional;
+CREATE INDEX IF NOT EXISTS stages_provisional_idx ON stages (batch_id) WHERE provisional;
@@ -0,0 +1,18 @@
+-- Events the indexer could not decode or apply, and the events parked behind them. Events of one shard
+-- (a batch, or an account for role events) are applied in log order, so once one fails, the shard's later
+-- events wait here too while every other shard keeps flowing. The indexer replays them with backoff.
+CREATE TABLE IF NOT EXISTS event_failures (
+    block_number     BIGINT     NOT NULL,
+    log_index        INT        NOT NULL,
+    shard            TEXT,                  -- 'batch:<id>' or 'account:<address>'; NULL if undecodable
+    event_name       TEXT,
+    log              JSONB      NOT NULL,   -- the JSON-RPC log, replayed as fetched
+    reason           TEXT       NOT NULL,   -- decode, handler, or blocked (behind a failure of its shard)
+    error            TEXT,
+    attempts         INT        NOT NULL DEFAULT 0,
+    next_attempt_at  TIMESTAMP,             -- NULL once retries are exhausted (python -m offchain retry-events)
+    created_at       TIMESTAMP  NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (block_number, log_index)
+);
+
+CREATE INDEX IF NOT EXISTS event_failures_shard_idx ON event_failures (shard);
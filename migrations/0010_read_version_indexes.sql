@@ -0,0 +1,7 @@
+-- Lookups behind the ETags of reads spanning many rows (/read/has_role, /read/roles, /read/batches):
+-- the last role event of an account, the most recently changed batch documents, and the batches that
+-- ever reached a stage (a batch leaving a latest-stage listing changes it too)
+CREATE INDEX IF NOT EXISTS logs_role_account_idx
+    ON logs ((args->>'account'), block_number, log_index) WHERE event_name IN ('RoleGranted', 'RoleRevoked');
+CREATE INDEX IF NOT EXISTS batch_documents_block_idx ON batch_documents (block_number);
+CREATE INDEX IF NOT EXISTS stages_stage_idx ON stages (stage, batch_id);
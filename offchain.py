@@ -1,58 +1,104 @@
 import os
+import sys
 import json
+import time
 import asyncio
+import argparse
 import asyncpg
 import threading
-from web3 import Web3
-from web3._utils.events import event_abi_to_log_topic, get_event_data
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from hexbytes import HexBytes
+from web3 import AsyncWeb3, Web3, WebSocketProvider
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from fruit_contracts.registry import deployment, event_topics, load_abi
+from fruit_contracts.rpcpool import PooledHTTPProvider, split_rpc_urls
+from schema import migrate
+import metrics
 
 load_dotenv()  # Load environment variables from .env
 
 # ---------- Configuration ----------
+# One or more comma-separated endpoints; with RPC_HEDGE_AFTER (seconds) a slow read is also sent to a second one
 RPC_URL = os.getenv("RPC_URL")
-PERM_ADDR = os.getenv("PERMISSION_ADDR")
-TRACE_ADDR = os.getenv("TRACE_ADDR")
-CHAIN_ID = int(os.getenv("CHAIN_ID", "11155111"))
+RPC_HEDGE_AFTER = float(os.getenv("RPC_HEDGE_AFTER", "0"))
 
-PERM_ABI_PATH = "fruit_contracts/abis/PermissionControl.json"
-TRACE_ABI_PATH = "fruit_contracts/abis/FruitTraceability.json"
+# Block-range indexing: first block to backfill from (contract deployment block),
+# max blocks per eth_getLogs request and the idle poll interval bounds once caught up with the head
+START_BLOCK = int(os.getenv("START_BLOCK", "0"))
+SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", "2000"))
+SYNC_POLL_INTERVAL = float(os.getenv("SYNC_POLL_INTERVAL", "10"))
+SYNC_POLL_MIN_INTERVAL = float(os.getenv("SYNC_POLL_MIN_INTERVAL", "1"))
 
-DB_DSN = f"postgresql://{os.getenv('DB_USER', 'fruit_user')}:{os.getenv('DB_PASSWORD', 'fruit_pass')}@" \
-         f"{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'fruit_chain')}"
+# Optional WebSocket endpoint; when set, pushed logs wake the poller instead of waiting out the interval
+WS_RPC_URL = os.getenv("WS_RPC_URL")
 
-# ---------- Web3 ----------
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+# Only the instance holding this advisory lock ingests; standbys retry every LEADER_RETRY_INTERVAL seconds
+INDEXER_LOCK_ID = 64520002
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", "5"))
 
+# A range's shards (batches, accounts) are applied by this many workers in parallel, each on its own connection
+INDEXER_WORKERS = max(int(os.getenv("INDEXER_WORKERS", "4")), 1)
 
-def load_abi(path):
-    with open(path, 'r') as f:
-        return json.load(f)['abi']
+# API write-backs of chain reads hold their batch's bucket of this lock shared; indexer workers take the
+# buckets of their shards exclusively while they replace them
+WRITE_BACK_LOCK_ID = 64520003
+WRITE_BACK_LOCK_BUCKETS = 64
 
-# ---------- ABI & Contract Instances ----------
-perm_abi = load_abi(PERM_ABI_PATH)
-trace_abi = load_abi(TRACE_ABI_PATH)
+# Committed ranges are announced on this channel so every API process can refresh caches and streams
+CHANGES_CHANNEL = "fruit_changes"
+INSTANCE_ID = uuid.uuid4().hex
+CURSOR_NAME = "events"
 
-perm_contract = w3.eth.contract(
-    address=Web3.to_checksum_address(PERM_ADDR),
-    abi=perm_abi
-)
+# Number of recent block hashes kept to locate the common ancestor after a reorg
+REORG_MAX_DEPTH = int(os.getenv("REORG_MAX_DEPTH", "128"))
 
-trace_contract = w3.eth.contract(
-    address=Web3.to_checksum_address(TRACE_ADDR),
-    abi=trace_abi
-)
+# Events that fail to decode or apply are parked in event_failures and replayed after EVENT_RETRY_BASE
+# seconds, doubling up to EVENT_RETRY_MAX_DELAY, for at most EVENT_RETRY_LIMIT attempts
+EVENT_RETRY_BASE = float(os.getenv("EVENT_RETRY_BASE", "30"))
+EVENT_RETRY_MAX_DELAY = float(os.getenv("EVENT_RETRY_MAX_DELAY", "3600"))
+EVENT_RETRY_LIMIT = int(os.getenv("EVENT_RETRY_LIMIT", "10"))
+EVENT_RETRY_BATCH = 500
+ANNOUNCE_POSITIONS = 200  # replayed event positions per NOTIFY, well under its 8000-byte payload limit
 
-PERM_ADDR = Web3.to_checksum_address(os.getenv("PERMISSION_ADDR"))
-TRACE_ADDR = Web3.to_checksum_address(os.getenv("TRACE_ADDR"))
+DB_DSN = f"postgresql://{os.getenv('DB_USER', 'fruit_user')}:{os.getenv('DB_PASSWORD', 'fruit_pass')}@" \
+         f"{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'fruit_chain')}"
+
+# ---------- Web3 ----------
+# Built on first use so importing this module (the API does) costs no provider, ABI or address work
+_w3 = None
+
+def get_w3():
+    """The indexer's async Web3; async so eth_getLogs never blocks the event loop it shares with the API"""
+    global _w3
+    if _w3 is None:
+        _w3 = AsyncWeb3(metrics.instrument_provider(
+            PooledHTTPProvider(RPC_URL, hedge_after=RPC_HEDGE_AFTER), "indexer"
+        ))
+    return _w3
 
 # ---------- Database Connection Pool ----------
-offchain_pool = None  # Same as db_pool
+# Sizes for the standalone worker's pool; embedded in the API the indexer borrows the API's pool
+INDEXER_POOL_MIN_SIZE = int(os.getenv("INDEXER_POOL_MIN_SIZE", "1"))
+INDEXER_POOL_MAX_SIZE = int(os.getenv("INDEXER_POOL_MAX_SIZE", "4"))
+
+offchain_pool = None  # Own pool when standalone, the API's pool when embedded
 
-async def init_offchain_pool():
+async def init_offchain_pool(pool=None):
     global offchain_pool
-    offchain_pool = await asyncpg.create_pool(dsn=DB_DSN)
+    if pool is not None:
+        offchain_pool = pool
+        return
+    offchain_pool = await asyncpg.create_pool(
+        dsn=DB_DSN, min_size=INDEXER_POOL_MIN_SIZE, max_size=INDEXER_POOL_MAX_SIZE, init=metrics.sql_timer("offchain")
+    )
+    metrics.track_pool("offchain", offchain_pool)
     print("✅ Offchain DB connection pool initialized")
 
 @asynccontextmanager
@@ -62,167 +108,1235 @@ async def offchain_conn():
     async with offchain_pool.acquire() as conn:
         yield conn
 
-from eth_utils import event_abi_to_log_topic
+# ---------- Role Names ----------
+# Role hash → readable name, hashed once at import instead of per event
+ROLE_NAMES = {
+    bytes(Web3.keccak(text="FARMER_ROLE")): "FARMER_ROLE",
+    bytes(Web3.keccak(text="INSPECTOR_ROLE")): "INSPECTOR_ROLE",
+    bytes(Web3.keccak(text="RETAILER_ROLE")): "RETAILER_ROLE",
+    bytes(32): "DEFAULT_ADMIN_ROLE",
+}
 
-def get_event_abi_and_name_by_topic(log, abi):
-    topic0 = log['topics'][0]
-    for e in abi:
-        if e.get("type") == "event":
-            if event_abi_to_log_topic(e) == topic0:
-                return e, e["name"]
-    raise ValueError("⚠️ No matching event ABI for topic[0] = " + topic0.hex())
+# ---------- Event Decoding ----------
+@lru_cache(maxsize=4096)
+def _checksum(addr):
+    return Web3.to_checksum_address(addr)
 
-# ---------- Event Name Resolver ----------
-def parse_event(log, abi):
-    topic = log['topics'][0].hex()
-    for item in abi:
-        if item.get("type") == "event" and event_abi_to_log_topic(item).hex() == topic:
-            return item["name"]
-    return "UnknownEvent"
 
-# ---------- Main Event Sync Loop ----------
-async def sync_loop_async():
-    await init_offchain_pool()
-    print("🌀 Listening to blockchain events...")
+def _topic_decoder(codec, typ):
+    """Decoder for one indexed value; static word types are sliced directly instead of via the codec"""
+    if typ in ("string", "bytes") or typ.endswith("]"):
+        return lambda topic: topic  # Indexed dynamic values are only stored as their hash
+    if typ == "address":
+        return lambda topic: _checksum("0x" + bytes(topic[12:]).hex())
+    if typ.startswith("uint"):
+        return lambda topic: int.from_bytes(topic, "big")
+    if typ.startswith("int"):
+        return lambda topic: int.from_bytes(topic, "big", signed=True)
+    if typ == "bytes32":
+        return bytes
+    return lambda topic: codec.decode([typ], topic)[0]
+
+
+class EventDecoder:
+    """Decoder for a single event ABI with its topic and data layout resolved up front"""
+
+    def __init__(self, codec, event_abi, topic):
+        self.codec = codec
+        self.name = event_abi["name"]
+        self.topic = topic
+
+        inputs = event_abi.get("inputs", [])
+        self.topic_inputs = [(i["name"], _topic_decoder(codec, i["type"])) for i in inputs if i.get("indexed")]
+        self.data_names = [i["name"] for i in inputs if not i.get("indexed")]
+        self.data_types = [i["type"] for i in inputs if not i.get("indexed")]
+        self.address_names = [i["name"] for i in inputs if i["type"] == "address"]
+
+    def decode(self, log):
+        args = {}
+        for (name, decode_topic), topic in zip(self.topic_inputs, log["topics"][1:]):
+            args[name] = decode_topic(topic)
+        if self.data_types:
+            args.update(zip(self.data_names, self.codec.decode(self.data_types, log["data"])))
+        for name in self.address_names:
+            args[name] = _checksum(args[name])
+        return args
+
+# ---------- Change Set ----------
+class ChangeSet:
+    """Writes collected from one block range (or one shard of it), grouped by target table and applied set-based"""
+
+    def __init__(self):
+        self.logs = []      # (tx_hash, event_name, block_number, block_hash, log_index, args_json)
+        self.batches = {}   # batch_id → (batch_id, metadata, farmer, block_number)
+        self.stages = []    # (seq, batch_id, stage, location, ts_block, actor, block_number, log_index), in log order
+        self.owners = {}    # batch_id → owner after the last transfer in the range
+        self.roles = {}     # (address, role_name) → True if granted, False if revoked (last event wins)
+        self.blocks = {}    # block_number → block_hash of every block the range touched
+        self.reorg = False  # True for the ChangeSet describing a rollback
+        self.ancestor = None  # block a rollback returned to
+        self.touched = set()  # batch IDs of a ChangeSet rebuilt from the log journal
+        self.partitions = {}  # shard key → ChangeSet of the shard's events, in log order
+        self.events = []      # (log, event_name) of every event collected, kept to park a failed shard
+        self.error = None     # (index in events, exception) of a shard's first handler failure
+        self.failures = []    # (block_number, log_index, shard, event_name, log_json, reason, error) to park
+
+    def touched_batches(self):
+        """IDs of batches whose overview/owner changed in this range"""
+        return set(self.batches) | set(self.owners) | {row[1] for row in self.stages} | self.touched
+
+    def partition(self, shard):
+        if shard not in self.partitions:
+            self.partitions[shard] = ChangeSet()
+        return self.partitions[shard]
+
+    def merge(self, other):
+        """Add the writes of a ChangeSet of other shards; its stages are sequenced after this one's"""
+        self.logs += other.logs
+        self.batches.update(other.batches)
+        self.stages += [(len(self.stages) + i, *row[1:]) for i, row in enumerate(other.stages)]
+        self.owners.update(other.owners)
+        self.roles.update(other.roles)
+        self.blocks.update(other.blocks)
+        self.touched |= other.touched
+        self.failures += other.failures
+
+    def park(self, log, shard, event_name, reason, error=None):
+        self.failures.append((log["blockNumber"], log["logIndex"], shard, event_name,
+                              json.dumps(_rpc_log(log)), reason, None if error is None else str(error)))
+
+    def park_shard(self, shard, part, reason, error=None, culprit=0):
+        """Park every event of a shard's ChangeSet: the one at `culprit` with the failure, the rest behind it"""
+        for i, (log, event_name) in enumerate(part.events):
+            if i == culprit:
+                self.park(log, shard, event_name, reason, error)
+            else:
+                self.park(log, shard, event_name, "blocked")
+
+
+def shard_key(args):
+    """Events of one batch (or, for role events, one account) must be applied in log order"""
+    if "batchId" in args:
+        return f"batch:{args['batchId']}"
+    if "account" in args:
+        return f"account:{args['account']}"
+    return None
+
+
+def shard_bucket(shard):
+    """Write-back lock bucket of a shard; also decides which worker applies it"""
+    return zlib.crc32(shard.encode()) % WRITE_BACK_LOCK_BUCKETS
+
+
+def write_back_bucket(batch_id):
+    return shard_bucket(f"batch:{batch_id}")
+
+# ---------- Event Handlers ----------
+# Each handler receives the decoded args and the event's (block_number, log_index)
+def on_batch_registered(changes, args, position):
+    batch_id = args["batchId"]
+    owner = args["farmer"]
+    metadata = args["metadata"]
+
+    print(f"📦 BatchRegistered: {batch_id} ← {owner}")
+    changes.batches[batch_id] = (batch_id, metadata, owner, position[0])
+
+
+def on_role_granted(changes, args, position):
+    role = args["role"]
+    account = args["account"]
+
+    role_name = ROLE_NAMES.get(role)
+    if not role_name:
+        print(f"⚠️ Unrecognized role hash: {role.hex()}, skipped")
+        return
+
+    print(f"✅ Granted role: {account} ← {role_name}")
+    changes.roles[(account, role_name)] = True
+
+
+def on_role_revoked(changes, args, position):
+    role = args["role"]
+    account = args["account"]
+
+    role_name = ROLE_NAMES.get(role)
+    if not role_name:
+        print(f"⚠️ Unrecognized role hash: {role.hex()}, revoke skipped")
+        return
+
+    print(f"❎ Revoked role: {account} → {role_name}")
+    changes.roles[(account, role_name)] = False
+
+
+def on_stage_recorded(changes, args, position):
+    batch_id = args["batchId"]
+    stage = args["stage"]
+    location = args["location"]
+    timestamp = args["timestamp"]
+    actor = args["actor"]
+
+    ts_block = datetime.utcfromtimestamp(timestamp)
+
+    print(f"📍 StageRecorded: Batch {batch_id} - Stage {stage} @ {location} by {actor}")
+    changes.stages.append((len(changes.stages), batch_id, stage, location, ts_block, actor, *position))
+
+
+def on_ownership_transferred(changes, args, position):
+    batch_id = args["batchId"]
+    from_addr = args["from"]
+    to_addr = args["to"]
+
+    print(f"🔁 OwnershipTransferred: Batch {batch_id} - {from_addr} → {to_addr}")
+    changes.owners[batch_id] = to_addr
+
+
+EVENT_HANDLERS = {
+    "BatchRegistered": on_batch_registered,
+    "RoleGranted": on_role_granted,
+    "RoleGrantedLogged": on_role_granted,
+    "RoleRevoked": on_role_revoked,
+    "RoleRevokedLogged": on_role_revoked,
+    "StageRecorded": on_stage_recorded,
+    "OwnershipTransferred": on_ownership_transferred,
+}
+
+# ---------- Dispatch Registry ----------
+def build_dispatch(codec, contracts):
+    """Map (contract address, topic0) → (decoder, handler) for every event of the given (address, contract name)"""
+    table = {}
+    for address, name in contracts:
+        topics = event_topics(name)
+        for item in load_abi(name):
+            if item.get("type") != "event":
+                continue
+            decoder = EventDecoder(codec, item, topics[item["name"]])
+            table[(address.lower(), decoder.topic)] = (decoder, EVENT_HANDLERS.get(decoder.name))
+    return table
+
+
+@lru_cache(maxsize=None)
+def get_dispatch():
+    """Dispatch table of the configured deployment, built once per process (and per backfill worker)"""
+    return build_dispatch(get_w3().codec, deployment().named_contracts())
+
+# ---------- Block Cursor ----------
+async def load_cursor(conn):
+    """Last fully processed block; START_BLOCK - 1 before the first run"""
+    row = await conn.fetchrow("SELECT last_block FROM sync_state WHERE name = $1", CURSOR_NAME)
+    return row["last_block"] if row else START_BLOCK - 1
+
+async def claim_cursor(conn, expected, share=False):
+    """Lock the cursor row for this transaction (shared among a range's workers); fails if another
+    indexer moved it since it was read"""
+    current = await conn.fetchval(
+        f"SELECT last_block FROM sync_state WHERE name = $1 FOR {'SHARE' if share else 'UPDATE'}", CURSOR_NAME
+    )
+    if current is not None and current != expected:
+        raise RuntimeError(f"Cursor moved from {expected} to {current} by another indexer")
+
+async def save_cursor(conn, block):
+    await conn.execute("""
+        INSERT INTO sync_state (name, last_block, updated_at)
+        VALUES ($1, $2, NOW())
+        ON CONFLICT (name) DO UPDATE SET last_block = EXCLUDED.last_block, updated_at = NOW()
+    """, CURSOR_NAME, block)
+
+# ---------- Per-Range Processing ----------
+def _json_default(value):
+    if isinstance(value, bytes):
+        return Web3.to_hex(value)
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _rpc_log(log):
+    """JSON-RPC form of a fetched log, as stored in event_failures (and read back with _raw_log)"""
+    return {
+        "address": log["address"],
+        "topics": [Web3.to_hex(t) for t in log["topics"]],
+        "data": Web3.to_hex(log["data"]),
+        "transactionHash": Web3.to_hex(log["transactionHash"]),
+        "blockHash": Web3.to_hex(log["blockHash"]),
+        "blockNumber": hex(log["blockNumber"]),
+        "logIndex": hex(log["logIndex"]),
+    }
+
+
+def collect_changes(logs):
+    """Decode a block range of logs into a ChangeSet partitioned by shard; no database access.
+
+    Each shard's events are handled in log order into changes.partitions[shard]. After a handler
+    failure a shard only collects its remaining events, so it can be parked whole. Events that fail
+    to decode, and events without a shard whose handler fails, are parked alone in changes.failures."""
+    changes = ChangeSet()
+    dispatch = get_dispatch()
+    for log in logs:
+        tx_hash = log["transactionHash"].hex()
+        entry = dispatch.get((log["address"].lower(), bytes(log["topics"][0])))
+        if entry is None:
+            print(f"⚠️ No matching event ABI for topic[0] = {log['topics'][0].hex()} @ {tx_hash}")
+            continue
+
+        decoder, handler = entry
+        position = (log["blockNumber"], log["logIndex"])
+        block_hash = Web3.to_hex(log["blockHash"])
+        changes.blocks[position[0]] = block_hash
+        print(f"[Blockchain Event] {decoder.name} @ {tx_hash}")
+
+        try:
+            args = decoder.decode(log)
+        except Exception as e:
+            print(f"❌ Failed to decode {decoder.name} event: {e}")
+            changes.park(log, None, decoder.name, "decode", e)
+            continue
+
+        shard = shard_key(args)
+        target = changes if shard is None else changes.partition(shard)
+        target.events.append((log, decoder.name))
+        # The log journal keeps decoded args so a reorg can be rolled back from it
+        target.logs.append((tx_hash, decoder.name, position[0], block_hash, position[1],
+                            json.dumps(args, default=_json_default)))
+
+        if handler is None or target.error is not None:
+            continue
+        try:
+            handler(target, args, position)
+        except Exception as e:
+            print(f"❌ Failed to process {decoder.name} event: {e}")
+            if shard is None:
+                target.logs.pop()
+                changes.park(log, None, decoder.name, "handler", e)
+            else:
+                target.error = (len(target.events) - 1, e)
+    return changes
+
+
+STAGING_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS log_staging (
+        tx_hash       TEXT,
+        event_name    TEXT,
+        block_number  BIGINT,
+        block_hash    TEXT,
+        log_index     INT,
+        args          JSONB
+    ) ON COMMIT DELETE ROWS;
+
+    CREATE TEMP TABLE IF NOT EXISTS stage_staging (
+        seq           INT,
+        batch_id      BIGINT,
+        stage         INT,
+        location      TEXT,
+        ts_block      TIMESTAMP,
+        actor         TEXT,
+        block_number  BIGINT,
+        log_index     INT
+    ) ON COMMIT DELETE ROWS;
+
+    -- Several shards may be applied one after another in a transaction
+    TRUNCATE log_staging, stage_staging;
+"""
+
+async def apply_changes(conn, changes):
+    """Write a ChangeSet with one statement per table; must run inside a transaction holding the
+    write-back locks of its batches. Applying the same ChangeSet again changes nothing."""
+    await conn.execute(STAGING_DDL)
+
+    if changes.logs:
+        await conn.copy_records_to_table("log_staging", records=changes.logs)
+        await conn.execute("""
+            INSERT INTO logs (tx_hash, event_name, block_number, block_hash, log_index, args)
+            SELECT tx_hash, event_name, block_number, block_hash, log_index, args FROM log_staging
+            ON CONFLICT DO NOTHING
+        """)
+
+    if changes.batches:
+        await conn.executemany("""
+            INSERT INTO batches (batch_id, metadata, current_owner, farmer, block_number)
+            VALUES ($1, $2, $3, $3, $4)
+            ON CONFLICT (batch_id) DO UPDATE
+            SET metadata = EXCLUDED.metadata, current_owner = EXCLUDED.current_owner, farmer = EXCLUDED.farmer,
+                block_number = EXCLUDED.block_number, provisional = FALSE
+        """, list(changes.batches.values()))
+
+    if changes.stages:
+        await conn.copy_records_to_table("stage_staging", records=changes.stages)
+        # Stages the API wrote back from chain reads are replaced by the indexed ones; a batch that is
+        # still provisional here was registered before START_BLOCK, so it goes too and is re-read on demand
+        await conn.execute("""
+            DELETE FROM stages WHERE provisional AND batch_id IN (SELECT batch_id FROM stage_staging)
+        """)
+        await conn.execute("""
+            DELETE FROM batches b
+            WHERE b.provisional AND b.batch_id IN (SELECT batch_id FROM stage_staging)
+              AND NOT EXISTS (SELECT 1 FROM stages s WHERE s.batch_id = b.batch_id)
+        """)
+        # stage_index continues each batch's stages[] position; stages of batches registered
+        # before START_BLOCK have no parent row and are skipped like the FK would, and stages
+        # already stored by an interrupted attempt at this range are not stored twice
+        status = await conn.execute("""
+            INSERT INTO stages (batch_id, stage_index, stage, location, ts_block, actor, block_number, log_index)
+            SELECT s.batch_id,
+                   COALESCE(last.stage_index, -1) + ROW_NUMBER() OVER (PARTITION BY s.batch_id ORDER BY s.seq),
+                   s.stage, s.location, s.ts_block, s.actor, s.block_number, s.log_index
+            FROM stage_staging s
+            LEFT JOIN LATERAL (
+                SELECT MAX(x.stage_index) AS stage_index FROM stages x WHERE x.batch_id = s.batch_id
+            ) last ON TRUE
+            WHERE EXISTS (SELECT 1 FROM batches b WHERE b.batch_id = s.batch_id)
+              AND NOT EXISTS (
+                  SELECT 1 FROM stages x
+                  WHERE x.block_number = s.block_number AND x.log_index = s.log_index
+              )
+            ORDER BY s.seq
+        """)
+        await conn.execute("""
+            UPDATE batches b
+            SET latest_stage = last.stage
+            FROM (
+                SELECT DISTINCT ON (batch_id) batch_id, stage
+                FROM stage_staging
+                ORDER BY batch_id, seq DESC
+            ) last
+            WHERE b.batch_id = last.batch_id
+        """)
+        skipped = len(changes.stages) - int(status.split()[-1])
+        if skipped:
+            print(f"⚠️ Skipped {skipped} stage(s) of unknown or already indexed batches")
+
+    if changes.owners:
+        await conn.executemany("""
+            UPDATE batches
+            SET current_owner = $1
+            WHERE batch_id = $2
+        """, [(owner, batch_id) for batch_id, owner in changes.owners.items()])
+
+    granted = [key for key, is_granted in changes.roles.items() if is_granted]
+    revoked = [key for key, is_granted in changes.roles.items() if not is_granted]
+    if granted:
+        await conn.executemany("""
+            INSERT INTO user_roles (address, role_name)
+            VALUES ($1, $2)
+            ON CONFLICT (address, role_name) DO NOTHING
+        """, granted)
+    if revoked:
+        await conn.executemany("""
+            DELETE FROM user_roles
+            WHERE address = $1 AND role_name = $2
+        """, revoked)
+
+    await park_events(conn, changes.failures)
+
+    if changes.blocks:
+        await conn.executemany("""
+            INSERT INTO indexed_blocks (block_number, block_hash)
+            VALUES ($1, $2)
+            ON CONFLICT (block_number) DO UPDATE SET block_hash = EXCLUDED.block_hash
+        """, list(changes.blocks.items()))
+        await conn.execute(
+            "DELETE FROM indexed_blocks WHERE block_number < $1",
+            max(changes.blocks) - REORG_MAX_DEPTH
+        )
+
+    await refresh_documents(conn, changes.touched_batches())
+
+
+async def park_events(conn, failures):
+    if not failures:
+        return
+    await conn.executemany("""
+        INSERT INTO event_failures (block_number, log_index, shard, event_name, log, reason, error, next_attempt_at)
+        VALUES ($1, $2, $3, $4, $5::JSONB, $6, $7, NOW() + $8 * INTERVAL '1 second')
+        ON CONFLICT (block_number, log_index) DO NOTHING
+    """, [(*failure, EVENT_RETRY_BASE) for failure in failures])
+    print(f"⚠️ Parked {len(failures)} event(s) in event_failures")
+
+# ---------- Sharded Apply ----------
+# Rows Postgres refuses (a NUL in a string, a constraint violation) fail the same way on every retry,
+# so they park their shard; anything else (connection loss, a moved cursor) fails the whole range
+REJECTED_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+async def lock_write_backs(conn, shards=None):
+    """Hold the write-back lock buckets of `shards` (every bucket if None) until the transaction ends"""
+    buckets = range(WRITE_BACK_LOCK_BUCKETS) if shards is None else {shard_bucket(s) for s in shards}
+    # Always in ascending order, so workers and a rollback can never wait on each other in a cycle
+    await conn.execute(
+        "SELECT pg_advisory_xact_lock($1, b) FROM unnest($2::INT[]) AS b", WRITE_BACK_LOCK_ID, sorted(buckets)
+    )
+
+
+async def apply_partitions(conn, partitions, blocked=frozenset()):
+    """Apply shard ChangeSets inside the caller's transaction, each shard all or nothing.
+
+    Shards in `blocked`, with a handler failure or with rows Postgres rejects are left out and their
+    events returned for parking. Returns (ChangeSet of what was applied, failures)."""
+    parked, ready = ChangeSet(), {}
+    for shard, part in partitions.items():
+        if shard in blocked:
+            parked.park_shard(shard, part, "blocked")
+        elif part.error is not None:
+            parked.park_shard(shard, part, "handler", part.error[1], part.error[0])
+        else:
+            ready[shard] = part
+    if not ready:
+        return ChangeSet(), parked.failures
+
+    # All shards at once in a savepoint; only if Postgres rejects a row, one savepoint per shard
+    applied = ChangeSet()
+    for part in ready.values():
+        applied.merge(part)
+    try:
+        async with conn.transaction():
+            await apply_changes(conn, applied)
+        return applied, parked.failures
+    except REJECTED_ERRORS as e:
+        print(f"⚠️ Rows of {len(ready)} shard(s) rejected ({e}), applying them one by one")
+
+    applied = ChangeSet()
+    for shard, part in ready.items():
+        try:
+            async with conn.transaction():
+                await apply_changes(conn, part)
+        except REJECTED_ERRORS as e:
+            print(f"❌ Failed to apply {shard}: {e}")
+            parked.park_shard(shard, part, "apply", e)
+            continue
+        applied.merge(part)
+    return applied, parked.failures
+
+
+async def apply_shards(partitions, cursor, blocked):
+    """Worker: apply one group of a range's shards in a transaction of its own connection"""
+    async with offchain_conn() as conn:
+        async with conn.transaction():
+            await claim_cursor(conn, cursor, share=True)
+            await lock_write_backs(conn, partitions)
+            applied, failures = await apply_partitions(conn, partitions, blocked)
+            await park_events(conn, failures)
+    return applied, failures
+
+
+async def apply_range(changes, cursor, from_block, to_block):
+    """Apply a collected range on top of `cursor`, then move the cursor to `to_block` and announce the range.
+
+    Shards are spread over INDEXER_WORKERS connections by their lock bucket, so a batch's events stay in
+    order on one of them. The cursor commits last, with the block checkpoints and the events without a
+    shard; a range interrupted before that is applied again in full, which every write tolerates.
+    Returns the ChangeSet actually applied, with the events parked instead in its failures."""
+    async with offchain_conn() as conn:
+        blocked = await blocked_shards(conn)
+    groups = [{} for _ in range(INDEXER_WORKERS)]
+    for shard, part in changes.partitions.items():
+        groups[shard_bucket(shard) % INDEXER_WORKERS][shard] = part
+    # Every worker finishes before a failure propagates, so none is still writing when the range is retried
+    results = await asyncio.gather(
+        *(apply_shards(group, cursor, blocked) for group in groups if group), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+    async with offchain_conn() as conn:
+        async with conn.transaction():
+            await claim_cursor(conn, cursor)
+            await apply_changes(conn, changes)
+            await save_cursor(conn, to_block)
+            await announce_changes(conn, **{"from": from_block, "to": to_block})
+
+    applied = ChangeSet()
+    applied.merge(changes)
+    for part, failures in results:
+        applied.merge(part)
+        applied.failures += failures
+    applied.logs.sort(key=lambda row: (row[2], row[4]))  # streamed in log order
+    return applied
+
+# ---------- Batch Documents ----------
+# Rendered from the normalised tables, so a document is always exactly what they say after the write
+DOCUMENT_SQL = """
+    INSERT INTO batch_documents (batch_id, document, block_number, block_hash)
+    SELECT b.batch_id,
+           jsonb_build_object(
+               'overview', jsonb_build_object(
+                   'batch_id', b.batch_id,
+                   'metadata', b.metadata,
+                   'current_owner', b.current_owner,
+                   'created_at', b.created_at
+               ),
+               'farmer', b.farmer,
+               'latest_stage', b.latest_stage,
+               'stages', COALESCE((
+                   SELECT jsonb_agg(jsonb_build_object(
+                       'stage', s.stage,
+                       'location', s.location,
+                       'timestamp', s.ts_block,
+                       'actor', s.actor
+                   ) ORDER BY s.stage_index)
+                   FROM stages s WHERE s.batch_id = b.batch_id
+               ), '[]'::jsonb)
+           ),
+           last.block_number, last.block_hash
+    FROM batches b
+    LEFT JOIN LATERAL (
+        SELECT l.block_number, l.block_hash
+        FROM logs l
+        WHERE (l.args->>'batchId')::BIGINT = b.batch_id
+        ORDER BY l.block_number DESC, l.log_index DESC
+        LIMIT 1
+    ) last ON TRUE
+    {where}
+    ON CONFLICT (batch_id) DO UPDATE
+    SET document = EXCLUDED.document, block_number = EXCLUDED.block_number,
+        block_hash = EXCLUDED.block_hash, updated_at = NOW()
+"""
+
+
+async def refresh_documents(conn, batch_ids):
+    """Re-render the documents of `batch_ids` and drop those whose batch is gone; call in the writing transaction"""
+    if not batch_ids:
+        return
+    batch_ids = sorted(batch_ids)
+    await conn.execute(DOCUMENT_SQL.format(where="WHERE b.batch_id = ANY($1::BIGINT[])"), batch_ids)
+    await conn.execute("""
+        DELETE FROM batch_documents d
+        WHERE d.batch_id = ANY($1::BIGINT[])
+          AND NOT EXISTS (SELECT 1 FROM batches b WHERE b.batch_id = d.batch_id)
+    """, batch_ids)
+
+
+async def rebuild_documents():
+    """Regenerate every batch document from the normalised tables (indexer must be stopped)"""
+    lock_conn = await try_leader_lock()
+    if lock_conn is None:
+        print("⛔ Another indexer is running (leader lock held); stop it before rebuilding documents")
+        return
+    try:
+        await init_offchain_pool()
+        async with offchain_conn() as conn:
+            await migrate(conn)
+            async with conn.transaction():
+                await conn.execute("DELETE FROM batch_documents")
+                status = await conn.execute(DOCUMENT_SQL.format(where=""))
+        print(f"✅ Rebuilt {status.split()[-1]} batch documents")
+    finally:
+        await lock_conn.close()
+
+# ---------- Reorg Handling ----------
+async def chain_hash(number, head):
+    """Canonical hash of block `number`, reusing the head header when possible; None if it no longer exists"""
+    if number == head["number"]:
+        return Web3.to_hex(head["hash"])
+    if number == head["number"] - 1:
+        return Web3.to_hex(head["parentHash"])
+    if number > head["number"]:
+        return None
+    try:
+        return Web3.to_hex((await get_w3().eth.get_block(number))["hash"])
+    except Exception:
+        return None
+
+
+async def find_common_ancestor(conn, head):
+    """Highest recorded block whose hash still matches the canonical chain"""
+    rows = await conn.fetch(
+        "SELECT block_number, block_hash FROM indexed_blocks ORDER BY block_number DESC LIMIT $1",
+        REORG_MAX_DEPTH
+    )
+    for row in rows:
+        if await chain_hash(row["block_number"], head) == row["block_hash"]:
+            return row["block_number"]
+    print(f"⚠️ Reorg deeper than the {len(rows)} recorded block hashes; rolling back all of them")
+    return rows[-1]["block_number"] - 1 if rows else START_BLOCK - 1
+
+
+async def rollback_to(conn, ancestor):
+    """Undo every event above `ancestor` using the log journal; must run inside a transaction"""
+    changes = ChangeSet()
+    changes.reorg = True
+    changes.ancestor = ancestor
+    await lock_write_backs(conn)
+
+    # Owner before a batch's first orphaned transfer is that transfer's `from`
+    owners = await conn.fetch("""
+        SELECT DISTINCT ON ((args->>'batchId')::BIGINT)
+               (args->>'batchId')::BIGINT AS batch_id, args->>'from' AS owner
+        FROM logs
+        WHERE block_number > $1 AND event_name = 'OwnershipTransferred'
+        ORDER BY (args->>'batchId')::BIGINT, block_number, log_index
+    """, ancestor)
+    # RoleGranted/RoleRevoked only fire on a state change, so the first orphaned one tells the prior state
+    roles = await conn.fetch("""
+        SELECT DISTINCT ON (args->>'account', args->>'role')
+               args->>'account' AS account, args->>'role' AS role, event_name
+        FROM logs
+        WHERE block_number > $1 AND event_name IN ('RoleGranted', 'RoleRevoked')
+        ORDER BY args->>'account', args->>'role', block_number, log_index
+    """, ancestor)
+
+    orphaned = await conn.fetch("""
+        DELETE FROM stages
+        WHERE block_number > $1
+           OR batch_id IN (SELECT batch_id FROM batches WHERE block_number > $1)
+        RETURNING batch_id
+    """, ancestor)
+    # Rows written back from chain reads may describe the abandoned branch; they are re-read on demand
+    orphaned += await conn.fetch("DELETE FROM stages WHERE provisional RETURNING batch_id")
+    removed = await conn.fetch("""
+        DELETE FROM batches b
+        WHERE b.block_number > $1
+           OR (b.provisional AND NOT EXISTS (SELECT 1 FROM stages s WHERE s.batch_id = b.batch_id))
+        RETURNING batch_id
+    """, ancestor)
+    if orphaned:
+        await conn.execute("""
+            UPDATE batches b
+            SET latest_stage = (
+                SELECT s.stage FROM stages s WHERE s.batch_id = b.batch_id ORDER BY s.stage_index DESC LIMIT 1
+            )
+            WHERE b.batch_id = ANY($1::BIGINT[])
+        """, list({r["batch_id"] for r in orphaned}))
+    if owners:
+        await conn.executemany(
+            "UPDATE batches SET current_owner = $1 WHERE batch_id = $2",
+            [(r["owner"], r["batch_id"]) for r in owners]
+        )
+
+    for r in roles:
+        role_name = ROLE_NAMES.get(bytes.fromhex(r["role"][2:]))
+        if not role_name:
+            continue
+        if r["event_name"] == "RoleGranted":
+            await conn.execute(
+                "DELETE FROM user_roles WHERE address = $1 AND role_name = $2",
+                r["account"], role_name
+            )
+        else:
+            await conn.execute("""
+                INSERT INTO user_roles (address, role_name)
+                VALUES ($1, $2)
+                ON CONFLICT (address, role_name) DO NOTHING
+            """, r["account"], role_name)
+        changes.roles[(r["account"], role_name)] = r["event_name"] == "RoleRevoked"
+
+    await conn.execute("DELETE FROM logs WHERE block_number > $1", ancestor)
+    await conn.execute("DELETE FROM indexed_blocks WHERE block_number > $1", ancestor)
+    await conn.execute("DELETE FROM event_failures WHERE block_number > $1", ancestor)
+    await save_cursor(conn, ancestor)
+
+    for r in owners:
+        changes.owners[r["batch_id"]] = r["owner"]
+    for r in list(orphaned) + list(removed):
+        changes.owners.setdefault(r["batch_id"], None)
+    await refresh_documents(conn, changes.touched_batches())
+    return changes
+
+# ---------- Applied-Change Listeners ----------
+# Callbacks run with each ChangeSet right after its transaction commits (e.g. API cache invalidation)
+change_listeners = []
+
+def add_change_listener(callback):
+    change_listeners.append(callback)
+
+def notify_change_listeners(changes):
+    for callback in change_listeners:
+        try:
+            callback(changes)
+        except Exception as e:
+            print(f"❌ Change listener {callback.__name__} failed: {e}")
+
+# ---------- Cross-Process Change Announcements ----------
+# The ingesting instance NOTIFYs inside its apply transaction, so the announcement is delivered
+# exactly when the rows become visible; other processes rebuild the ChangeSet from the log journal
+async def announce_changes(conn, **range_info):
+    await conn.execute("SELECT pg_notify($1, $2)", CHANGES_CHANNEL,
+                       json.dumps({"origin": INSTANCE_ID, **range_info}))
+
+
+JOURNAL_SQL = """
+    SELECT tx_hash, event_name, block_number, block_hash, log_index, args::TEXT AS args
+    FROM logs
+    WHERE {where}
+    ORDER BY block_number, log_index
+"""
+
+
+def _journal_change_set(rows):
+    changes = ChangeSet()
+    for r in rows:
+        changes.logs.append(tuple(r))
+        batch_id = json.loads(r["args"]).get("batchId")
+        if batch_id is not None:
+            changes.touched.add(batch_id)
+    return changes
+
+
+async def journal_changes(conn, from_block, to_block):
+    """ChangeSet carrying the journal rows of [from_block, to_block] and the batches they touched"""
+    rows = await conn.fetch(JOURNAL_SQL.format(where="block_number BETWEEN $1 AND $2"), from_block, to_block)
+    return _journal_change_set(rows)
+
+
+async def journal_events(conn, positions):
+    """ChangeSet carrying the journal rows at `positions` ([block_number, log_index] pairs), e.g. replayed events"""
+    rows = await conn.fetch(
+        JOURNAL_SQL.format(where="(block_number, log_index) IN (SELECT * FROM unnest($1::BIGINT[], $2::INT[]))"),
+        [p[0] for p in positions], [p[1] for p in positions]
+    )
+    return _journal_change_set(rows)
+
+
+async def listen_for_changes(pool=None):
+    """Feed change listeners with ranges committed by indexers in other processes; runs forever"""
+    if offchain_pool is None:
+        await init_offchain_pool(pool)
+    announcements = asyncio.Queue()
+
+    def on_notify(conn, pid, channel, payload):
+        announcements.put_nowait(json.loads(payload))
 
     while True:
+        listen_conn = None
         try:
-            logs = w3.eth.get_logs({
-                "fromBlock": "latest",
-                "address": [PERM_ADDR, TRACE_ADDR]
-            })
-
-            async with offchain_conn() as conn:
-                for log in logs:
-                    contract_addr = log["address"]
-                    abi = perm_abi if contract_addr.lower() == PERM_ADDR.lower() else trace_abi
-                    tx_hash = log["transactionHash"].hex()
-
-                    # 👇 Per-log handling
-                    event_abi, event_name = get_event_abi_and_name_by_topic(log, abi)
-                    event_data = get_event_data(w3.codec, event_abi, log)
-                    print(f"[Blockchain Event] {event_name} @ {tx_hash}")
-
-                    # ✅ Insert into log table
-                    await conn.execute(
-                        "INSERT INTO logs (tx_hash, event_name) VALUES ($1, $2) ON CONFLICT DO NOTHING",
-                        tx_hash, event_name
-                    )
-
-                    # ✅ Event Dispatch
-                    if event_name == "BatchRegistered":
-                        try:
-                            args = event_data["args"]
-                            batch_id = args["batchId"]
-                            owner = args["farmer"]
-                            metadata = args["metadata"]
-
-                            print(f"📦 BatchRegistered: {batch_id} ← {owner}")
-                            await conn.execute("""
-                                INSERT INTO batches (batch_id, metadata, current_owner)
-                                VALUES ($1, $2, $3)
-                                ON CONFLICT (batch_id) DO UPDATE SET current_owner = EXCLUDED.current_owner
-                            """, batch_id, metadata, owner)
-
-                        except Exception as e:
-                            print(f"❌ Failed to process BatchRegistered event: {e}")
-
-
-                    elif event_name.startswith("RoleGranted"):
-                        try:
-                            args = event_data["args"]
-                            role = args["role"]
-                            account = args["account"]
-
-                            # ✅ Role hash mapping to readable names
-                            role_map = {
-                                Web3.keccak(text="FARMER_ROLE"): "FARMER_ROLE",
-                                Web3.keccak(text="INSPECTOR_ROLE"): "INSPECTOR_ROLE",
-                                Web3.keccak(text="RETAILER_ROLE"): "RETAILER_ROLE",
-                                bytes(32): "DEFAULT_ADMIN_ROLE",
-                            }
-
-                            role_name = role_map.get(role)
-                            if not role_name:
-                                print(f"⚠️ Unrecognized role hash: {role.hex()}, skipped")
-                            else:
-                                print(f"✅ Granted role: {account} ← {role_name}")
-                                await conn.execute("""
-                                    INSERT INTO user_roles (address, role_name)
-                                    VALUES ($1, $2)
-                                    ON CONFLICT (address, role_name) DO NOTHING
-                                """, account, role_name)
-
-                        except Exception as e:
-                            print(f"❌ Failed to process RoleGranted event: {e}")
-
-                    elif event_name.startswith("RoleRevoked"):
-                        try:
-                            args = event_data["args"]
-                            role = args["role"]
-                            account = args["account"]
-
-                            role_map = {
-                                Web3.keccak(text="FARMER_ROLE"): "FARMER_ROLE",
-                                Web3.keccak(text="INSPECTOR_ROLE"): "INSPECTOR_ROLE",
-                                Web3.keccak(text="RETAILER_ROLE"): "RETAILER_ROLE",
-                                bytes(32): "DEFAULT_ADMIN_ROLE",
-                            }
-
-                            role_name = role_map.get(role)
-                            if not role_name:
-                                print(f"⚠️ Unrecognized role hash: {role.hex()}, revoke skipped")
-                            else:
-                                print(f"❎ Revoked role: {account} → {role_name}")
-                                await conn.execute("""
-                                    DELETE FROM user_roles
-                                    WHERE address = $1 AND role_name = $2
-                                """, account, role_name)
-
-                        except Exception as e:
-                            print(f"❌ Failed to process RoleRevoked event: {e}")
-
-                    elif event_name == "StageRecorded":
-                        try:
-                            args = event_data["args"]
-                            batch_id = args["batchId"]
-                            stage = args["stage"]
-                            location = args["location"]
-                            timestamp = args["timestamp"]
-                            actor = args["actor"]
-
-                            from datetime import datetime
-                            ts_block = datetime.utcfromtimestamp(timestamp)
-
-                            print(f"📍 StageRecorded: Batch {batch_id} - Stage {stage} @ {location} by {actor}")
-
-                            await conn.execute("""
-                                INSERT INTO stages (batch_id, stage, location, ts_block, actor)
-                                VALUES ($1, $2, $3, $4, $5)
-                            """, batch_id, stage, location, ts_block, actor)
-
-                        except Exception as e:
-                            print(f"❌ Failed to process StageRecorded event: {e}")
-                    elif event_name == "OwnershipTransferred":
-                        try:
-                            args = event_data["args"]
-                            batch_id = args["batchId"]
-                            from_addr = args["from"]
-                            to_addr = args["to"]
-
-                            print(f"🔁 OwnershipTransferred: Batch {batch_id} - {from_addr} → {to_addr}")
-
-                            await conn.execute("""
-                                UPDATE batches
-                                SET current_owner = $1
-                                WHERE batch_id = $2
-                            """, to_addr, batch_id)
-
-                        except Exception as e:
-                            print(f"❌ Failed to process OwnershipTransferred event: {e}")
+            listen_conn = await asyncpg.connect(DB_DSN)
+            await listen_conn.add_listener(CHANGES_CHANNEL, on_notify)
+            while True:
+                info = await announcements.get()
+                if info["origin"] == INSTANCE_ID:
+                    continue  # already delivered in-process
+                if "ancestor" in info:
+                    changes = ChangeSet()
+                    changes.reorg = True
+                    changes.ancestor = info["ancestor"]
+                elif "replayed" in info:
+                    async with offchain_conn() as conn:  # parked events replayed below the cursor
+                        changes = await journal_events(conn, info["replayed"])
+                else:
+                    async with offchain_conn() as conn:
+                        changes = await journal_changes(conn, info["from"], info["to"])
+                notify_change_listeners(changes)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[⚠️ Change listener connection lost] {e}")
+            await asyncio.sleep(LEADER_RETRY_INTERVAL)
+        finally:
+            if listen_conn is not None:
+                listen_conn.terminate()
+
+# ---------- Parked Events ----------
+async def blocked_shards(conn):
+    """Shards with parked events: their new events are parked behind them to keep log order"""
+    rows = await conn.fetch("SELECT DISTINCT shard FROM event_failures WHERE shard IS NOT NULL")
+    return {r["shard"] for r in rows}
+
+
+async def retry_event_failures():
+    """Replay parked shards whose first event is due, in log order; returns the number of events applied.
+
+    A shard that still fails stays parked as a whole: its events back off exponentially and are left
+    for `retry-events` once its first one is out of EVENT_RETRY_LIMIT attempts. Runs in the leader's
+    loop, never alongside a range being applied."""
+    async with offchain_conn() as conn:
+        async with conn.transaction():
+            rows = await conn.fetch("""
+                SELECT block_number, log_index, shard, log::TEXT AS log, attempts,
+                       COALESCE(next_attempt_at <= NOW(), FALSE) AS due
+                FROM event_failures
+                ORDER BY block_number, log_index
+                LIMIT $1
+                FOR UPDATE
+            """, EVENT_RETRY_BATCH)
+            # A shard is due when its first parked event is; undecodable events stand alone
+            due, ready = {}, []
+            for r in rows:
+                if due.setdefault(r["shard"] or (r["block_number"], r["log_index"]), r["due"]):
+                    ready.append(r)
+            if ready:
+                changes = collect_changes([_raw_log(json.loads(r["log"])) for r in ready])
+                await lock_write_backs(conn, changes.partitions)
+                applied, failures = await apply_partitions(conn, changes.partitions)
+                failed = {(f[0], f[1]): f for f in changes.failures + failures}
+                # Events without a shard; failures stay parked (updated below), blocks were checkpointed before
+                changes.failures, changes.blocks = [], {}
+                await apply_changes(conn, changes)
+                applied.merge(changes)
+
+                replayed, retried = [], []
+                for r in ready:
+                    key = (r["block_number"], r["log_index"])
+                    if key not in failed:
+                        replayed.append(key)
+                        continue
+                    attempts = r["attempts"] + 1
+                    retried.append((*key, failed[key][5], failed[key][6], attempts >= EVENT_RETRY_LIMIT,
+                                    min(EVENT_RETRY_BASE * 2 ** attempts, EVENT_RETRY_MAX_DELAY)))
+
+                await conn.execute("""
+                    DELETE FROM event_failures
+                    WHERE (block_number, log_index) IN (SELECT * FROM unnest($1::BIGINT[], $2::INT[]))
+                """, [b for b, _ in replayed], [i for _, i in replayed])
+                await conn.executemany("""
+                    UPDATE event_failures
+                    SET attempts = attempts + 1, reason = $3, error = $4,
+                        next_attempt_at = CASE WHEN $5 THEN NULL ELSE NOW() + $6 * INTERVAL '1 second' END
+                    WHERE block_number = $1 AND log_index = $2
+                """, retried)
+                for i in range(0, len(replayed), ANNOUNCE_POSITIONS):
+                    await announce_changes(conn, replayed=replayed[i:i + ANNOUNCE_POSITIONS])
+            metrics.INDEXER_PARKED.set(await conn.fetchval("SELECT COUNT(*) FROM event_failures"))
+
+    if not ready:
+        return 0
+    applied.logs.sort(key=lambda row: (row[2], row[4]))
+    notify_change_listeners(applied)
+    print(f"🔁 Replayed {len(replayed)} parked event(s), {len(retried)} still failing")
+    return len(replayed)
+
+
+async def retry_events():
+    """Make every parked event due again, including those out of attempts; the leader replays them"""
+    await init_offchain_pool()
+    async with offchain_conn() as conn:
+        await migrate(conn)
+        status = await conn.execute("UPDATE event_failures SET attempts = 0, next_attempt_at = NOW()")
+    print(f"🔁 {status.split()[-1]} parked event(s) due for replay")
+
+# ---------- Main Event Sync Loop ----------
+def record_progress(head, cursor):
+    metrics.INDEXER_HEAD.set(head)
+    metrics.INDEXER_CURSOR.set(cursor)
+    metrics.INDEXER_LAG.set(max(head - cursor, 0))
+
+
+def check_log_hashes(logs, checkpoints):
+    """Fail unless the logs come from one branch that includes every checkpoint (block number → hash)"""
+    hashes = dict(checkpoints)
+    for log in logs:
+        number, block_hash = log["blockNumber"], Web3.to_hex(log["blockHash"])
+        if hashes.setdefault(number, block_hash) != block_hash:
+            raise RuntimeError(f"Logs of block {number} come from another branch than {hashes[number]}; "
+                               f"the chain reorganised while the range was fetched")
+
+
+async def sync_range_once():
+    """Index the next chunk of [cursor + 1, head]; returns (caught up with the head, logs ingested)"""
+    # Every read of a round goes to one endpoint, so the head, the logs and the checkpoint hashes all
+    # come from one view of the chain: an endpoint lagging behind another can then only delay ingestion
+    with get_w3().provider.pinned():
+        return await _sync_range_once()
+
+
+async def _sync_range_once():
+    head = await get_w3().eth.get_block("latest")
 
+    async with offchain_conn() as conn:
+        cursor = await load_cursor(conn)
+        known_hash = await conn.fetchval(
+            "SELECT block_hash FROM indexed_blocks WHERE block_number = $1", cursor
+        )
+    record_progress(head["number"], cursor)
 
+    if cursor > head["number"]:
+        # This endpoint has not reached blocks already indexed from another one; not a reorg
+        print(f"⏳ RPC endpoint at block {head['number']} is behind the cursor {cursor}, waiting")
+        return True, 0
+
+    # Ingest right at the head; a cursor block that is no longer canonical means a reorg
+    if known_hash is not None and await chain_hash(cursor, head) != known_hash:
+        async with offchain_conn() as conn:
+            async with conn.transaction():
+                await claim_cursor(conn, cursor)
+                ancestor = await find_common_ancestor(conn, head)
+                changes = await rollback_to(conn, ancestor)
+                await announce_changes(conn, ancestor=ancestor)
+        record_progress(head["number"], ancestor)
+        notify_change_listeners(changes)
+        print(f"🔀 Reorg detected at block {cursor}: rolled back to {ancestor}, re-indexing")
+        return False, 0
+
+    if cursor >= head["number"]:
+        return True, 0
+
+    from_block = cursor + 1
+    to_block = min(from_block + SYNC_CHUNK_SIZE - 1, head["number"])
+    # The range end's hash is read before its logs and checkpointed, so the next round can verify it is
+    # still canonical: logs fetched after a reorg past it come from a branch without this hash, which
+    # the next round then detects and rolls back
+    to_hash = await chain_hash(to_block, head)
+    if to_hash is None:
+        raise RuntimeError(f"Block {to_block} is not available from the RPC endpoint")
+    logs = await get_w3().eth.get_logs({
+        "fromBlock": from_block,
+        "toBlock": to_block,
+        "address": deployment().addresses
+    })
+    check_log_hashes(logs, {to_block: to_hash})
+
+    changes = collect_changes(logs)
+    changes.blocks[to_block] = to_hash
+
+    # The cursor only moves once every shard is applied or parked: a failed range is retried as a whole
+    applied = await apply_range(changes, cursor, from_block, to_block)
+
+    record_progress(head["number"], to_block)
+    notify_change_listeners(applied)
+    print(f"🧭 Synced blocks {from_block}-{to_block} ({len(logs)} logs, head {head['number']})")
+    return to_block >= head["number"], len(logs)
+
+
+# ---------- Push Subscription ----------
+async def subscribe_logs(wake, subscribed):
+    """Set `wake` whenever the node pushes a log of our contracts; reconnects with backoff.
+
+    Pushed logs are only a signal: the range poller still fetches and applies them, so ordering,
+    the cursor and reorg handling stay in one place and any gap while disconnected is filled."""
+    delay = SYNC_POLL_MIN_INTERVAL
+    while True:
+        try:
+            async with AsyncWeb3(WebSocketProvider(WS_RPC_URL)) as ws:
+                await ws.eth.subscribe("logs", {"address": deployment().addresses})
+                print(f"🔌 Subscribed to contract logs via {WS_RPC_URL}")
+                subscribed.set()
+                delay = SYNC_POLL_MIN_INTERVAL
+                wake.set()  # catch up on anything emitted while disconnected
+                async for _ in ws.socket.process_subscriptions():
+                    wake.set()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print("[⚠️ Event listener error]", e)
+            print(f"[⚠️ Log subscription dropped] {e}")
+        subscribed.clear()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, SYNC_POLL_INTERVAL)
+
+
+async def wait_for_wake(wake, timeout):
+    try:
+        await asyncio.wait_for(wake.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+# ---------- Indexer Loop ----------
+async def follow_chain():
+    """Ingest forever: chunk by chunk while behind, then woken by pushes or adaptive polling"""
+    print("🌀 Listening to blockchain events...")
+    wake, subscribed = asyncio.Event(), asyncio.Event()
+    subscriber = asyncio.ensure_future(subscribe_logs(wake, subscribed)) if WS_RPC_URL else None
+    interval = SYNC_POLL_MIN_INTERVAL
+    try:
+        while True:
+            wake.clear()
+            try:
+                caught_up, ingested = await sync_range_once()
+                if caught_up:
+                    await retry_event_failures()
+            except Exception as e:
+                print("[⚠️ Event listener error]", e)
+                caught_up, ingested = True, 0
+
+            # Keep pulling chunks back-to-back while behind; only idle at the head
+            if not caught_up:
+                continue
+            if subscribed.is_set():
+                # Pushes cover new events; the slow poll only re-checks the head for reorgs
+                interval = SYNC_POLL_INTERVAL
+            else:
+                # HTTP only: poll fast while events are arriving, back off towards SYNC_POLL_INTERVAL when idle
+                interval = SYNC_POLL_MIN_INTERVAL if ingested else min(interval * 2, SYNC_POLL_INTERVAL)
+            await wait_for_wake(wake, interval)
+    finally:
+        if subscriber is not None:
+            subscriber.cancel()
+
+
+async def try_leader_lock():
+    """Dedicated connection holding the indexer lock, or None if another instance holds it.
+
+    The lock is session-level on a connection outside any pool (pool release would unlock it),
+    so it is released by Postgres as soon as the holder exits or its connection drops."""
+    conn = await asyncpg.connect(DB_DSN)
+    if await conn.fetchval("SELECT pg_try_advisory_lock($1)", INDEXER_LOCK_ID):
+        return conn
+    await conn.close()
+    return None
+
+
+async def sync_loop_async(rpc_session=None, pool=None):
+    """Run the indexer forever as leader or standby.
+
+    Pass the API's aiohttp session and asyncpg pool to share them when embedded in the API."""
+    if rpc_session is not None:
+        await get_w3().provider.cache_async_session(rpc_session)
+    await init_offchain_pool(pool)
+    async with offchain_conn() as conn:
+        await migrate(conn)
+
+    # One lock connection per instance: a standby retries the lock on it instead of reconnecting
+    lock_conn = None
+    try:
+        while True:
+            try:
+                if lock_conn is None:
+                    lock_conn = await asyncpg.connect(DB_DSN)
+                if not await lock_conn.fetchval("SELECT pg_try_advisory_lock($1)", INDEXER_LOCK_ID):
+                    await asyncio.sleep(LEADER_RETRY_INTERVAL)
+                    continue
+
+                print(f"👑 Indexer leadership acquired ({INSTANCE_ID})")
+                follower = asyncio.ensure_future(follow_chain())
+                try:
+                    # Leadership lasts as long as the lock connection; check it and step down if it is gone
+                    while True:
+                        await asyncio.sleep(LEADER_RETRY_INTERVAL)
+                        await asyncio.wait_for(lock_conn.fetchval("SELECT 1"), LEADER_RETRY_INTERVAL)
+                finally:
+                    follower.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[⚠️ Indexer leadership lost] {e}")
+                # A broken session has released the lock; start over on a fresh connection
+                if lock_conn is not None:
+                    lock_conn.terminate()
+                    lock_conn = None
+                await asyncio.sleep(LEADER_RETRY_INTERVAL)
+    finally:
+        if lock_conn is not None:
+            lock_conn.terminate()
+
+# ---------- Historical Backfill ----------
+# Worker processes fetch and decode block chunks in parallel; the parent applies the resulting
+# ChangeSets strictly in block order through the same transaction as the live loop, so the
+# cursor advances chunk by chunk and an interrupted backfill resumes where it stopped
+_backfill_w3 = None
+
+
+def _init_backfill_worker():
+    global _backfill_w3
+    urls = split_rpc_urls(RPC_URL)
+    _backfill_w3 = Web3(Web3.HTTPProvider(urls[os.getpid() % len(urls)]))  # spread workers over the endpoints
+    sys.stdout = open(os.devnull, "w")  # per-event prints would dominate decode time
+
+
+def _raw_log(raw):
+    """Shape a raw JSON-RPC log like web3's formatted one, converting only the fields the decoder reads"""
+    return {
+        "address": raw["address"],
+        "topics": [HexBytes(t) for t in raw["topics"]],
+        "data": HexBytes(raw["data"]),
+        "transactionHash": HexBytes(raw["transactionHash"]),
+        "blockHash": HexBytes(raw["blockHash"]),
+        "blockNumber": int(raw["blockNumber"], 16),
+        "logIndex": int(raw["logIndex"], 16),
+    }
+
+
+def fetch_chunk(from_block, to_block):
+    """Worker: fetch and decode one block chunk into a ChangeSet"""
+    # Raw request: web3's generic result formatters cost more than decoding the events themselves
+    response = _backfill_w3.provider.make_request("eth_getLogs", [{
+        "fromBlock": hex(from_block),
+        "toBlock": hex(to_block),
+        "address": deployment().addresses
+    }])
+    if "error" in response:
+        raise RuntimeError(f"eth_getLogs {from_block}-{to_block} failed: {response['error']}")
+    changes = collect_changes([_raw_log(raw) for raw in response["result"]])
+    changes.blocks[to_block] = Web3.to_hex(_backfill_w3.eth.get_block(to_block)["hash"])
+    return from_block, to_block, changes
+
+
+async def backfill(from_block=None, to_block=None, workers=4, chunk_size=SYNC_CHUNK_SIZE):
+    lock_conn = await try_leader_lock()
+    if lock_conn is None:
+        print("⛔ Another indexer is running (leader lock held); stop it before backfilling")
+        return
+    try:
+        await _backfill(from_block, to_block, workers, chunk_size)
+    finally:
+        await lock_conn.close()
+
+
+async def _backfill(from_block, to_block, workers, chunk_size):
+    await init_offchain_pool()
+    async with offchain_conn() as conn:
+        await migrate(conn)
+        cursor = await load_cursor(conn)
+
+    if to_block is None:
+        to_block = await get_w3().eth.block_number
+    # Blocks are applied in order on top of the cursor; anything at or below it is already indexed
+    start = cursor + 1 if from_block is None else max(from_block, cursor + 1)
+    if from_block is not None and from_block <= cursor:
+        print(f"⏩ Blocks up to {cursor} already indexed, resuming from {start}")
+    elif start > cursor + 1:
+        # Moving the cursor past unindexed blocks would hide them from the live loop for good;
+        # only a first run may start later, like a higher START_BLOCK
+        if cursor != START_BLOCK - 1:
+            print(f"⛔ --from-block {from_block} would skip blocks {cursor + 1}-{start - 1} after the cursor; "
+                  f"omit it to resume from {cursor + 1}")
+            return
+        print(f"⚠️ First run starting at block {start}: blocks {START_BLOCK}-{start - 1} will not be indexed")
+    if start > to_block:
+        print(f"✅ Nothing to backfill (cursor at {cursor})")
+        return
+
+    chunks = iter([(b, min(b + chunk_size - 1, to_block)) for b in range(start, to_block + 1, chunk_size)])
+    total = to_block - start + 1
+    done = events = 0
+    started = time.monotonic()
+    print(f"🚚 Backfilling blocks {start}-{to_block} with {workers} workers")
+
+    loop = asyncio.get_event_loop()
+    with ProcessPoolExecutor(workers, initializer=_init_backfill_worker) as pool:
+        # Keep a couple of chunks per worker in flight while the parent writes
+        in_flight = deque(loop.run_in_executor(pool, fetch_chunk, *c) for c in islice(chunks, workers * 2))
+        while in_flight:
+            chunk_from, chunk_to, changes = await in_flight.popleft()
+            following = next(chunks, None)
+            if following is not None:
+                in_flight.append(loop.run_in_executor(pool, fetch_chunk, *following))
+
+            # Shards that failed in earlier chunks are parked at apply time, so decoding never waits on them
+            applied = await apply_range(changes, cursor, chunk_from, chunk_to)
+
+            cursor = chunk_to
+            done += chunk_to - chunk_from + 1
+            events += len(applied.logs)
+            elapsed = time.monotonic() - started
+            eta = elapsed / done * (total - done)
+            print(f"🧭 {chunk_to}/{to_block} ({done / total:.1%}) · {events} events · "
+                  f"{events / elapsed:.0f} events/s · ETA {eta:.0f}s")
+
+    print(f"✅ Backfilled {events} events in {time.monotonic() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m offchain", description="Fruit traceability indexer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("run", help="Run the indexer as a standalone worker (leader or standby)")
+
+    commands.add_parser("rebuild-documents", help="Regenerate every batch document from batches and stages")
+
+    commands.add_parser("retry-events", help="Make every parked event due for replay by the running indexer")
+
+    fill = commands.add_parser("backfill", help="Index a historical block range in parallel, then exit")
+    fill.add_argument("--from-block", type=int, help="First block (default: resume after the cursor); "
+                      "past the cursor only on a first run")
+    fill.add_argument("--to-block", type=int, help="Last block (default: current head)")
+    fill.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    fill.add_argument("--chunk-size", type=int, default=SYNC_CHUNK_SIZE, help="Blocks per eth_getLogs request")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        asyncio.run(sync_loop_async())
+    elif args.command == "rebuild-documents":
+        asyncio.run(rebuild_documents())
+    elif args.command == "retry-events":
+        asyncio.run(retry_events())
+    elif args.command == "backfill":
+        asyncio.run(backfill(args.from_block, args.to_block, args.workers, args.chunk_size))
+
 
-        await asyncio.sleep(10)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import asyncio
+import asyncpg
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env
+
+# ---------- Configuration ----------
+# init.sql only runs on a fresh volume; every later schema change is a numbered file in migrations/
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+MIGRATION_LOCK_ID = 64520001  # pg advisory lock serialising concurrent migrators
+
+DB_DSN = f"postgresql://{os.getenv('DB_USER', 'fruit_user')}:{os.getenv('DB_PASSWORD', 'fruit_pass')}@" \
+         f"{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'fruit_chain')}"
+
+
+def migration_files():
+    """(version, path) of every migration file, ordered by version"""
+    files = []
+    for path in MIGRATIONS_DIR.glob("*.sql"):
+        files.append((int(path.name.split("_", 1)[0]), path))
+    return sorted(files)
+
+
+async def migrate(conn):
+    """Apply migrations not yet recorded in schema_migrations, each in its own transaction"""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version     INT PRIMARY KEY,
+            name        TEXT NOT NULL,
+            applied_at  TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+    for version, path in migration_files():
+        async with conn.transaction():
+            # API workers and the indexer may start together; the lock makes the check-then-apply atomic
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_ID)
+            if await conn.fetchval("SELECT 1 FROM schema_migrations WHERE version = $1", version):
+                continue
+            await conn.execute(path.read_text(encoding="utf-8"))
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+                version, path.name
+            )
+        print(f"🗄️ Applied migration {path.name}")
+
+
+async def main():
+    conn = await asyncpg.connect(DB_DSN)
+    try:
+        await migrate(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
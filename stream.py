@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+# ---------- Event Stream Broker ----------
+class EventBroker:
+    """In-process fan-out of indexed events to streaming clients.
+
+    Each event is serialised once and the same string is queued for every subscriber of its topics,
+    so publishing costs one queue append per subscriber and no database access."""
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._subscribers = {}  # topic → set of queues
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, topic):
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic, queue):
+        queues = self._subscribers.get(topic)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[topic]
+
+    def publish(self, topics, item):
+        """Queue `item` for every subscriber of any of `topics`"""
+        self.published += 1
+        for topic in topics:
+            for queue in list(self._subscribers.get(topic, ())):
+                if queue.full():
+                    # A stalled client is cut off with a None sentinel; it resumes from its
+                    # last event id on reconnect
+                    self.dropped += 1
+                    self.unsubscribe(topic, queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+                    continue
+                queue.put_nowait(item)
+
+    def broadcast(self, item):
+        """Queue `item` for every subscriber, e.g. a reorg notice"""
+        self.publish(list(self._subscribers), item)
+
+    def stats(self):
+        return {
+            "topics": len(self._subscribers),
+            "subscribers": sum(len(q) for q in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+# ---------- Event Formatting ----------
+def event_id(block_number, log_index):
+    return f"{block_number}:{log_index}"
+
+
+def parse_event_id(value):
+    """Parse a "block:logIndex" (or bare block) cursor into a (block, log_index) position"""
+    block, _, index = value.partition(":")
+    return int(block), int(index) if index else -1
+
+
+def event_topics(event_name, args):
+    """Stream topics an event belongs to: its batch and the owner addresses it involves"""
+    topics = []
+    if "batchId" in args:
+        topics.append(("batch", int(args["batchId"])))
+    if event_name == "BatchRegistered":
+        topics.append(("owner", args["farmer"].lower()))
+    elif event_name == "OwnershipTransferred":
+        topics.append(("owner", args["from"].lower()))
+        topics.append(("owner", args["to"].lower()))
+    return topics
+
+
+def format_sse(event_name, block_number, log_index, tx_hash, args_json):
+    """One SSE frame; args_json is the journal's serialised args so it is not re-encoded per event"""
+    data = (f'{{"event": {json.dumps(event_name)}, "block_number": {block_number}, '
+            f'"log_index": {log_index}, "tx_hash": {json.dumps(tx_hash)}, "args": {args_json}}}')
+    return f"id: {event_id(block_number, log_index)}\nevent: {event_name}\ndata: {data}\n\n"
+
+
+def format_reorg(ancestor):
+    """Reorg notice; its id rewinds a resuming client to the first block after the common ancestor"""
+    return f"id: {event_id(ancestor + 1, -1)}\nevent: reorg\ndata: {{\"ancestor\": {ancestor}}}\n\n"
@@ -0,0 +1,223 @@
+"""
+Shared fixtures: logs synthesised from the contract ABIs, stand-in JSON-RPC nodes serving them, and a
+scratch database.
+
+The database tests use the Postgres server configured through DB_* (see benchmarks/suite.py); each
+test gets its own database from init.sql + migrations and is skipped when the server is unreachable.
+"""
+import asyncio
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# offchain reads its configuration at import time; these tests never contact the RPC URL
+os.environ["RPC_URL"] = "http://127.0.0.1:9/"
+os.environ["PERMISSION_ADDR"] = "0x" + "11" * 20
+os.environ["TRACE_ADDR"] = "0x" + "22" * 20
+os.environ["START_BLOCK"] = "1"
+
+import asyncpg  # noqa: E402
+from aiohttp import web  # noqa: E402
+from eth_utils import event_abi_to_log_topic  # noqa: E402
+from hexbytes import HexBytes  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from web3 import AsyncWeb3, Web3  # noqa: E402
+
+import offchain  # noqa: E402
+from benchmarks import suite  # noqa: E402
+from fruit_contracts.registry import deployment  # noqa: E402
+from fruit_contracts.rpcpool import PooledHTTPProvider  # noqa: E402
+from schema import migrate  # noqa: E402
+
+ALICE = Web3.to_checksum_address("0x" + "a1" * 20)
+BOB = Web3.to_checksum_address("0x" + "b2" * 20)
+FARMER_ROLE = bytes(Web3.keccak(text="FARMER_ROLE"))
+
+
+# ---------- Synthetic Logs ----------
+def _events():
+    events = {}
+    for address, abi in deployment().contracts():
+        for item in abi:
+            if item.get("type") == "event":
+                events.setdefault(item["name"], (address, item))
+    return events
+
+
+def make_log(event_name, block, index, **args):
+    """A fetched log of `event_name` at (block, index), encoded like the node would return it"""
+    address, abi = _events()[event_name]
+    codec = offchain.get_w3().codec
+    indexed = [i for i in abi["inputs"] if i["indexed"]]
+    plain = [i for i in abi["inputs"] if not i["indexed"]]
+    return {
+        "address": address,
+        "topics": [HexBytes(event_abi_to_log_topic(abi))]
+                  + [HexBytes(codec.encode([i["type"]], [args[i["name"]]])) for i in indexed],
+        "data": HexBytes(codec.encode([i["type"] for i in plain], [args[i["name"]] for i in plain])),
+        "transactionHash": HexBytes(Web3.keccak(text=f"tx-{block}-{index}")),
+        "blockHash": block_hash(block),
+        "blockNumber": block,
+        "logIndex": index,
+    }
+
+
+def block_hash(block):
+    return HexBytes(Web3.keccak(text=f"block-{block}"))
+
+
+def registered(block, index, batch_id, metadata="apples", farmer=ALICE):
+    return make_log("BatchRegistered", block, index, batchId=batch_id, farmer=farmer, metadata=metadata)
+
+
+def stage(block, index, batch_id, number, location="Orchard", actor=ALICE):
+    return make_log("StageRecorded", block, index, batchId=batch_id, stage=number,
+                    location=location, timestamp=1700000000 + block, actor=actor)
+
+
+def transferred(block, index, batch_id, from_addr, to_addr):
+    return make_log("OwnershipTransferred", block, index, batchId=batch_id, **{"from": from_addr, "to": to_addr})
+
+
+def role(event_name, block, index, account, role_hash=FARMER_ROLE, sender=ALICE):
+    return make_log(event_name, block, index, role=role_hash, account=account, sender=sender)
+
+
+async def index_block(conn, block, *logs):
+    """Index `logs` as block `block` on top of the stored cursor"""
+    await offchain.apply_range(offchain.collect_changes(list(logs)), await offchain.load_cursor(conn), block, block)
+
+# ---------- Stand-in Nodes ----------
+class StubNode:
+    """A JSON-RPC node serving blocks 0..head (hash block_hash(n) unless overridden) and the given logs,
+    answering every request after `delay` seconds"""
+
+    def __init__(self, head, logs=(), hashes=None, delay=0.0):
+        self.head = head
+        self.logs = list(logs)
+        self.hashes = dict(hashes or {})
+        self.delay = delay
+        self.calls = []  # method of every request, in order
+
+    def block_hash(self, number):
+        return Web3.to_hex(self.hashes.get(number) or block_hash(number))
+
+    def block(self, number):
+        return {
+            "number": hex(number), "hash": self.block_hash(number), "parentHash": self.block_hash(number - 1),
+            "timestamp": hex(1700000000 + number), "baseFeePerGas": hex(7), "transactions": [],
+        }
+
+    def get_logs(self, query):
+        first, last = int(query["fromBlock"], 16), int(query["toBlock"], 16)
+        return [{**offchain._rpc_log(log), "transactionIndex": "0x0", "removed": False}
+                for log in self.logs if first <= log["blockNumber"] <= last]
+
+    def answer(self, method, params):
+        if method == "eth_chainId":
+            return "0x1"
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            number = self.head if params[0] == "latest" else int(params[0], 16)
+            return self.block(number) if number <= self.head else None
+        if method == "eth_getLogs":
+            return self.get_logs(params[0])
+        raise ValueError(f"Unsupported method {method}")
+
+    async def handle(self, request):
+        body = await request.json()
+        self.calls.append(body["method"])
+        await asyncio.sleep(self.delay)
+        result = self.answer(body["method"], body["params"])
+        return web.json_response({"jsonrpc": "2.0", "id": body["id"], "result": result})
+
+
+async def serve(handler):
+    """Serve `handler` on a free local port; returns (runner, url)"""
+    app = web.Application()
+    app.router.add_post("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}/"
+
+
+@pytest.fixture
+def indexer_rpc(monkeypatch):
+    """Point the indexer's Web3 at stand-in nodes with `await indexer_rpc(*nodes, **provider options)`;
+    `await indexer_rpc.close()` before the event loop ends"""
+    runners, providers = [], []
+
+    async def connect(*nodes, **options):
+        urls = []
+        for node in nodes:
+            runner, url = await serve(node.handle)
+            runners.append(runner)
+            urls.append(url)
+        provider = PooledHTTPProvider(urls, **options)
+        providers.append(provider)
+        monkeypatch.setattr(offchain, "_w3", AsyncWeb3(provider))
+        return provider
+
+    async def close():
+        for provider in providers:
+            await provider.disconnect()
+        for runner in runners:
+            await runner.cleanup()
+
+    connect.close = close
+    return connect
+
+# ---------- Scratch Database ----------
+@pytest.fixture
+def scratch_db():
+    """Run `test(conn)` against a fresh database that offchain's pool also points at"""
+    name = f"fruit_test_{uuid.uuid4().hex[:8]}"
+
+    async def run(test):
+        try:
+            await suite.create_scratch_db(name)
+        except (OSError, asyncpg.PostgresError) as e:
+            pytest.skip(f"Postgres unavailable: {e}")
+        pool = await asyncpg.create_pool(suite.db_dsn(name), min_size=1, max_size=offchain.INDEXER_WORKERS + 2)
+        try:
+            async with pool.acquire() as conn:
+                await migrate(conn)
+            offchain.offchain_pool = pool
+            async with pool.acquire() as conn:
+                return await test(conn)
+        finally:
+            offchain.offchain_pool = None
+            await pool.close()
+            await suite.drop_scratch_db(name)
+
+    return lambda test: asyncio.run(run(test))
+
+
+def read_request(etag=None):
+    """A GET request to hand to a read route, revalidating `etag` if given"""
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+@pytest.fixture
+def api_db(scratch_db, monkeypatch):
+    """scratch_db with the API reading from it and empty read and negative caches"""
+    import api
+
+    monkeypatch.setattr(api, "read_cache", api.ReadCache())
+    monkeypatch.setattr(api, "not_found", api.ReadCache())
+
+    def run(test):
+        async def with_api(conn):
+            monkeypatch.setattr(api, "api_pool", offchain.offchain_pool)
+            return await test(conn)
+        return scratch_db(with_api)
+
+    return run
@@ -0,0 +1,63 @@
+import offchain
+from conftest import registered, stage
+
+
+async def parked(conn):
+    rows = await conn.fetch("SELECT block_number, log_index, shard, reason FROM event_failures ORDER BY 1, 2")
+    return [tuple(r) for r in rows]
+
+
+def test_rejected_rows_park_only_their_shard(scratch_db):
+    logs = [
+        registered(10, 0, 1, metadata="bad\x00metadata"),
+        stage(10, 1, 1, 0),
+        registered(10, 2, 2),
+        stage(10, 3, 2, 0),
+    ]
+
+    async def test(conn):
+        applied = await offchain.apply_range(offchain.collect_changes(logs), 0, 10, 10)
+        return applied, {
+            "batches": await conn.fetch("SELECT batch_id FROM batches"),
+            "logs": await conn.fetchval("SELECT COUNT(*) FROM logs"),
+            "parked": await parked(conn),
+            "cursor": await offchain.load_cursor(conn),
+        }
+
+    applied, state = scratch_db(test)
+
+    assert [r["batch_id"] for r in state["batches"]] == [2]
+    assert state["logs"] == 2  # parked events are not journaled
+    assert state["parked"] == [(10, 0, "batch:1", "apply"), (10, 1, "batch:1", "blocked")]
+    assert state["cursor"] == 10
+    assert [row[4] for row in applied.logs] == [2, 3]
+    assert len(applied.failures) == 2
+
+
+def test_new_events_of_a_parked_shard_wait_behind_it(scratch_db):
+    async def test(conn):
+        await offchain.park_events(conn, [(9, 0, "batch:1", "BatchRegistered", "{}", "handler", "boom")])
+        await offchain.apply_range(offchain.collect_changes([stage(10, 0, 1, 0), registered(10, 1, 2)]), 0, 10, 10)
+        return await parked(conn), await conn.fetchval("SELECT COUNT(*) FROM batches WHERE batch_id = 2")
+
+    failures, batch_2 = scratch_db(test)
+
+    assert failures == [(9, 0, "batch:1", "handler"), (10, 0, "batch:1", "blocked")]
+    assert batch_2 == 1
+
+
+def test_range_interrupted_before_the_cursor_is_applied_again_once(scratch_db):
+    logs = [registered(10, 0, 1), stage(10, 1, 1, 0), stage(10, 2, 1, 1)]
+
+    async def test(conn):
+        # Workers committed their shards, then the indexer stopped before the cursor moved
+        await offchain.apply_shards(offchain.collect_changes(logs).partitions, 0, set())
+        assert await offchain.load_cursor(conn) == 0
+        await offchain.apply_range(offchain.collect_changes(logs), 0, 10, 10)
+        return (await conn.fetch("SELECT stage_index, stage FROM stages ORDER BY stage_index"),
+                await conn.fetchval("SELECT COUNT(*) FROM logs"))
+
+    stages, logs_count = scratch_db(test)
+
+    assert [tuple(r) for r in stages] == [(0, 0), (1, 1)]
+    assert logs_count == 3
@@ -0,0 +1,109 @@
+import asyncio
+
+from aiohttp import web
+from web3 import Web3
+
+from conftest import ALICE, BOB, StubNode, serve
+from fruit_contracts.ContractsLite import AsyncContractsLite
+from fruit_contracts.registry import deployment
+
+UNKNOWN_BATCH = 13  # estimates for it revert, like a registration the contract refuses
+
+
+class Reverted(Exception):
+    pass
+
+
+class BuildNode(StubNode):
+    """Answers what transaction building needs: pending counts per sender, fees and gas estimates.
+
+    An estimate costs 21000 plus 16 per calldata byte, and reverts for UNKNOWN_BATCH."""
+
+    def __init__(self, pending):
+        super().__init__(head=1)
+        self.pending = pending
+
+    def answer(self, method, params):
+        if method == "eth_getTransactionCount":
+            return hex(self.pending[Web3.to_checksum_address(params[0])])
+        if method == "eth_maxPriorityFeePerGas":
+            return hex(2)
+        if method == "eth_estimateGas":
+            data = bytes.fromhex(params[0]["data"][2:])
+            if int.from_bytes(data[4:36], "big") == UNKNOWN_BATCH:
+                raise Reverted()
+            return hex(21000 + 16 * len(data))
+        return super().answer(method, params)
+
+    async def handle(self, request):
+        try:
+            return await super().handle(request)
+        except Reverted:
+            body = await request.json()
+            return web.json_response({"jsonrpc": "2.0", "id": body["id"],
+                                      "error": {"code": 3, "message": "execution reverted", "data": "0x"}})
+
+
+def register(sender, batch_id, metadata="apples"):
+    return {"op": "register_batch", "from_address": sender, "batch_id": batch_id, "metadata": metadata}
+
+
+def record(sender, batch_id, location="Orchard"):
+    return {"op": "record_stage", "from_address": sender, "batch_id": batch_id, "stage": 1,
+            "location": location, "timestamp": 1700000000}
+
+
+def build(ops, pending=None, runs=1, concurrency=16):
+    """Results of build_bulk_txs(ops), run `runs` times on one client, and the node"""
+    node = BuildNode(pending or {ALICE: 7, BOB: 3})
+
+    async def main():
+        runner, url = await serve(node.handle)
+        d = deployment()
+        contracts = AsyncContractsLite(rpc_url=url, permission_addr=d.permission_addr, trace_addr=d.trace_addr,
+                                       chain_id=1)
+        try:
+            return [await contracts.build_bulk_txs(ops, concurrency=concurrency) for _ in range(runs)]
+        finally:
+            await contracts.web3.provider.disconnect()
+            await runner.cleanup()
+
+    return asyncio.run(main()), node
+
+
+def test_nonces_are_consecutive_per_sender_in_request_order():
+    [results], _ = build([register(ALICE, 1), register(BOB, 2), record(ALICE, 5), register(ALICE, 3)])
+
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert [(r["tx"]["from"], r["tx"]["nonce"]) for r in results] == [(ALICE, 7), (BOB, 3), (ALICE, 8), (ALICE, 9)]
+    assert all(r["tx"]["maxFeePerGas"] == 2 + 2 * 7 for r in results)
+
+
+def test_operations_on_a_batch_registered_in_the_request_are_not_estimated():
+    long_location = "x" * 100  # four words: three more than the base covers
+    [results], node = build([
+        register(ALICE, 1), record(ALICE, 1), record(ALICE, 1, long_location), record(ALICE, 1, "x" * 2000),
+    ])
+
+    assert node.calls.count("eth_estimateGas") == 1
+    assert results[1]["tx"]["gas"] == int(250_000 * 1.2)
+    assert results[2]["tx"]["gas"] == int((250_000 + 3 * 25_000) * 1.2)
+    assert "too long" in results[3]["error"]
+    assert [r["tx"]["nonce"] for r in results[:3]] == [7, 8, 9]
+
+
+def test_a_failed_registration_fails_its_dependent_operations_without_a_nonce_gap():
+    [results], _ = build([register(ALICE, UNKNOWN_BATCH), record(ALICE, UNKNOWN_BATCH), register(ALICE, 2)])
+
+    assert "error" in results[0]
+    assert results[1]["error"] == f"register_batch for batch {UNKNOWN_BATCH} failed in this request"
+    assert results[2]["tx"]["nonce"] == 7
+
+
+def test_estimates_are_reused_through_the_gas_cache():
+    ops = [record(ALICE, 5), record(ALICE, 6)]  # same argument shape
+    runs, node = build(ops, runs=2, concurrency=1)
+
+    assert node.calls.count("eth_estimateGas") == 1
+    assert runs[0][1]["tx"]["gas"] == runs[1][0]["tx"]["gas"]
+    assert [r["tx"]["nonce"] for run in runs for r in run] == [7, 8, 9, 10]
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+from cache import ReadCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_entries_expire_after_their_ttl(clock):
+    reads = ReadCache(ttl=30)
+    reads.store(("overview", 1), "a")
+    reads.store(("stage", 1, 0), "s", ttl=None)
+    reads.store(("owner", 1), "o", ttl=5)
+
+    clock.value += 10
+    assert reads.lookup(("overview", 1)) == (True, "a")
+    assert reads.lookup(("owner", 1)) == (False, None)
+
+    clock.value += 100
+    assert reads.lookup(("overview", 1)) == (False, None)
+    assert reads.lookup(("stage", 1, 0)) == (True, "s")
+    assert reads.stats()["size"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    reads = ReadCache(maxsize=2)
+    reads.store(("overview", 1), 1)
+    reads.store(("overview", 2), 2)
+    reads.lookup(("overview", 1))
+    reads.store(("overview", 3), 3)
+
+    assert reads.lookup(("overview", 2)) == (False, None)
+    assert reads.lookup(("overview", 1)) == (True, 1)
+    assert reads.evictions == 1
+
+
+def test_an_entry_only_serves_its_own_version():
+    reads = ReadCache()
+    reads.store(("trace", 1), "old", version=(10, "0xaa"))
+
+    assert reads.lookup(("trace", 1), version=(11, "0xbb")) == (False, None)
+    assert reads.lookup(("trace", 1), version=(10, "0xaa")) == (False, None)  # the stale entry was dropped
+    reads.store(("trace", 1), "new", version=(11, "0xbb"))
+    assert reads.lookup(("trace", 1), version=(11, "0xbb")) == (True, "new")
+
+
+def test_invalidate_batch_drops_everything_derived_from_it():
+    reads = ReadCache()
+    for key in [("overview", 1), ("owner", 1), ("trace", 1), ("missing", 1), ("missing_stage", 1, 4),
+                ("stage", 1, 0), ("overview", 2)]:
+        reads.store(key, "v")
+
+    reads.invalidate_batch(1)
+
+    assert reads.lookup(("missing_stage", 1, 4)) == (False, None)
+    assert reads.lookup(("overview", 1)) == (False, None)
+    assert reads.lookup(("trace", 1)) == (False, None)
+    assert reads.lookup(("stage", 1, 0)) == (True, "v")  # stages are append-only
+    assert reads.lookup(("overview", 2)) == (True, "v")
+    assert reads.invalidations == 5
+
+
+def test_evicted_keys_leave_the_batch_index():
+    reads = ReadCache(maxsize=1)
+    reads.store(("overview", 1), "a")
+    reads.store(("overview", 2), "b")
+
+    reads.invalidate_batch(1)
+
+    assert reads.invalidations == 0
+    assert 1 not in reads._batch_keys
+
+
+def test_maxsize_zero_disables_the_cache():
+    reads = ReadCache(maxsize=0)
+    reads.store(("overview", 1), "a")
+
+    assert reads.lookup(("overview", 1)) == (False, None)
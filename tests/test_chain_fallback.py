@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from web3.exceptions import ContractLogicError
+
+import api
+import offchain
+from conftest import ALICE, BOB, index_block, read_request, registered, stage
+
+PEARS = {"metadata": "pears", "currentOwner": BOB, "stageCount": 2}
+PEAR_STAGES = [
+    {"stage": 0, "location": "Orchard", "timestamp": 1700000000, "actor": ALICE},
+    {"stage": 1, "location": "Market", "timestamp": 1700000100, "actor": BOB},
+]
+
+
+class Chain:
+    """Contract reads of a chain holding batch 5 (PEARS) and nothing else, counting every call"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def get_batch_overview(self, batch_id):
+        self.calls.append(("overview", batch_id))
+        if batch_id != 5:
+            raise ContractLogicError("execution reverted: Batch not found")
+        return PEARS
+
+    async def get_stages(self, batch_id, count):
+        self.calls.append(("stages", batch_id))
+        return PEAR_STAGES[:count]
+
+    async def get_stage(self, batch_id, index):
+        self.calls.append(("stage", batch_id, index))
+        if batch_id != 5 or index >= len(PEAR_STAGES):
+            raise ContractLogicError("execution reverted: Stage not found")
+        return PEAR_STAGES[index]
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    chain = Chain()
+    monkeypatch.setattr(api, "contracts", chain)
+    return chain
+
+
+async def written_back():
+    while api.write_backs:
+        await asyncio.gather(*api.write_backs.values())
+
+
+def test_a_reverted_lookup_is_not_repeated_until_the_batch_is_indexed(api_db, chain):
+    async def test(conn):
+        statuses = []
+        for _ in range(2):
+            with pytest.raises(HTTPException) as missing:
+                await api.get_batch_overview(7, read_request())
+            statuses.append(missing.value.status_code)
+        with pytest.raises(HTTPException):
+            await api.get_stage(7, 0, read_request())  # the whole batch is known missing
+        with pytest.raises(HTTPException):
+            await api.get_stage(5, 4, read_request())
+        with pytest.raises(HTTPException):
+            await api.get_stage(5, 4, read_request())
+        calls = list(chain.calls)
+
+        await index_block(conn, 10, registered(10, 0, 7))
+        indexed = await api.get_batch_overview(7, read_request())
+        return statuses, calls, indexed, chain.calls[len(calls):]
+
+    statuses, calls, indexed, later_calls = api_db(test)
+
+    assert statuses == [404, 404]
+    assert calls == [("overview", 7), ("stage", 5, 4)]
+    assert indexed.status_code == 200 and later_calls == []
+
+
+def test_indexed_batches_drop_their_negative_entries(monkeypatch):
+    monkeypatch.setattr(api, "not_found", api.ReadCache())
+    changes = offchain.ChangeSet()
+    for part in offchain.collect_changes([registered(10, 0, 7), stage(10, 1, 5, 0)]).partitions.values():
+        changes.merge(part)
+    api.not_found.store(("missing", 7), True)
+    api.not_found.store(("missing_stage", 5, 4), True)
+    api.not_found.store(("missing", 8), True)
+
+    api.invalidate_cached_batches(changes)
+
+    assert api.not_found.lookup(("missing", 7)) == (False, None)
+    assert api.not_found.lookup(("missing_stage", 5, 4)) == (False, None)
+    assert api.not_found.lookup(("missing", 8)) == (True, True)
+
+
+def test_a_chain_read_batch_is_written_back_until_indexed(api_db, chain):
+    async def test(conn):
+        first = await api.get_batch_overview(5, read_request())
+        await written_back()
+        stored = await conn.fetchrow("SELECT current_owner, latest_stage, provisional FROM batches WHERE batch_id = 5")
+        stages = await conn.fetch("SELECT stage, location, provisional FROM stages WHERE batch_id = 5 ORDER BY stage_index")
+        calls = list(chain.calls)
+        api.read_cache.clear()
+        second = await api.get_batch_overview(5, read_request())
+
+        await index_block(conn, 10, registered(10, 0, 5, metadata="pears", farmer=ALICE), stage(10, 1, 5, 0))
+        indexed = await conn.fetch("SELECT stage, provisional FROM stages WHERE batch_id = 5 ORDER BY stage_index")
+        return first, stored, stages, calls, second, chain.calls[len(calls):], indexed
+
+    first, stored, stages, calls, second, later_calls, indexed = api_db(test)
+
+    assert json.loads(first.body) == PEARS
+    assert tuple(stored) == (BOB, 1, True)
+    assert [tuple(s) for s in stages] == [(0, "Orchard", True), (1, "Market", True)]
+    assert calls == [("overview", 5), ("stages", 5)]
+    assert second.headers.get("etag") is None and later_calls == []  # served by Postgres, not the chain
+    assert [tuple(s) for s in indexed] == [(0, False)]  # the indexer replaced the provisional rows
+
+
+def test_a_chain_read_stage_is_appended_only_after_the_stored_ones(api_db, chain):
+    async def test(conn):
+        await index_block(conn, 10, registered(10, 0, 5), stage(10, 1, 5, 0))
+        await api.store_stage(5, 3, PEAR_STAGES[1])  # a gap: left for the indexer
+        await api.get_stage(5, 1, read_request())
+        await written_back()
+        return await conn.fetch("SELECT stage_index, stage, provisional FROM stages WHERE batch_id = 5 ORDER BY stage_index")
+
+    assert [tuple(s) for s in api_db(test)] == [(0, 0, False), (1, 1, True)]
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+from web3 import Web3
+
+import offchain
+from conftest import ALICE, BOB, block_hash, make_log, registered, role, stage, transferred
+
+
+@pytest.fixture
+def failing_handler(monkeypatch):
+    """Make `event_name`'s handler raise; the dispatch table is rebuilt around the patched handlers"""
+    def patch(event_name):
+        def boom(changes, args, position):
+            raise ValueError("boom")
+        monkeypatch.setitem(offchain.EVENT_HANDLERS, event_name, boom)
+        offchain.get_dispatch.cache_clear()
+
+    yield patch
+    offchain.get_dispatch.cache_clear()
+
+
+def test_events_are_partitioned_by_shard():
+    changes = offchain.collect_changes([
+        registered(10, 0, 1),
+        registered(10, 1, 2),
+        stage(10, 2, 1, 0),
+        transferred(11, 0, 2, ALICE, BOB),
+        role("RoleGranted", 11, 1, BOB),
+    ])
+
+    assert set(changes.partitions) == {"batch:1", "batch:2", f"account:{BOB}"}
+    assert not changes.logs and not changes.failures
+    assert changes.blocks == {10: Web3.to_hex(block_hash(10)), 11: Web3.to_hex(block_hash(11))}
+
+    batch_1 = changes.partitions["batch:1"]
+    assert [name for _, name in batch_1.events] == ["BatchRegistered", "StageRecorded"]
+    assert batch_1.batches[1][1:] == ("apples", ALICE, 10)
+    assert [row[1:4] for row in batch_1.stages] == [(1, 0, "Orchard")]
+    assert changes.partitions["batch:2"].owners == {2: BOB}
+    assert changes.partitions[f"account:{BOB}"].roles == {(BOB, "FARMER_ROLE"): True}
+
+
+def test_events_without_a_shard_stay_top_level():
+    log = make_log("RoleAdminChanged", 10, 0, role=bytes(32), previousAdminRole=bytes(32), newAdminRole=bytes(32))
+    changes = offchain.collect_changes([log])
+
+    assert not changes.partitions
+    assert [row[1] for row in changes.logs] == ["RoleAdminChanged"]
+
+
+def test_handler_failure_parks_the_rest_of_its_shard(failing_handler):
+    failing_handler("StageRecorded")
+    changes = offchain.collect_changes([
+        registered(10, 0, 1),
+        stage(10, 1, 1, 0),
+        transferred(10, 2, 1, ALICE, BOB),
+        registered(10, 3, 2),
+    ])
+
+    part = changes.partitions["batch:1"]
+    assert part.error[0] == 1
+    assert not part.owners  # nothing after the failure is handled
+    assert len(part.events) == 3  # but every event is kept to be parked
+
+    applied, failures = asyncio.run(offchain.apply_partitions(None, {"batch:1": part}))
+    assert not applied.logs
+    assert [(f[0], f[1], f[2], f[5]) for f in failures] == [
+        (10, 0, "batch:1", "blocked"),
+        (10, 1, "batch:1", "handler"),
+        (10, 2, "batch:1", "blocked"),
+    ]
+    assert failures[1][6] == "boom"
+    assert not changes.partitions["batch:2"].error
+
+
+def test_shardless_handler_failure_is_parked_alone(failing_handler):
+    failing_handler("RoleAdminChanged")
+    log = make_log("RoleAdminChanged", 10, 0, role=bytes(32), previousAdminRole=bytes(32), newAdminRole=bytes(32))
+    changes = offchain.collect_changes([log, registered(10, 1, 1)])
+
+    assert not changes.logs
+    assert [(f[2], f[3], f[5]) for f in changes.failures] == [(None, "RoleAdminChanged", "handler")]
+    assert "batch:1" in changes.partitions
+
+
+def test_undecodable_event_is_parked_without_a_shard():
+    log = registered(10, 0, 1)
+    log["data"] = log["data"][:40]  # truncated metadata
+    changes = offchain.collect_changes([log, registered(10, 1, 2)])
+
+    assert [(f[0], f[1], f[2], f[5]) for f in changes.failures] == [(10, 0, None, "decode")]
+    assert set(changes.partitions) == {"batch:2"}
+    assert changes.blocks == {10: Web3.to_hex(block_hash(10))}
+
+
+def test_unknown_contract_is_ignored():
+    log = registered(10, 0, 1)
+    log["address"] = "0x" + "33" * 20
+    changes = offchain.collect_changes([log])
+
+    assert not changes.partitions and not changes.failures and not changes.blocks
+
+
+def test_blocked_shards_are_parked_without_touching_the_database():
+    changes = offchain.collect_changes([registered(10, 0, 1), stage(10, 1, 1, 0)])
+
+    # conn=None: a blocked shard must not reach apply_changes
+    applied, failures = asyncio.run(offchain.apply_partitions(None, changes.partitions, blocked={"batch:1"}))
+    assert not applied.batches
+    assert [(f[1], f[5]) for f in failures] == [(0, "blocked"), (1, "blocked")]
+
+
+def test_merge_sequences_stages_after_existing_ones():
+    changes = offchain.collect_changes([
+        registered(10, 0, 1), stage(10, 1, 1, 0), stage(10, 2, 1, 1),
+        registered(10, 3, 2), stage(10, 4, 2, 0),
+    ])
+    merged = offchain.ChangeSet()
+    for part in changes.partitions.values():
+        merged.merge(part)
+
+    assert [row[0] for row in merged.stages] == [0, 1, 2]
+    assert [row[1] for row in merged.stages] == [1, 1, 2]
+    assert merged.touched_batches() == {1, 2}
+
+
+def test_shard_buckets():
+    assert {offchain.shard_bucket(f"batch:{i}") for i in range(1000)} == set(range(offchain.WRITE_BACK_LOCK_BUCKETS))
+    assert offchain.write_back_bucket(7) == offchain.shard_bucket("batch:7")
@@ -0,0 +1,42 @@
+import pytest
+
+import api
+from conftest import index_block, read_request, registered, stage
+from stream import EventBroker, format_sse
+
+
+@pytest.fixture(autouse=True)
+def broker(monkeypatch):
+    broker = EventBroker(10)
+    monkeypatch.setattr(api, "event_broker", broker)
+    return broker
+
+
+def test_a_stream_that_never_starts_does_not_subscribe(broker):
+    response = api.event_stream(read_request(), ("batch", 1), "10:0", api.BATCH_REPLAY_SQL)
+
+    assert response.media_type == "text/event-stream"
+    assert broker.stats()["subscribers"] == 0
+
+
+def test_a_stream_replays_then_follows_live_events_and_unsubscribes(api_db, broker):
+    live = format_sse("StageRecorded", 11, 0, "0xabc", "{}")
+
+    async def test(conn):
+        await index_block(conn, 10, registered(10, 0, 1), stage(10, 1, 1, 0), stage(10, 2, 1, 1))
+        frames = api.event_stream(read_request(), ("batch", 1), "10:0", api.BATCH_REPLAY_SQL).body_iterator
+        replayed = [await anext(frames), await anext(frames)]
+        subscribed = broker.stats()["subscribers"]
+
+        broker.publish([("batch", 1)], ("event", (10, 2), "already replayed"))
+        broker.publish([("batch", 1)], ("event", (11, 0), live))
+        following = await anext(frames)
+        await frames.aclose()
+        return replayed, subscribed, following
+
+    replayed, subscribed, following = api_db(test)
+
+    assert [frame.split("\n")[0] for frame in replayed] == ["id: 10:1", "id: 10:2"]
+    assert subscribed == 1
+    assert following == live
+    assert broker.stats()["subscribers"] == 0
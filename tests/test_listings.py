@@ -0,0 +1,71 @@
+import api
+from conftest import ALICE, BOB, index_block, registered, stage, transferred
+
+CAROL = "0x" + "c3" * 20
+
+
+async def index_orchard(conn):
+    """Batches 1-5: Bob farms 2 and 4, batch 3 is sold to Bob, 1 and 3 reach stage 1; batch 1 has three stages"""
+    await index_block(conn, 10, *[registered(10, i, i + 1, farmer=BOB if i % 2 else ALICE) for i in range(5)])
+    await index_block(conn, 11, stage(11, 0, 1, 0), stage(11, 1, 1, 1), stage(11, 2, 1, 1, location="Market"),
+                      stage(11, 3, 3, 0), stage(11, 4, 3, 1), stage(11, 5, 2, 0))
+    await index_block(conn, 12, transferred(12, 0, 3, ALICE, BOB))
+
+
+async def all_pages(load, limit):
+    """Keys of every page, following `next` until it is None"""
+    pages, after = [], None
+    while True:
+        page = await load(after, limit)
+        pages.append([item.get("batch_id", item.get("index")) for item in page["items"]])
+        after = page["next"]
+        if after is None:
+            return pages
+
+
+def test_batch_pages_follow_the_keyset(api_db):
+    async def test(conn):
+        await index_orchard(conn)
+        return (
+            await all_pages(lambda after, limit: api.load_batch_page(None, None, None, after, limit), 2),
+            await all_pages(lambda after, limit: api.load_batch_page(None, None, None, after, limit), 5),
+        )
+
+    assert api_db(test) == ([[1, 2], [3, 4], [5]], [[1, 2, 3, 4, 5], []])
+
+
+def test_batch_filters_combine(api_db):
+    async def test(conn):
+        await index_orchard(conn)
+
+        async def keys(owner=None, farmer=None, stage=None, after=None):
+            page = await api.load_batch_page(owner, farmer, stage, after, 10)
+            return [item["batch_id"] for item in page["items"]]
+
+        return {
+            "owner": await keys(owner=BOB.lower()),  # addresses match in any case
+            "farmer": await keys(farmer=BOB),
+            "stage": await keys(stage=1),
+            "owner_farmer": await keys(owner=BOB, farmer=ALICE),
+            "owner_stage_after": await keys(owner=ALICE, stage=1, after=0),
+            "nobody": await keys(owner=CAROL),
+        }
+
+    assert api_db(test) == {
+        "owner": [2, 3, 4], "farmer": [2, 4], "stage": [1, 3],
+        "owner_farmer": [3], "owner_stage_after": [1], "nobody": [],
+    }
+
+
+def test_stage_pages_follow_the_keyset(api_db):
+    async def test(conn):
+        await index_orchard(conn)
+        pages = await all_pages(lambda after, limit: api.load_stage_page(1, after, limit), 2)
+        last = await api.load_stage_page(1, 1, 2)
+        return pages, last
+
+    pages, last = api_db(test)
+
+    assert pages == [[0, 1], [2]]
+    assert [(item["stage"], item["location"]) for item in last["items"]] == [(1, "Market")]
+    assert last["next"] is None
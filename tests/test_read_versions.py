@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+import api
+from conftest import ALICE, BOB, index_block, read_request, registered, role, stage, transferred
+
+
+@pytest.fixture(autouse=True)
+def nobody_holds_a_role(monkeypatch):
+    async def has_role(role_name, account):
+        return False
+
+    async def get_roles(addresses, role_names):
+        return {a: {r: False for r in role_names} for a in addresses}
+
+    monkeypatch.setattr(api, "contracts", SimpleNamespace(has_role=has_role, get_roles=get_roles))
+
+
+async def revalidate(route, etag, *args):
+    """Status and ETag of route(*args) for a client holding `etag`"""
+    response = await route(*args, read_request(etag))
+    return response.status_code, response.headers.get("etag")
+
+
+def test_role_reads_change_only_with_the_accounts_role_events(api_db):
+    async def test(conn):
+        await index_block(conn, 10, role("RoleGranted", 10, 0, BOB))
+        first = await api.has_role("FARMER_ROLE", BOB.lower(), read_request())
+        etag = first.headers["etag"]
+
+        steps = [await revalidate(api.get_roles, etag, BOB)]
+        await index_block(conn, 11, registered(11, 0, 1), role("RoleGranted", 11, 1, ALICE))
+        steps.append(await revalidate(api.has_role, etag, "FARMER_ROLE", BOB))
+        await index_block(conn, 12, role("RoleRevoked", 12, 0, BOB))
+        steps.append(await revalidate(api.has_role, etag, "FARMER_ROLE", BOB))
+        return first, steps, await revalidate(api.get_roles, None, "0x" + "c3" * 20)
+
+    first, steps, unknown = api_db(test)
+
+    assert first.status_code == 200 and first.headers["cache-control"] != "no-cache"
+    assert [status for status, _ in steps] == [304, 304, 200]
+    assert steps[2][1] != steps[0][1]
+    assert unknown == (200, '"0"')  # no role event yet: still validated
+
+
+LISTING = {"owner": None, "farmer": None, "stage": None, "after": None, "limit": api.LIST_PAGE_SIZE}
+
+
+def test_listing_changes_only_with_the_batches_in_its_filter(api_db):
+    async def test(conn):
+        await index_block(conn, 10, registered(10, 0, 1), stage(10, 1, 1, 0), registered(10, 2, 2),
+                    registered(10, 3, 3, farmer=BOB))
+
+        async def etags():
+            return {
+                name: (await api.list_batches(read_request(), **{**LISTING, **query})).headers["etag"]
+                for name, query in {
+                    "alice": {"owner": ALICE}, "bob": {"owner": BOB}, "stage": {"stage": 0},
+                    "after_1": {"owner": ALICE, "after": 1},
+                }.items()
+            }
+
+        versions = [await etags()]
+        await index_block(conn, 11, stage(11, 0, 3, 0))  # batch 3 enters the stage listing
+        versions.append(await etags())
+        await index_block(conn, 12, transferred(12, 0, 1, ALICE, BOB))  # batch 1 leaves alice's listing
+        versions.append(await etags())
+        await index_block(conn, 13, stage(13, 0, 1, 1))  # batch 1 leaves the stage listing
+        versions.append(await etags())
+        return versions
+
+    versions = api_db(test)
+
+    def changed(step):
+        return {name for name, etag in versions[step].items() if etag != versions[step - 1][name]}
+
+    assert changed(1) == {"bob", "stage"}
+    assert changed(2) == {"alice", "bob", "stage"}  # batch 1 is not past `after` for after_1
+    assert changed(3) == {"bob", "stage"}
+
+
+def test_stage_etag_without_an_indexer_cursor(api_db):
+    async def test(conn):
+        await index_block(conn, 10, registered(10, 0, 1), stage(10, 1, 1, 0))
+        await conn.execute("DELETE FROM sync_state")
+        return await api.get_stage(1, 0, read_request())
+
+    response = api_db(test)
+
+    assert response.status_code == 200
+    assert response.headers["etag"].startswith('"10-')
+    assert response.headers["cache-control"] == api.MUTABLE_CACHE_CONTROL
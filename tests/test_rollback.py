@@ -0,0 +1,151 @@
+import json
+
+import pytest
+from web3 import Web3
+
+import offchain
+from conftest import ALICE, BOB, StubNode, registered, role, stage, transferred
+
+# Three blocks of history; block 12 is the one a reorg orphans
+HISTORY = {
+    10: [
+        role("RoleGranted", 10, 0, BOB),
+        registered(10, 1, 1),
+        stage(10, 2, 1, 0),
+        registered(10, 3, 3),
+    ],
+    11: [
+        stage(11, 0, 1, 1),
+        transferred(11, 1, 1, ALICE, BOB),
+    ],
+    12: [
+        transferred(12, 0, 1, BOB, ALICE),
+        stage(12, 1, 1, 2, location="Market"),
+        registered(12, 2, 2),
+        stage(12, 3, 2, 0),
+        role("RoleRevoked", 12, 4, BOB),
+        role("RoleGranted", 12, 5, ALICE),
+    ],
+}
+
+
+async def index_history(conn):
+    for block, logs in HISTORY.items():
+        await offchain.apply_range(offchain.collect_changes(logs), await offchain.load_cursor(conn), block, block)
+
+
+async def write_back_provisional(conn):
+    """Rows the API wrote back from chain reads: a stage of batch 3 and a batch the indexer has not reached"""
+    await conn.execute("""
+        INSERT INTO batches (batch_id, metadata, current_owner, farmer, provisional)
+        VALUES (5, 'pears', $1, $1, TRUE)
+    """, ALICE)
+    await conn.execute("""
+        INSERT INTO stages (batch_id, stage_index, stage, location, actor, provisional)
+        VALUES (3, 0, 0, 'Orchard', $1, TRUE), (5, 0, 0, 'Orchard', $1, TRUE)
+    """, ALICE)
+
+
+def test_rollback_restores_the_state_at_the_ancestor(scratch_db):
+    async def test(conn):
+        await index_history(conn)
+        await write_back_provisional(conn)
+        await offchain.park_events(conn, [(12, 9, "batch:4", "StageRecorded", "{}", "handler", "boom")])
+
+        assert await conn.fetchval("SELECT current_owner FROM batches WHERE batch_id = 1") == ALICE
+        assert await conn.fetchval("SELECT latest_stage FROM batches WHERE batch_id = 1") == 2
+
+        async with conn.transaction():
+            changes = await offchain.rollback_to(conn, 11)
+        return changes, {
+            "batches": await conn.fetch("SELECT batch_id, current_owner, latest_stage FROM batches ORDER BY batch_id"),
+            "stages": await conn.fetch("SELECT batch_id, stage_index, stage FROM stages ORDER BY batch_id, stage_index"),
+            "roles": await conn.fetch("SELECT address, role_name FROM user_roles ORDER BY address"),
+            "documents": await conn.fetch("SELECT batch_id, document FROM batch_documents ORDER BY batch_id"),
+            "log_block": await conn.fetchval("SELECT MAX(block_number) FROM logs"),
+            "indexed_block": await conn.fetchval("SELECT MAX(block_number) FROM indexed_blocks"),
+            "failures": await conn.fetchval("SELECT COUNT(*) FROM event_failures"),
+            "cursor": await offchain.load_cursor(conn),
+        }
+
+    changes, state = scratch_db(test)
+
+    assert [tuple(r) for r in state["batches"]] == [(1, BOB, 1), (3, ALICE, None)]
+    assert [tuple(r) for r in state["stages"]] == [(1, 0, 0), (1, 1, 1)]
+    assert [tuple(r) for r in state["roles"]] == [(BOB, "FARMER_ROLE")]
+    assert [r["batch_id"] for r in state["documents"]] == [1, 3]
+    document = json.loads(state["documents"][0]["document"])
+    assert document["overview"]["current_owner"] == BOB
+    assert [s["stage"] for s in document["stages"]] == [0, 1]
+    assert state["log_block"] == state["indexed_block"] == state["cursor"] == 11
+    assert state["failures"] == 0
+
+    assert changes.reorg and changes.ancestor == 11
+    assert changes.owners[1] == BOB and changes.owners[2] is None and changes.owners[5] is None
+    assert changes.roles == {(BOB, "FARMER_ROLE"): True, (ALICE, "FARMER_ROLE"): False}
+
+
+def test_rolled_back_blocks_can_be_indexed_again(scratch_db):
+    async def test(conn):
+        await index_history(conn)
+        async with conn.transaction():
+            await offchain.rollback_to(conn, 11)
+        await offchain.apply_range(offchain.collect_changes(HISTORY[12]), 11, 12, 12)
+        return await conn.fetch("SELECT batch_id, stage_index, location FROM stages ORDER BY batch_id, stage_index")
+
+    assert [tuple(r) for r in scratch_db(test)] == [
+        (1, 0, "Orchard"), (1, 1, "Orchard"), (1, 2, "Market"), (2, 0, "Orchard"),
+    ]
+
+
+def fork_hash(block):
+    return Web3.keccak(text=f"fork-{block}")
+
+
+class ReorgDuringGetLogs(StubNode):
+    """Serves the logs of the original branch, then switches to a fork replacing every block from 11"""
+
+    def get_logs(self, query):
+        logs = super().get_logs(query)
+        self.hashes = {n: fork_hash(n) for n in range(11, self.head + 1)}
+        self.logs = []
+        return logs
+
+
+def test_reorg_while_fetching_a_range_is_rolled_back_next_round(scratch_db, indexer_rpc, monkeypatch):
+    monkeypatch.setattr(offchain, "SYNC_CHUNK_SIZE", 2)
+    node = ReorgDuringGetLogs(14, [registered(11, 0, 1)])
+
+    async def test(conn):
+        await offchain.save_cursor(conn, 10)
+        await indexer_rpc(node)
+        try:
+            await offchain.sync_range_once()  # blocks 11-12, logs from the branch being replaced
+            indexed = await conn.fetchval("SELECT COUNT(*) FROM batches")
+            await offchain.sync_range_once()  # the checkpoint of block 12 is no longer canonical
+        finally:
+            await indexer_rpc.close()
+        return indexed, await conn.fetchval("SELECT COUNT(*) FROM batches"), await offchain.load_cursor(conn)
+
+    indexed, batches, cursor = scratch_db(test)
+
+    assert indexed == 1
+    assert batches == 0
+    assert cursor == 10
+
+
+def test_logs_from_another_branch_than_the_checkpoint_are_refused(scratch_db, indexer_rpc):
+    # The node's block 12 is already the fork's, but its log index still serves the old branch
+    node = StubNode(12, [registered(12, 0, 1)], hashes={12: fork_hash(12)})
+
+    async def test(conn):
+        await offchain.save_cursor(conn, 10)
+        await indexer_rpc(node)
+        try:
+            with pytest.raises(RuntimeError, match="another branch"):
+                await offchain.sync_range_once()
+        finally:
+            await indexer_rpc.close()
+        return await conn.fetchval("SELECT COUNT(*) FROM logs"), await offchain.load_cursor(conn)
+
+    assert scratch_db(test) == (0, 10)
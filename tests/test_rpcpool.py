@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from fruit_contracts.rpcpool import PooledHTTPProvider, split_rpc_urls
+
+DEAD_URL = "http://127.0.0.1:9/"  # nothing listens there
+
+
+# ---------- Stand-in RPC ----------
+async def start_node(delay=0.0, status=200):
+    """A local JSON-RPC node answering every call after `delay`; returns (runner, url, request count)"""
+    counts = {"requests": 0}
+
+    async def handle(request):
+        body = await request.json()
+        counts["requests"] += 1
+        if status != 200:
+            return web.Response(status=status, text="unavailable")
+        await asyncio.sleep(delay)
+        return web.json_response({"jsonrpc": "2.0", "id": body["id"], "result": "0x10"})
+
+    app = web.Application()
+    app.router.add_post("/", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/", counts
+
+
+def with_nodes(*settings):
+    """Run `test(urls, counts)` with one stand-in node per settings dict (None: a dead URL)"""
+    def run(test):
+        async def main():
+            runners, urls, counts = [], [], []
+            try:
+                for node in settings:
+                    if node is None:
+                        urls.append(DEAD_URL)
+                        counts.append(None)
+                        continue
+                    runner, url, node_counts = await start_node(**node)
+                    runners.append(runner)
+                    urls.append(url)
+                    counts.append(node_counts)
+                return await test(urls, counts)
+            finally:
+                for runner in runners:
+                    await runner.cleanup()
+
+        return asyncio.run(main())
+    return run
+
+
+async def request(provider, method="eth_blockNumber", params=()):
+    try:
+        return await provider.make_request(method, list(params))
+    finally:
+        await provider.disconnect()
+
+
+def test_split_rpc_urls():
+    assert split_rpc_urls(" http://a/, ,http://b/") == ["http://a/", "http://b/"]
+    assert split_rpc_urls(None) == []
+    with pytest.raises(ValueError):
+        PooledHTTPProvider("")
+
+
+def test_read_fails_over_from_a_dead_endpoint():
+    async def test(urls, counts):
+        provider = PooledHTTPProvider(urls)
+        response = await request(provider)
+        return response, provider
+
+    response, provider = with_nodes(None, {})(test)
+
+    assert response["result"] == "0x10"
+    dead, live = provider.endpoints
+    assert (dead.requests, dead.errors, live.requests) == (1, 1, 1)
+    assert provider.ranked() == [live, dead]  # cooling down after the failure
+
+
+def test_read_fails_over_from_an_unavailable_node():
+    async def test(urls, counts):
+        response = await request(PooledHTTPProvider(urls))
+        return response, counts
+
+    response, counts = with_nodes({"status": 503}, {})(test)
+
+    assert response["result"] == "0x10"
+    assert [c["requests"] for c in counts] == [1, 1]
+
+
+def test_slow_read_is_hedged_to_the_next_endpoint():
+    async def test(urls, counts):
+        provider = PooledHTTPProvider(urls, hedge_after=0.05)
+        start = time.monotonic()
+        response = await request(provider)
+        return response, time.monotonic() - start, provider
+
+    response, elapsed, provider = with_nodes({"delay": 1.0}, {})(test)
+
+    assert response["result"] == "0x10"
+    assert elapsed < 0.5
+    slow, fast = provider.endpoints
+    assert (slow.hedges, fast.hedges) == (0, 1)
+    assert slow.latency >= 0.05  # the abandoned attempt still counts as slow
+
+
+def test_write_is_not_resent_once_a_node_may_have_received_it():
+    async def test(urls, counts):
+        with pytest.raises(aiohttp.ClientResponseError):
+            await request(PooledHTTPProvider(urls, hedge_after=0.05), "eth_sendRawTransaction", ["0x00"])
+        return counts
+
+    counts = with_nodes({"status": 503}, {})(test)
+
+    assert [c["requests"] for c in counts] == [1, 0]
+
+
+def test_write_fails_over_when_the_connection_could_not_be_opened():
+    async def test(urls, counts):
+        response = await request(PooledHTTPProvider(urls), "eth_sendRawTransaction", ["0x00"])
+        return response, counts
+
+    response, counts = with_nodes(None, {})(test)
+
+    assert response["result"] == "0x10"
+    assert counts[1]["requests"] == 1
+
+
+def test_single_endpoint_retries_with_backoff_then_raises():
+    async def test(urls, counts):
+        provider = PooledHTTPProvider(urls, max_attempts=3, retry_backoff=0.01)
+        with pytest.raises(aiohttp.ClientConnectorError):
+            await request(provider)
+        return provider
+
+    provider = with_nodes(None)(test)
+
+    assert provider.endpoints[0].requests == 3
+
+
+def test_pinned_requests_stay_on_one_endpoint():
+    async def test(urls, counts):
+        provider = PooledHTTPProvider(urls, hedge_after=0.01)
+        with provider.pinned() as endpoint:
+            responses = [await provider.make_request("eth_blockNumber", []) for _ in range(3)]
+        await request(provider)  # unpinned again: ranked by latency, so the fast node answers
+        return responses, endpoint, provider, counts
+
+    responses, endpoint, provider, counts = with_nodes({"delay": 0.05}, {})(test)
+
+    assert all(r["result"] == "0x10" for r in responses)
+    assert endpoint is provider.endpoints[0]
+    assert [c["requests"] for c in counts] == [3, 1]
+
+
+def test_pinned_endpoint_failure_does_not_fail_over():
+    async def test(urls, counts):
+        provider = PooledHTTPProvider(urls, retry_backoff=0.01)
+        with provider.pinned():
+            with pytest.raises(aiohttp.ClientConnectorError):
+                await request(provider)
+        return provider, counts
+
+    provider, counts = with_nodes(None, {})(test)
+
+    assert provider.endpoints[0].requests == provider.max_attempts
+    assert counts[1]["requests"] == 0
@@ -0,0 +1,41 @@
+import offchain
+from conftest import StubNode, registered, stage
+
+
+def test_a_round_reads_every_answer_from_one_endpoint(scratch_db, indexer_rpc):
+    logs = [registered(11, 0, 1), stage(12, 0, 1, 0)]
+    first, second = StubNode(12, logs, delay=0.05), StubNode(12, logs)
+
+    async def test(conn):
+        # Hedging would otherwise send the slow first endpoint's reads to the second one too
+        await indexer_rpc(first, second, hedge_after=0.01)
+        try:
+            result = await offchain.sync_range_once()
+        finally:
+            await indexer_rpc.close()
+        return result, await offchain.load_cursor(conn)
+
+    (caught_up, ingested), cursor = scratch_db(test)
+
+    assert (caught_up, ingested, cursor) == (True, 2, 12)
+    assert "eth_getLogs" in first.calls
+    assert second.calls == []
+
+
+def test_an_endpoint_behind_the_cursor_is_not_a_reorg(scratch_db, indexer_rpc):
+    logs = [registered(11, 0, 1)]
+
+    async def test(conn):
+        await indexer_rpc(StubNode(12, logs))
+        await offchain.sync_range_once()
+        await indexer_rpc(StubNode(10, logs))  # a lagging endpoint
+        try:
+            result = await offchain.sync_range_once()
+        finally:
+            await indexer_rpc.close()
+        return result, await offchain.load_cursor(conn), await conn.fetchval("SELECT COUNT(*) FROM batches")
+
+    result, cursor, batches = scratch_db(test)
+
+    assert result == (True, 0)
+    assert cursor == 12 and batches == 1
@@ -0,0 +1,172 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from fruit_contracts.txutils import GasEstimateCache, NonceManager, SingleFlight
+
+SENDER = "0x" + "a1" * 20
+
+
+class FakeWeb3:
+    """Just enough of AsyncWeb3 for NonceManager: a settable pending transaction count"""
+
+    def __init__(self, pending):
+        self.pending = pending
+        self.reads = 0
+        self.eth = SimpleNamespace(get_transaction_count=self.get_transaction_count)
+
+    async def get_transaction_count(self, sender, block_identifier):
+        assert block_identifier == "pending"
+        self.reads += 1
+        return self.pending
+
+
+# ---------- NonceManager ----------
+def test_reservations_are_consecutive():
+    web3 = FakeWeb3(5)
+    nonces = NonceManager(web3)
+
+    async def run():
+        return [await nonces.reserve(SENDER), await nonces.reserve(SENDER, 3), await nonces.reserve(SENDER)]
+
+    assert asyncio.run(run()) == [5, 6, 9]
+    assert web3.reads == 1  # within resync_after the local counter is trusted
+
+
+def test_concurrent_reservations_never_collide():
+    nonces = NonceManager(FakeWeb3(0))
+
+    async def run():
+        return await asyncio.gather(*(nonces.reserve(SENDER) for _ in range(20)))
+
+    assert sorted(asyncio.run(run())) == list(range(20))
+
+
+def test_release_returns_the_latest_reservation():
+    nonces = NonceManager(FakeWeb3(5))
+
+    async def run():
+        first = await nonces.reserve(SENDER)
+        second = await nonces.reserve(SENDER)
+        nonces.release(SENDER, first)  # not the latest: ignored
+        nonces.release(SENDER, second)
+        return await nonces.reserve(SENDER)
+
+    assert asyncio.run(run()) == 6
+
+
+def test_resync_follows_the_chain_ahead():
+    web3 = FakeWeb3(5)
+    nonces = NonceManager(web3, resync_after=0)
+
+    async def run():
+        await nonces.reserve(SENDER)
+        web3.pending = 20  # transactions sent from another wallet
+        return await nonces.reserve(SENDER)
+
+    assert asyncio.run(run()) == 20
+
+
+def test_unsent_nonces_are_reclaimed_after_drop_after():
+    web3 = FakeWeb3(5)
+
+    async def run(drop_after):
+        nonces = NonceManager(web3, resync_after=0, drop_after=drop_after)
+        await nonces.reserve(SENDER)
+        return await nonces.reserve(SENDER)
+
+    assert asyncio.run(run(drop_after=120)) == 6
+    assert asyncio.run(run(drop_after=0)) == 5
+
+
+def test_reset_forgets_local_state():
+    web3 = FakeWeb3(5)
+    nonces = NonceManager(web3)
+
+    async def run():
+        await nonces.reserve(SENDER, 4)
+        nonces.reset(SENDER)
+        return await nonces.reserve(SENDER)
+
+    assert asyncio.run(run()) == 5
+    assert web3.reads == 2
+
+
+# ---------- GasEstimateCache ----------
+def test_gas_estimates_are_shared_by_argument_shape():
+    gas = GasEstimateCache(ttl=30)
+    gas.put(GasEstimateCache.key("recordStage", SENDER, (1, 0, "Orchard", 1700000000)), 90_000)
+
+    assert gas.get(GasEstimateCache.key("recordStage", SENDER, (2, 3, "Market", 1700000001))) == 90_000
+    assert gas.get(GasEstimateCache.key("recordStage", SENDER, (1, 0, "x" * 40, 1700000000))) is None
+
+
+def test_gas_estimates_expire():
+    gas = GasEstimateCache(ttl=0.01)
+    key = GasEstimateCache.key("registerBatch", SENDER, (1, "apples"))
+    gas.put(key, 80_000)
+    time.sleep(0.02)
+
+    assert gas.get(key) is None
+
+
+# ---------- SingleFlight ----------
+def test_concurrent_identical_calls_share_one_call():
+    joined = []
+    flight = SingleFlight(on_coalesced=joined.append)
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def run():
+        results = await asyncio.gather(*(flight.do(("eth_call", "0x1"), call) for _ in range(5)))
+        other = await flight.do(("eth_call", "0x2"), call)
+        again = await flight.do(("eth_call", "0x1"), call)  # nothing is cached once the call completes
+        return results, other, again
+
+    results, other, again = asyncio.run(run())
+    assert results == [1] * 5
+    assert (other, again) == (2, 3)
+    assert flight.calls["eth_call"] == 3
+    assert flight.coalesced["eth_call"] == 4
+    assert joined == ["eth_call"] * 4
+
+
+def test_an_exception_reaches_every_caller():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError("reverted")
+
+    async def run():
+        return await asyncio.gather(*(flight.do(("eth_call",), call) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.calls["eth_call"] == 1
+
+
+def test_a_cancelled_caller_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do(("eth_call",), call))
+        second = asyncio.ensure_future(flight.do(("eth_call",), call))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "done"